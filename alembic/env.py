@@ -0,0 +1,56 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from app import models
+from app.archive import is_partition
+from app.database import engine
+
+config = context.config
+
+# Przy wywołaniu z aplikacji (app/migrate.py) logowanie jest już skonfigurowane
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = models.Base.metadata
+
+
+def include_name(name, type_, parent_names) -> bool:
+    """Partycje appointments zakłada app/archive.py - nie ma ich w modelach, autogenerate ich nie rusza."""
+    return not (type_ == "table" and is_partition(name))
+
+
+def run_migrations_offline() -> None:
+    """Generuje SQL bez połączenia z bazą (alembic upgrade head --sql)."""
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    # app/migrate.py przekazuje własne połączenie (z założoną blokadą na czas migracji)
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True,
+                          include_name=include_name)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True,
+                          include_name=include_name)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,59 @@
+"""Indeksy złożone i częściowe pod najczęstsze zapytania terminów i leków
+
+- ix_appointments_free_slots: wolne terminy (is_booked = false, date_time > now() ORDER BY date_time)
+- ix_appointments_patient_date: historia pacjenta (patient_id ORDER BY date_time DESC)
+- uq_appointments_doctor_date: jeden termin lekarza o danej godzinie (zastępuje zapytanie per termin w seedzie)
+- ix_medications_user_active: aktywne leki użytkownika
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 13:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Duplikaty (lekarz, godzina) z czasów bez ograniczenia: usuwamy wolne kopie, zostaje zarezerwowana
+    # lub najstarsza. Dwie zarezerwowane kopie trzeba rozwiązać ręcznie - wtedy indeks unikalny się nie utworzy.
+    op.execute(sa.text("""
+        DELETE FROM appointments
+        WHERE COALESCE(is_booked, false) = false
+          AND EXISTS (
+              SELECT 1 FROM appointments AS twin
+              WHERE twin.doctor_id = appointments.doctor_id
+                AND twin.date_time = appointments.date_time
+                AND twin.id <> appointments.id
+                AND (twin.is_booked = true OR twin.id < appointments.id)
+          )
+    """))
+
+    op.create_index(
+        "ix_appointments_free_slots", "appointments", ["date_time", "id"],
+        postgresql_where=sa.text("is_booked = false"), sqlite_where=sa.text("is_booked = 0")
+    )
+    op.create_index("ix_appointments_patient_date", "appointments", ["patient_id", sa.text("date_time DESC")])
+    op.create_index("uq_appointments_doctor_date", "appointments", ["doctor_id", "date_time"], unique=True)
+    op.create_index(
+        "ix_medications_user_active", "medications", ["user_id"],
+        postgresql_where=sa.text("is_active = true"), sqlite_where=sa.text("is_active = 1")
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_medications_user_active", table_name="medications")
+    op.drop_index("uq_appointments_doctor_date", table_name="appointments")
+    op.drop_index("ix_appointments_patient_date", table_name="appointments")
+    op.drop_index("ix_appointments_free_slots", table_name="appointments")
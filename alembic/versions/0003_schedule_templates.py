@@ -0,0 +1,72 @@
+"""Grafiki lekarzy: szablony tygodniowe, wyjątki i powiązanie lekarza z kontem
+
+- schedule_templates: godziny przyjęć w dniu tygodnia, z których liczone są wolne terminy
+- schedule_exceptions: urlopy i święta (ix_schedule_exceptions_doctor_date - wyjątki lekarza od daty)
+- doctors.user_id: konto lekarza zarządzające grafikiem
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 15:40:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "schedule_templates",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("doctor_id", sa.Integer(), nullable=False),
+        sa.Column("weekday", sa.Integer(), nullable=False),
+        sa.Column("start_time", sa.Time(), nullable=False),
+        sa.Column("end_time", sa.Time(), nullable=False),
+        sa.Column("slot_minutes", sa.Integer(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("valid_from", sa.Date(), nullable=True),
+        sa.Column("valid_to", sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(["doctor_id"], ["doctors.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_schedule_templates_doctor_id", "schedule_templates", ["doctor_id"])
+
+    op.create_table(
+        "schedule_exceptions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("doctor_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("start_time", sa.Time(), nullable=True),
+        sa.Column("end_time", sa.Time(), nullable=True),
+        sa.Column("reason", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["doctor_id"], ["doctors.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_schedule_exceptions_doctor_date", "schedule_exceptions", ["doctor_id", "date"])
+
+    if op.get_bind().dialect.name == "sqlite":
+        # Alembic dodaje klucz obcy osobnym ALTER, którego SQLite nie ma - a przebudowa tabeli (batch)
+        # nie przejdzie przy foreign_keys=ON, bo appointments wskazuje na doctors
+        op.execute(sa.text("ALTER TABLE doctors ADD COLUMN user_id INTEGER REFERENCES users (id)"))
+    else:
+        op.add_column("doctors", sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True))
+    op.create_index("ix_doctors_user_id", "doctors", ["user_id"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_doctors_user_id", table_name="doctors")
+    op.drop_column("doctors", "user_id")
+    op.drop_index("ix_schedule_exceptions_doctor_date", table_name="schedule_exceptions")
+    op.drop_table("schedule_exceptions")
+    op.drop_index("ix_schedule_templates_doctor_id", table_name="schedule_templates")
+    op.drop_table("schedule_templates")
@@ -0,0 +1,126 @@
+"""Partycje appointments po miesiącach (Postgres) i archiwum minionych wizyt
+
+- appointments: tabela partycjonowana RANGE (date_time) - partycje appointments_pRRRR_MM na poprzedni,
+  bieżący i trzy kolejne miesiące oraz appointments_default na resztę. Kolejne partycje zakłada
+  i stare usuwa app/archive.py. Klucz główny partycjonowanej tabeli musi zawierać date_time: (id, date_time).
+- appointments_archive: zarezerwowane wizyty starsze niż APPOINTMENT_HOT_MONTHS (obie bazy)
+
+SQLite nie ma partycji - tam powstaje archiwum, a appointments dostaje AUTOINCREMENT: bez niego SQLite
+nadaje ponownie id usuniętych (zarchiwizowanych) wierszy, a id w appointments i archiwum muszą być rozłączne.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 17:20:00
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, doctor_id, patient_id, date_time, is_booked, notes, type"
+
+
+def _month(year: int, month: int) -> datetime:
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def _create_indexes():
+    op.create_index("ix_appointments_id", "appointments", ["id"])
+    op.create_index(
+        "ix_appointments_free_slots", "appointments", ["date_time", "id"],
+        postgresql_where=sa.text("is_booked = false"),
+    )
+    op.create_index("ix_appointments_patient_date", "appointments", ["patient_id", sa.text("date_time DESC")])
+    op.create_index("uq_appointments_doctor_date", "appointments", ["doctor_id", "date_time"], unique=True)
+
+
+def _replace_appointments(partitioned: bool):
+    """Przepisuje appointments do nowej tabeli (z partycjami albo bez) - id i sekwencja zostają."""
+    bind = op.get_bind()
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence('appointments', 'id')")).scalar()
+    # Sekwencja należąca do kolumny zniknęłaby razem ze starą tabelą
+    op.execute(sa.text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    op.execute(sa.text("ALTER TABLE appointments RENAME TO appointments_old"))
+    op.execute(sa.text("ALTER TABLE appointments_old RENAME CONSTRAINT appointments_pkey TO appointments_old_pkey"))
+    for index in ("ix_appointments_id", "ix_appointments_free_slots", "ix_appointments_patient_date",
+                  "uq_appointments_doctor_date"):
+        op.execute(sa.text(f"DROP INDEX {index}"))
+
+    primary_key = "PRIMARY KEY (id, date_time)" if partitioned else "PRIMARY KEY (id)"
+    op.execute(sa.text(f"""
+        CREATE TABLE appointments (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            doctor_id INTEGER NOT NULL REFERENCES doctors (id),
+            patient_id INTEGER REFERENCES users (id),
+            date_time TIMESTAMP WITH TIME ZONE NOT NULL,
+            is_booked BOOLEAN,
+            notes VARCHAR,
+            type VARCHAR,
+            CONSTRAINT appointments_pkey {primary_key}
+        ){" PARTITION BY RANGE (date_time)" if partitioned else ""}
+    """))
+    if partitioned:
+        now = datetime.now(timezone.utc)
+        for offset in range(-1, 4):
+            start, end = _month(now.year, now.month + offset), _month(now.year, now.month + offset + 1)
+            op.execute(sa.text(
+                f"CREATE TABLE appointments_p{start:%Y_%m} PARTITION OF appointments "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+        op.execute(sa.text("CREATE TABLE appointments_default PARTITION OF appointments DEFAULT"))
+    _create_indexes()
+
+    op.execute(sa.text(f"INSERT INTO appointments ({COLUMNS}) SELECT {COLUMNS} FROM appointments_old"))
+    op.execute(sa.text("DROP TABLE appointments_old"))
+    op.execute(sa.text(f"ALTER SEQUENCE {sequence} OWNED BY appointments.id"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "appointments_archive",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("doctor_id", sa.Integer(), nullable=False),
+        sa.Column("patient_id", sa.Integer(), nullable=True),
+        sa.Column("date_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("is_booked", sa.Boolean(), nullable=True),
+        sa.Column("notes", sa.String(), nullable=True),
+        sa.Column("type", sa.String(), nullable=True),
+        sa.Column("archived_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(["doctor_id"], ["doctors.id"]),
+        sa.ForeignKeyConstraint(["patient_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_appointments_archive_patient_date", "appointments_archive",
+                    ["patient_id", sa.text("date_time DESC")])
+
+    if op.get_bind().dialect.name == "postgresql":
+        _replace_appointments(partitioned=True)
+    else:
+        # Nikt nie wskazuje na appointments, więc przebudowa tabeli przechodzi także przy foreign_keys=ON
+        with op.batch_alter_table("appointments", recreate="always",
+                                  table_kwargs={"sqlite_autoincrement": True}):
+            pass
+        # Indeksy są odtwarzane z odczytanego schematu, który gubi DESC
+        op.drop_index("ix_appointments_patient_date", table_name="appointments")
+        op.create_index("ix_appointments_patient_date", "appointments", ["patient_id", sa.text("date_time DESC")])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        _replace_appointments(partitioned=False)
+    # Wizyty z archiwum wracają do appointments
+    op.execute(sa.text(f"INSERT INTO appointments ({COLUMNS}) SELECT {COLUMNS} FROM appointments_archive"))
+    op.drop_index("ix_appointments_archive_patient_date", table_name="appointments_archive")
+    op.drop_table("appointments_archive")
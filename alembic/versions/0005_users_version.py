@@ -0,0 +1,66 @@
+"""Licznik zmian kont dla pamięci podręcznej użytkowników (app/user_cache.py)
+
+- users_version: jeden wiersz z licznikiem, podbijanym triggerem przy zmianie pól trzymanych w pamięci
+  podręcznej (name, email, account_type, ai_allowed, is_active) i przy usunięciu konta - także gdy
+  zmiana przychodzi spoza aplikacji, np. dezaktywacja konta przez administratora w bazie.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 19:05:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CACHED_COLUMNS = "name, email, account_type, ai_allowed, is_active"
+BUMP = "UPDATE users_version SET version = version + 1 WHERE id = 1"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "users_version",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute(sa.text("INSERT INTO users_version (id, version) VALUES (1, 1)"))
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(sa.text(f"""
+            CREATE FUNCTION bump_users_version() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                {BUMP};
+                RETURN NULL;
+            END $$
+        """))
+        # FOR EACH STATEMENT - jedno podbicie na zapytanie, niezależnie od liczby zmienionych kont
+        op.execute(sa.text(f"CREATE TRIGGER users_version_update AFTER UPDATE OF {CACHED_COLUMNS} ON users "
+                           "FOR EACH STATEMENT EXECUTE FUNCTION bump_users_version()"))
+        op.execute(sa.text("CREATE TRIGGER users_version_delete AFTER DELETE ON users "
+                           "FOR EACH STATEMENT EXECUTE FUNCTION bump_users_version()"))
+    else:
+        op.execute(sa.text(f"CREATE TRIGGER users_version_update AFTER UPDATE OF {CACHED_COLUMNS} ON users "
+                           f"BEGIN {BUMP}; END"))
+        op.execute(sa.text(f"CREATE TRIGGER users_version_delete AFTER DELETE ON users BEGIN {BUMP}; END"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(sa.text("DROP TRIGGER users_version_delete ON users"))
+        op.execute(sa.text("DROP TRIGGER users_version_update ON users"))
+        op.execute(sa.text("DROP FUNCTION bump_users_version()"))
+    else:
+        op.execute(sa.text("DROP TRIGGER users_version_delete"))
+        op.execute(sa.text("DROP TRIGGER users_version_update"))
+    op.drop_table("users_version")
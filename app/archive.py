@@ -0,0 +1,186 @@
+"""Partycje appointments i archiwum minionych wizyt.
+
+W Postgresie appointments jest partycjonowana po miesiącach date_time (migracja 0004): appointments_pRRRR_MM
+i appointments_default na terminy spoza założonych partycji. Wolne terminy (date_time > now()) czytają tylko
+bieżące i przyszłe partycje, historia pacjenta - kilka ostatnich miesięcy i archiwum, a rezerwacja po samym id -
+indeksy wszystkich partycji, których jest niewiele, bo stare są usuwane.
+
+Konserwacja (run_maintenance, w tle co APPOINTMENT_MAINTENANCE_SECONDS albo python -m app.archive z crona):
+- zakłada partycje na APPOINTMENT_PARTITION_MONTHS_AHEAD miesięcy naprzód, co najmniej do horyzontu grafików
+  (app/schedule.py); terminy, które wcześniej trafiły do appointments_default, przenosi do nowej partycji,
+- wizyty sprzed APPOINTMENT_HOT_MONTHS pełnych miesięcy: zarezerwowane kopiuje do appointments_archive,
+  a potem usuwa całe partycje (DROP TABLE zamiast DELETE wiersz po wierszu) - wolne terminy znikają razem z nimi.
+W SQLite nie ma partycji - archiwizacja działa tak samo, przez INSERT ... SELECT i DELETE.
+Historię z obu tabel zwraca jedno zapytanie patient_appointments().
+
+APPOINTMENT_HOT_MONTHS - ile pełnych miesięcy wstecz zostaje w appointments (domyślnie 1)
+APPOINTMENT_PARTITION_MONTHS_AHEAD - na ile miesięcy naprzód zakładać partycje (domyślnie 3)
+APPOINTMENT_MAINTENANCE_SECONDS - co ile sekund uruchamiać konserwację w aplikacji (domyślnie 3600, 0 - tylko ręcznie)
+"""
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import Select, delete, insert, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.orm import aliased, selectinload
+
+from app import metrics, models, schedule
+from app.database import write_engine
+
+logger = logging.getLogger("StuMedica")
+
+APPOINTMENT_HOT_MONTHS = int(os.getenv("APPOINTMENT_HOT_MONTHS", "1"))
+APPOINTMENT_PARTITION_MONTHS_AHEAD = int(os.getenv("APPOINTMENT_PARTITION_MONTHS_AHEAD", "3"))
+APPOINTMENT_MAINTENANCE_SECONDS = float(os.getenv("APPOINTMENT_MAINTENANCE_SECONDS", "3600"))
+
+DEFAULT_PARTITION = "appointments_default"
+_PARTITION_NAME = re.compile(r"^appointments_p(\d{4})_(\d{2})$")
+# Jeden worker naraz zakłada i usuwa partycje (blokada transakcyjna, jak przy migracjach w app/migrate.py)
+MAINTENANCE_LOCK_KEY = 7_320_119
+
+MAINTENANCE_ROWS = metrics.REGISTRY.counter(
+    "stumedica_appointment_maintenance_rows_total",
+    "Wiersze appointments obsłużone przez konserwację (archived - do archiwum, removed - usunięte)", ["action"])
+
+_columns = [column.name for column in models.Appointment.__table__.columns]
+
+
+def is_partition(table_name: str) -> bool:
+    """Partycje appointments - pomijane przy porównaniu schematu z modelami (alembic/env.py)."""
+    return table_name == DEFAULT_PARTITION or bool(_PARTITION_NAME.match(table_name))
+
+
+def month_start(moment: datetime, months: int = 0) -> datetime:
+    """Początek miesiąca (UTC) przesunięty o months miesięcy - granice partycji."""
+    moment = moment.astimezone(timezone.utc)
+    year, month = divmod(moment.year * 12 + moment.month - 1 + months, 12)
+    return datetime(year, month + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"appointments_p{month:%Y_%m}"
+
+
+def patient_appointments(patient_id: int) -> Select:
+    """Wizyty pacjenta z appointments i archiwum (UNION ALL) jako obiekty Appointment z lekarzem, od najnowszej."""
+    hot = models.Appointment.__table__
+    cold = models.ArchivedAppointment.__table__
+    history = aliased(models.Appointment, union_all(
+        select(*(hot.c[name] for name in _columns)).where(hot.c.patient_id == patient_id),
+        select(*(cold.c[name] for name in _columns)).where(cold.c.patient_id == patient_id),
+    ).subquery("history"))
+    # Lekarze drugim zapytaniem (id IN ...) - po indeksie, zamiast łączenia całej tabeli doctors z wynikiem UNION
+    return select(history).options(selectinload(history.doctor)).order_by(history.date_time.desc())
+
+
+@dataclass
+class MaintenanceResult:
+    created: List[str] = field(default_factory=list)  # nowe partycje
+    dropped: List[str] = field(default_factory=list)  # usunięte partycje
+    archived: int = 0  # wizyty przeniesione do archiwum
+    removed: int = 0  # wolne terminy usunięte poza partycjami (appointments_default albo SQLite)
+
+
+async def _partitions(conn: AsyncConnection) -> Optional[List[str]]:
+    """Nazwy partycji appointments, None gdy tabela nie jest partycjonowana."""
+    if conn.dialect.name != "postgresql":
+        return None
+    partitioned = await conn.scalar(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('appointments')"))
+    if not partitioned:
+        return None
+    return list(await conn.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'appointments'::regclass")))
+
+
+async def create_partition(conn: AsyncConnection, month: datetime) -> str:
+    """Partycja na miesiąc month. Terminy z tego miesiąca z appointments_default przechodzą do niej."""
+    name, start, end = partition_name(month), month_start(month), month_start(month, 1)
+    bounds = {"start": start, "end": end}
+    # Partycja domyślna nie może mieć wierszy z zakresu dołączanej partycji - najpierw je przenosimy
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE appointments INCLUDING DEFAULTS)"))
+    await conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date_time >= :start AND date_time < :end "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"), bounds)
+    await conn.execute(text(
+        f"ALTER TABLE appointments ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"))
+    return name
+
+
+async def run_maintenance(now: Optional[datetime] = None) -> MaintenanceResult:
+    """Jedna transakcja: nowe partycje, archiwizacja i usunięcie wizyt sprzed APPOINTMENT_HOT_MONTHS miesięcy."""
+    now = now or datetime.now(timezone.utc)
+    cutoff = month_start(now, -APPOINTMENT_HOT_MONTHS)
+    last_month = max(month_start(now, APPOINTMENT_PARTITION_MONTHS_AHEAD), month_start(schedule.horizon_end(now)))
+    appointments = models.Appointment.__table__
+    result = MaintenanceResult()
+
+    async with write_engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+        partitions = await _partitions(conn)
+
+        if partitions is not None:
+            month = cutoff
+            while month <= last_month:
+                if partition_name(month) not in partitions:
+                    result.created.append(await create_partition(conn, month))
+                month = month_start(month, 1)
+
+        archived = await conn.execute(insert(models.ArchivedAppointment.__table__).from_select(
+            _columns,
+            select(*(appointments.c[name] for name in _columns)).where(
+                appointments.c.date_time < cutoff, appointments.c.is_booked == True  # noqa: E712
+            )
+        ))
+        result.archived = archived.rowcount
+
+        for name in partitions or ():
+            match = _PARTITION_NAME.match(name)
+            if match and datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc) < cutoff:
+                await conn.execute(text(f"DROP TABLE {name}"))
+                result.dropped.append(name)
+
+        # Po usunięciu partycji zostają tylko stare wiersze z appointments_default (w SQLite - wszystkie)
+        removed = await conn.execute(delete(appointments).where(appointments.c.date_time < cutoff))
+        result.removed = removed.rowcount
+
+    MAINTENANCE_ROWS.labels("archived").inc(result.archived)
+    MAINTENANCE_ROWS.labels("removed").inc(result.removed)
+    return result
+
+
+async def run_maintenance_loop():
+    """Zadanie tła: konserwacja przy starcie i co APPOINTMENT_MAINTENANCE_SECONDS."""
+    while True:
+        try:
+            result = await run_maintenance()
+            if result.created or result.dropped or result.archived or result.removed:
+                logger.info("Konserwacja wizyt: nowe partycje %s, usunięte partycje %s, do archiwum: %s, "
+                            "usunięte wiersze: %s", result.created, result.dropped, result.archived, result.removed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Konserwacja wizyt: błąd: %s", e)
+        await asyncio.sleep(APPOINTMENT_MAINTENANCE_SECONDS)
+
+
+async def _main():
+    result = await run_maintenance()
+    await write_engine.dispose()
+    print(f"Nowe partycje: {', '.join(result.created) or '-'}")
+    print(f"Usunięte partycje: {', '.join(result.dropped) or '-'}")
+    print(f"Wizyty przeniesione do archiwum: {result.archived}")
+    print(f"Usunięte wiersze (poza partycjami): {result.removed}")
+
+
+if __name__ == "__main__":
+    # python -m app.archive - np. z crona przy APPOINTMENT_MAINTENANCE_SECONDS=0
+    asyncio.run(_main())
@@ -0,0 +1,412 @@
+"""Indeks wolnych terminów w pamięci procesu - odczyty GET /appointments/slots i find_available_slots bez bazy.
+
+Terminy są trzymane w listach posortowanych po (date_time, id): wszystkie, per specjalizacja i per lekarz.
+Rezerwacja usuwa termin od razu (remove), a okresowa synchronizacja z bazą (reconcile) poprawia rozjazdy,
+np. rezerwacje z innych workerów albo nowe terminy dodane skryptem.
+Rezerwacja zawsze sprawdza dostępność w bazie - nieaktualny indeks może co najwyżej pokazać zajęty termin.
+Terminy z grafików lekarzy (app/schedule.py) są liczone przy każdym wyszukiwaniu - indeks trzyma grafiki
+i zajęte godziny lekarzy z grafikiem, a virtual_slots() dokłada wolne terminy do wyników (także bez indeksu).
+
+AVAILABILITY_INDEX - "true" (domyślnie) / "false" (odczyty zawsze z bazy)
+AVAILABILITY_RECONCILE_SECONDS - co ile sekund przeładować indeks z bazy
+"""
+import asyncio
+import bisect
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import extract, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
+
+from app import metrics
+from app import models
+from app import schedule
+from app.database import AsyncSessionLocal
+
+logger = logging.getLogger("StuMedica")
+
+AVAILABILITY_INDEX = os.getenv("AVAILABILITY_INDEX", "true").lower() == "true"
+AVAILABILITY_RECONCILE_SECONDS = float(os.getenv("AVAILABILITY_RECONCILE_SECONDS", "30"))
+
+INDEX_SIZE = metrics.REGISTRY.gauge(
+    "stumedica_availability_index_slots", "Liczba wolnych terminów w indeksie dostępności")
+INDEX_DRIFT = metrics.REGISTRY.counter(
+    "stumedica_availability_index_drift_total", "Terminy poprawione przez synchronizację z bazą", ("change",))
+
+SlotKey = Tuple[datetime, int]
+TakenKey = Tuple[int, datetime]  # (lekarz, godzina) zajęta przez wiersz w appointments
+
+
+@dataclass(frozen=True)
+class DoctorInfo:
+    id: int
+    name: str
+    specialization: str
+    price_private: float
+
+    @classmethod
+    def from_model(cls, doctor: models.Doctor) -> "DoctorInfo":
+        return cls(doctor.id, doctor.name, doctor.specialization, doctor.price_private)
+
+
+@dataclass(frozen=True)
+class SlotEntry:
+    id: int
+    date_time: datetime
+    doctor: DoctorInfo
+    type: str
+    weekday: int  # dow z bazy: 0 = niedziela, liczone w strefie czasowej sesji - jak filtr SQL
+    hour: int
+
+    @property
+    def key(self) -> SlotKey:
+        return self.date_time, self.id
+
+    def to_response(self) -> dict:
+        return {
+            "id": self.id,
+            "date_time": self.date_time,
+            "doctor": {
+                "id": self.doctor.id,
+                "name": self.doctor.name,
+                "specialization": self.doctor.specialization,
+                "price_private": self.doctor.price_private,
+            },
+            "is_booked": False,
+            "type": self.type,
+            "notes": None,
+        }
+
+
+def _matcher(specialization: Optional[str], date_to: Optional[datetime], price_min: Optional[float],
+             price_max: Optional[float], visit_type: Optional[str], weekdays: Optional[Set[int]],
+             hour_from: Optional[int], hour_to: Optional[int]):
+    def matches(entry: SlotEntry) -> bool:
+        return not (
+            (specialization and entry.doctor.specialization != specialization)
+            or (date_to is not None and entry.date_time >= date_to)
+            or (price_min is not None and entry.doctor.price_private < price_min)
+            or (price_max is not None and entry.doctor.price_private > price_max)
+            or (visit_type and entry.type != visit_type)
+            or (weekdays and entry.weekday not in weekdays)
+            or (hour_from is not None and entry.hour < hour_from)
+            or (hour_to is not None and entry.hour > hour_to)
+        )
+
+    return matches
+
+
+def virtual_slots(slot_schedule: schedule.Schedule, doctors: Dict[int, DoctorInfo], taken: Set[TakenKey], *,
+                  now: datetime, specialization: Optional[str] = None, doctor_id: Optional[int] = None,
+                  date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                  price_min: Optional[float] = None, price_max: Optional[float] = None,
+                  visit_type: Optional[str] = None, weekdays: Optional[Set[int]] = None,
+                  hour_from: Optional[int] = None, hour_to: Optional[int] = None,
+                  first_per_doctor: bool = False, after: Optional[SlotKey] = None,
+                  limit: int = 50) -> List[SlotEntry]:
+    """Wolne terminy z grafików bez godzin zajętych w appointments (taken), z filtrami jak AvailabilityIndex.find.
+
+    Przy first_per_doctor - najbliższy termin każdego lekarza, bez kursora i limitu (dokłada je merge_slots).
+    """
+    matches = _matcher(specialization, date_to, price_min, price_max, visit_type, weekdays, hour_from, hour_to)
+    start = max(now, date_from) if date_from else now
+    if after and not first_per_doctor:
+        start = max(start, after[0])
+    end = min(schedule.horizon_end(now), date_to) if date_to else schedule.horizon_end(now)
+    candidates = [
+        doctors[i] for i in slot_schedule.doctor_ids
+        if i in doctors and (not doctor_id or i == doctor_id)
+        and (not specialization or doctors[i].specialization == specialization)
+    ]
+
+    def doctor_slots(doctor: DoctorInfo):
+        for slot_time, slot_type in slot_schedule.slot_times(doctor.id, start, end):
+            if slot_time <= now or (doctor.id, slot_time) in taken:
+                continue
+            # Dzień tygodnia i godzina w UTC - jak extract() w sesji bazy z domyślną strefą
+            entry = SlotEntry(id=schedule.virtual_slot_id(doctor.id, slot_time), date_time=slot_time, doctor=doctor,
+                              type=slot_type, weekday=slot_time.isoweekday() % 7, hour=slot_time.hour)
+            if matches(entry) and (first_per_doctor or after is None or entry.key > after):
+                yield entry
+
+    if first_per_doctor:
+        return [entry for doctor in candidates for entry in itertools.islice(doctor_slots(doctor), 1)]
+    # Strumienie lekarzy są posortowane - scalanie liczy tylko tyle terminów, ile trzeba do limitu
+    merged = heapq.merge(*(doctor_slots(doctor) for doctor in candidates), key=lambda entry: entry.key)
+    return list(itertools.islice(merged, limit))
+
+
+def merge_slots(stored: list, virtual: List[SlotEntry], *, first_per_doctor: bool = False,
+                after: Optional[SlotKey] = None, limit: int = 50) -> list:
+    """Terminy z tabeli (Appointment albo SlotEntry) i z grafików w jednej liście po (date_time, id).
+
+    Przy first_per_doctor obie listy mają być bez kursora i limitu - zostaje najbliższy termin każdego lekarza.
+    """
+    slots = sorted([*stored, *virtual], key=lambda slot: (slot.date_time, slot.id))
+    if first_per_doctor:
+        seen = set()
+        firsts = []
+        for slot in slots:
+            if slot.doctor.id not in seen:
+                seen.add(slot.doctor.id)
+                firsts.append(slot)
+        slots = [slot for slot in firsts if after is None or (slot.date_time, slot.id) > after]
+    return slots[:limit]
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self.ready = False
+        self._lock = threading.Lock()
+        self._entries: Dict[int, SlotEntry] = {}
+        self._all: List[SlotKey] = []
+        self._by_specialization: Dict[str, List[SlotKey]] = {}
+        self._by_doctor: Dict[int, List[SlotKey]] = {}
+        # Grafiki, lekarze z grafikiem i godziny zajęte w appointments - do terminów z grafików
+        self._schedule = schedule.Schedule([], [])
+        self._doctors: Dict[int, DoctorInfo] = {}
+        self._taken: Set[TakenKey] = set()
+        # Rezerwacje w trakcie przeładowania - nie mogą wrócić z migawki pobranej chwilę wcześniej
+        self._removed_during_load: Optional[Set[int]] = None
+        self._taken_during_load: Optional[Set[TakenKey]] = None
+
+    def load(self, entries: Iterable[SlotEntry], slot_schedule: Optional[schedule.Schedule] = None,
+             doctors: Optional[Dict[int, DoctorInfo]] = None, taken: Iterable[TakenKey] = ()):
+        """Zastępuje zawartość indeksu. Zwraca (dodane, usunięte) względem poprzedniego stanu."""
+        entries_by_id = {entry.id: entry for entry in entries}
+        by_specialization: Dict[str, List[SlotKey]] = {}
+        by_doctor: Dict[int, List[SlotKey]] = {}
+        for entry in sorted(entries_by_id.values(), key=lambda e: e.key):
+            by_specialization.setdefault(entry.doctor.specialization, []).append(entry.key)
+            by_doctor.setdefault(entry.doctor.id, []).append(entry.key)
+
+        with self._lock:
+            for slot_id in self._removed_during_load or ():
+                entry = entries_by_id.pop(slot_id, None)
+                if entry is not None:
+                    by_specialization[entry.doctor.specialization].remove(entry.key)
+                    by_doctor[entry.doctor.id].remove(entry.key)
+            self._removed_during_load = None
+            if slot_schedule is not None:
+                self._schedule = slot_schedule
+                self._doctors = doctors or {}
+                self._taken = set(taken) | (self._taken_during_load or set())
+            self._taken_during_load = None
+
+            added = entries_by_id.keys() - self._entries.keys()
+            removed = self._entries.keys() - entries_by_id.keys()
+            self._entries = entries_by_id
+            self._all = sorted(entry.key for entry in entries_by_id.values())
+            self._by_specialization = by_specialization
+            self._by_doctor = by_doctor
+            self.ready = True
+
+        INDEX_SIZE.labels().set(len(entries_by_id))
+        return len(added), len(removed)
+
+    def begin_load(self):
+        with self._lock:
+            self._removed_during_load = set()
+            self._taken_during_load = set()
+
+    def mark_taken(self, doctor_id: int, date_time: datetime):
+        """Termin z grafiku został zarezerwowany (ma już wiersz w appointments)."""
+        with self._lock:
+            self._taken.add((doctor_id, date_time))
+            if self._taken_during_load is not None:
+                self._taken_during_load.add((doctor_id, date_time))
+
+    def remove(self, slot_id: int):
+        """Termin przestał być wolny (rezerwacja)."""
+        with self._lock:
+            if self._removed_during_load is not None:
+                self._removed_during_load.add(slot_id)
+            entry = self._entries.pop(slot_id, None)
+            if entry is None:
+                return
+            for keys in (self._all, self._by_specialization.get(entry.doctor.specialization),
+                         self._by_doctor.get(entry.doctor.id)):
+                if keys:
+                    i = bisect.bisect_left(keys, entry.key)
+                    if i < len(keys) and keys[i] == entry.key:
+                        del keys[i]
+        INDEX_SIZE.labels().set(len(self._entries))
+
+    def find(self, *, specialization: Optional[str] = None, doctor_id: Optional[int] = None,
+             date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+             price_min: Optional[float] = None, price_max: Optional[float] = None,
+             visit_type: Optional[str] = None, weekdays: Optional[Set[int]] = None,
+             hour_from: Optional[int] = None, hour_to: Optional[int] = None,
+             first_per_doctor: bool = False, after: Optional[SlotKey] = None,
+             limit: int = 50) -> List[SlotEntry]:
+        """Wolne terminy (z tabeli i z grafików) po (date_time, id), z filtrami jak zapytanie SQL w routers/appointments.py."""
+        matches = _matcher(specialization, date_to, price_min, price_max, visit_type, weekdays, hour_from, hour_to)
+        now = datetime.now(timezone.utc)
+
+        with self._lock:
+            if doctor_id:
+                buckets = [self._by_doctor.get(doctor_id, [])]
+            elif first_per_doctor:
+                buckets = list(self._by_doctor.values())
+            elif specialization:
+                buckets = [self._by_specialization.get(specialization, [])]
+            else:
+                buckets = [self._all]
+
+            if first_per_doctor:
+                # Pierwszy pasujący termin każdego lekarza - kursor i limit po połączeniu z grafikami
+                stored = []
+                for keys in buckets:
+                    stored += self._scan(keys, now, date_from, None, matches, 1)
+            else:
+                stored = self._scan(buckets[0], now, date_from, after, matches, limit)
+            slot_schedule, doctors, taken = self._schedule, self._doctors, self._taken
+
+        # Poza blokadą - mark_taken tylko dokłada do zbioru, a load podmienia go na nowy
+        virtual = virtual_slots(
+            slot_schedule, doctors, taken, now=now, specialization=specialization, doctor_id=doctor_id,
+            date_from=date_from, date_to=date_to, price_min=price_min, price_max=price_max, visit_type=visit_type,
+            weekdays=weekdays, hour_from=hour_from, hour_to=hour_to, first_per_doctor=first_per_doctor,
+            after=after, limit=limit
+        )
+        return merge_slots(stored, virtual, first_per_doctor=first_per_doctor, after=after, limit=limit)
+
+    def _scan(self, keys: List[SlotKey], now: datetime, date_from: Optional[datetime],
+              after: Optional[SlotKey], matches, limit: int) -> List[SlotEntry]:
+        # Początek z bisect: date_time > now, date_time >= date_from i (date_time, id) > kursor
+        i = bisect.bisect_right(keys, (now, math.inf))
+        if date_from:
+            i = max(i, bisect.bisect_left(keys, (date_from, -1)))
+        if after:
+            i = max(i, bisect.bisect_right(keys, after))
+
+        result = []
+        while i < len(keys) and len(result) < limit:
+            entry = self._entries[keys[i][1]]
+            if matches(entry):
+                result.append(entry)
+            i += 1
+        return result
+
+
+index = AvailabilityIndex()
+
+
+# Synchronizacja okresowa i po zmianie grafiku (routers/schedule.py) nie mogą się przeplatać
+_reconcile_lock = asyncio.Lock()
+
+
+async def reconcile():
+    """Przeładowuje indeks z bazy i zapisuje, ile terminów się rozjechało."""
+    async with _reconcile_lock:
+        await _reconcile()
+
+
+async def _reconcile():
+    index.begin_load()
+    async with AsyncSessionLocal() as db:
+        doctors = {d.id: DoctorInfo.from_model(d) for d in (await db.scalars(select(models.Doctor))).all()}
+        rows = (await db.execute(
+            select(
+                models.Appointment.id, models.Appointment.doctor_id, models.Appointment.date_time,
+                models.Appointment.type,
+                extract("dow", models.Appointment.date_time), extract("hour", models.Appointment.date_time)
+            ).where(
+                models.Appointment.is_booked == False,
+                models.Appointment.date_time > func.now()
+            )
+        )).all()
+        slot_schedule, taken = await _load_schedules(db)
+
+    entries = [
+        SlotEntry(id=row[0], date_time=row[2], doctor=doctors[row[1]], type=row[3],
+                  weekday=int(row[4]), hour=int(row[5]))
+        for row in rows if row[1] in doctors
+    ]
+    first_load = not index.ready
+    added, removed = index.load(entries, slot_schedule, doctors, taken)
+    if not first_load:
+        INDEX_DRIFT.labels("added").inc(added)
+        INDEX_DRIFT.labels("removed").inc(removed)
+        if added or removed:
+            logger.info("Indeks dostępności: +%s / -%s terminów po synchronizacji", added, removed)
+
+
+async def _load_schedules(db: AsyncSession):
+    """Wszystkie szablony, wyjątki od wczoraj i zajęte godziny lekarzy z grafikiem - do indeksu."""
+    templates = (await db.scalars(select(models.ScheduleTemplate))).all()
+    return await _schedule_with_taken(db, templates, None, None)
+
+
+async def _schedule_with_taken(db: AsyncSession, templates, date_from: Optional[datetime],
+                               date_to: Optional[datetime]) -> Tuple[schedule.Schedule, Set[TakenKey]]:
+    if not templates:
+        return schedule.Schedule([], []), set()
+    doctor_ids = sorted({t.doctor_id for t in templates})
+    now = datetime.now(timezone.utc)
+    # Zajęte godziny do końca horyzontu z zapasem - indeks jest używany do następnej synchronizacji
+    start, end = max(now, date_from) if date_from else now, date_to or schedule.horizon_end(now) + timedelta(days=1)
+    first_day = start.astimezone(schedule.CLINIC_TIMEZONE).date() - timedelta(days=1)
+    exceptions = (await db.scalars(select(models.ScheduleException).where(
+        models.ScheduleException.doctor_id.in_(doctor_ids), models.ScheduleException.date >= first_day
+    ))).all()
+    taken = (await db.execute(select(models.Appointment.doctor_id, models.Appointment.date_time).where(
+        models.Appointment.doctor_id.in_(doctor_ids),
+        models.Appointment.date_time >= start,
+        models.Appointment.date_time < end
+    ))).all()
+    return schedule.Schedule(templates, exceptions), {(doctor_id, date_time) for doctor_id, date_time in taken}
+
+
+async def find_virtual_slots(db: AsyncSession, *, specialization: Optional[str] = None,
+                             doctor_id: Optional[int] = None, date_from: Optional[datetime] = None,
+                             date_to: Optional[datetime] = None, price_min: Optional[float] = None,
+                             price_max: Optional[float] = None, visit_type: Optional[str] = None,
+                             weekdays: Optional[Set[int]] = None, hour_from: Optional[int] = None,
+                             hour_to: Optional[int] = None, first_per_doctor: bool = False,
+                             after: Optional[SlotKey] = None, limit: int = 50) -> List[SlotEntry]:
+    """Terminy z grafików prosto z bazy (bez indeksu): szablony pasujących lekarzy, ich wyjątki i zajęte godziny.
+
+    Bez szablonów to jedno zapytanie, z szablonami - trzy, niezależnie od liczby lekarzy i terminów.
+    """
+    query = select(models.ScheduleTemplate).join(models.ScheduleTemplate.doctor).options(
+        contains_eager(models.ScheduleTemplate.doctor)
+    )
+    if doctor_id:
+        query = query.where(models.ScheduleTemplate.doctor_id == doctor_id)
+    if specialization:
+        query = query.where(models.Doctor.specialization == specialization)
+    if price_min is not None:
+        query = query.where(models.Doctor.price_private >= price_min)
+    if price_max is not None:
+        query = query.where(models.Doctor.price_private <= price_max)
+    templates = (await db.scalars(query)).unique().all()
+
+    slot_schedule, taken = await _schedule_with_taken(db, templates, date_from, date_to)
+    doctors = {t.doctor.id: DoctorInfo.from_model(t.doctor) for t in templates}
+    return virtual_slots(
+        slot_schedule, doctors, taken, now=datetime.now(timezone.utc), specialization=specialization,
+        doctor_id=doctor_id, date_from=date_from, date_to=date_to, price_min=price_min, price_max=price_max,
+        visit_type=visit_type, weekdays=weekdays, hour_from=hour_from, hour_to=hour_to,
+        first_per_doctor=first_per_doctor, after=after, limit=limit
+    )
+
+
+async def run_reconciler():
+    """Zadanie tła: pierwsze wczytanie i okresowa synchronizacja z bazą."""
+    while True:
+        try:
+            await reconcile()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Indeks dostępności: błąd synchronizacji z bazą: %s", e)
+        await asyncio.sleep(AVAILABILITY_RECONCILE_SECONDS)
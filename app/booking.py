@@ -0,0 +1,102 @@
+"""Rezerwacja terminu jednym warunkowym UPDATE ... RETURNING - wspólna dla endpointu i asystenta.
+
+Warunek is_booked = false jest sprawdzany w tym samym poleceniu, które ustawia rezerwację,
+więc z dwóch równoczesnych prób wygrywa dokładnie jedna - bez SELECT ... FOR UPDATE i bez blokowania
+wiersza na czas całej transakcji. Przegrana próba dostaje BookingStatus.CONFLICT.
+Termin z grafiku (ujemne id, app/schedule.py) nie ma jeszcze wiersza - rezerwacja to INSERT ... ON CONFLICT
+DO NOTHING, a o zwycięzcy decyduje indeks unikalny (doctor_id, date_time).
+"""
+import enum
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app import availability, metrics, models, schedule
+from app.database import async_engine
+
+_insert = postgresql.insert if async_engine.dialect.name == "postgresql" else sqlite.insert
+
+BOOKING_ATTEMPTS = metrics.REGISTRY.counter(
+    "stumedica_booking_attempts_total", "Próby rezerwacji terminu wg wyniku", ("result",))
+
+
+class BookingStatus(str, enum.Enum):
+    BOOKED = "booked"
+    CONFLICT = "conflict"  # termin istnieje, ale ktoś go już zarezerwował
+    NOT_FOUND = "not_found"
+
+
+@dataclass
+class BookingResult:
+    status: BookingStatus
+    appointment: Optional[models.Appointment] = None  # z wczytanym lekarzem, tylko dla BOOKED
+
+    @property
+    def booked(self) -> bool:
+        return self.status is BookingStatus.BOOKED
+
+
+async def book_slot(db: AsyncSession, appointment_id: int, patient_id: int,
+                    notes: Optional[str]) -> BookingResult:
+    """Rezerwuje termin i zatwierdza transakcję. Przy konflikcie niczego nie zmienia."""
+    if appointment_id < 0:
+        return await _book_schedule_slot(db, appointment_id, patient_id, notes)
+
+    appointment = await db.scalar(
+        update(models.Appointment)
+        .where(models.Appointment.id == appointment_id, models.Appointment.is_booked == False)
+        .values(is_booked=True, patient_id=patient_id, notes=notes)
+        .returning(models.Appointment)
+        .options(selectinload(models.Appointment.doctor))
+        .execution_options(synchronize_session=False)
+    )
+
+    if appointment is None:
+        await db.rollback()
+        exists = await db.scalar(select(models.Appointment.id).where(models.Appointment.id == appointment_id))
+        status = BookingStatus.CONFLICT if exists is not None else BookingStatus.NOT_FOUND
+        BOOKING_ATTEMPTS.labels(status.value).inc()
+        return BookingResult(status)
+
+    await db.commit()
+    availability.index.remove(appointment.id)
+    BOOKING_ATTEMPTS.labels(BookingStatus.BOOKED.value).inc()
+    return BookingResult(BookingStatus.BOOKED, appointment)
+
+
+async def _book_schedule_slot(db: AsyncSession, slot_id: int, patient_id: int, notes: Optional[str]) -> BookingResult:
+    decoded = schedule.decode_virtual_slot_id(slot_id)
+    now = datetime.now(timezone.utc)
+    slot_type = None
+    if decoded is not None and now < decoded[1] <= schedule.horizon_end(now):
+        doctor_id, date_time = decoded
+        day = date_time.astimezone(schedule.CLINIC_TIMEZONE).date()
+        slot_type = (await schedule.load_doctor_schedule(db, doctor_id, day)).slot_type(doctor_id, date_time)
+    if slot_type is None:
+        BOOKING_ATTEMPTS.labels(BookingStatus.NOT_FOUND.value).inc()
+        return BookingResult(BookingStatus.NOT_FOUND)
+
+    appointment = await db.scalar(
+        _insert(models.Appointment)
+        .values(doctor_id=doctor_id, date_time=date_time, is_booked=True, patient_id=patient_id, notes=notes,
+                type=slot_type)
+        .on_conflict_do_nothing(index_elements=["doctor_id", "date_time"])
+        .returning(models.Appointment)
+        .options(selectinload(models.Appointment.doctor))
+    )
+
+    if appointment is None:
+        # Godzina ma już wiersz - zarezerwowana przez kogoś innego (albo wolny termin z tabeli o tej samej godzinie)
+        await db.rollback()
+        BOOKING_ATTEMPTS.labels(BookingStatus.CONFLICT.value).inc()
+        return BookingResult(BookingStatus.CONFLICT)
+
+    await db.commit()
+    availability.index.mark_taken(doctor_id, date_time)
+    BOOKING_ATTEMPTS.labels(BookingStatus.BOOKED.value).inc()
+    return BookingResult(BookingStatus.BOOKED, appointment)
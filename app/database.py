@@ -1,30 +1,118 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
+from app import db_pool
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("Brak zmiennej DATABASE_URL w .env")
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    connect_args={
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# WAL - czytelnicy nie czekają na zapis; synchronous=NORMAL jest w WAL bezpieczne (bez fsync przy każdym commit);
+# busy_timeout - zapisy czekają na jedynego pisarza zamiast od razu kończyć się "database is locked"
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+    f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def _sync_connect_args(url) -> dict:
+    if url.get_backend_name() == "sqlite":
+        # Połączenia z puli są używane w różnych wątkach puli FastAPI i skryptów
+        return {"check_same_thread": False}
+    return {
         "connect_timeout": 15,
         "keepalives": 1,
         "keepalives_idle": 30,
         "keepalives_interval": 10,
         "keepalives_count": 5
     }
+
+
+def _apply_sqlite_pragmas(engine):
+    """Ustawienia SQLite dla każdego nowego połączenia (dla AsyncEngine przekaż async_engine.sync_engine)."""
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+_sync_url, _sync_options = db_pool.engine_options(
+    make_url(DATABASE_URL), "primary_sync", connect_args=_sync_connect_args(make_url(DATABASE_URL)), is_async=False
 )
+engine = create_engine(_sync_url, **_sync_options)
+db_pool.instrument_pool(engine, "primary_sync")
 
+# Silnik synchroniczny - skrypty (app/seed.py) i migracje przy starcie
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str):
+    """Ten sam adres bazy z asynchronicznym sterownikiem (psycopg2 -> asyncpg)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Brak asynchronicznego sterownika dla bazy: {backend}")
+
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if backend == "postgresql" and "sslmode" in url.query:
+        # asyncpg nie rozumie sslmode z libpq - odpowiednikiem jest parametr ssl
+        query = dict(url.query)
+        query["ssl"] = query.pop("sslmode")
+        url = url.set(query=query)
+    return url
+
+
+# Silnik asynchroniczny - wszystkie endpointy API (nie blokuje puli wątków na czas zapytania)
+_async_url, _async_options = db_pool.engine_options(
+    to_async_url(DATABASE_URL),
+    "primary",
+    connect_args={"timeout": 15} if make_url(DATABASE_URL).get_backend_name() == "postgresql" else {},
+    is_async=True
+)
+async_engine = create_async_engine(_async_url, **_async_options)
+db_pool.instrument_pool(async_engine.sync_engine, "primary")
+
+# Silnik dla zapisów sesji z routingiem (app/replicas.py). W Postgresie to ten sam silnik.
+# SQLite ma jednego pisarza naraz: zapisy idą przez osobną pulę z jednym połączeniem i czekają w jej kolejce,
+# zamiast odpytywać blokadę bazy (busy_timeout) z kilku połączeń naraz. Odczyty zostają w zwykłej puli (WAL).
+write_engine = async_engine
+
+if engine.dialect.name == "sqlite":
+    _write_url, _write_options = db_pool.engine_options(
+        to_async_url(DATABASE_URL), "primary_writer", connect_args={}, is_async=True)
+    write_engine = create_async_engine(_write_url, **{**_write_options, "pool_size": 1, "max_overflow": 0})
+    db_pool.instrument_pool(write_engine.sync_engine, "primary_writer")
+
+    for sqlite_engine in (engine, async_engine.sync_engine, write_engine.sync_engine):
+        _apply_sqlite_pragmas(sqlite_engine)
+
+# expire_on_commit=False - po commit obiekty zostają wczytane (w trybie async nie ma leniwego doczytywania)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -32,4 +120,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
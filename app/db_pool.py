@@ -0,0 +1,186 @@
+"""Ustawienia i metryki puli połączeń do bazy - wspólne dla silnika synchronicznego, async i replik.
+
+DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE - jak w create_engine (domyślnie 5 / 10 / 30 s / 300 s)
+DB_POOL_LIFO - "true": pobierane jest ostatnio oddane połączenie, więc nadmiarowe szybciej się starzeją i zamykają
+DB_POOL_PRE_PING - sprawdzanie połączenia przy pobraniu z puli:
+    always - zawsze (dodatkowe zapytanie przy każdym pobraniu, dotychczasowe zachowanie),
+    idle   - tylko gdy połączenie leżało w puli dłużej niż DB_POOL_PRE_PING_IDLE_SECONDS,
+    off    - nigdy (zerwane połączenie kończy błędem pierwsze zapytanie i jest wyrzucane z puli)
+SQLITE_POOL_SIZE, SQLITE_MAX_OVERFLOW - pula czytelników SQLite (domyślnie 2 / 2): bez pre-ping i recycle, LIFO.
+    Każde połączenie aiosqlite to osobny wątek - więcej czytelników niż rdzeni zwiększa tylko przełączanie wątków.
+DB_PGBOUNCER - "true": baza za PgBouncerem w trybie transakcji - bez własnej puli (NullPool, pula jest w PgBouncerze)
+    i bez nazwanych prepared statements asyncpg, których PgBouncer nie przenosi między połączeniami.
+"""
+import logging
+import os
+import time
+import uuid
+from typing import Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from app import metrics
+
+logger = logging.getLogger("StuMedica")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+DB_POOL_LIFO = os.getenv("DB_POOL_LIFO", "false").lower() == "true"
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "always").lower()
+DB_POOL_PRE_PING_IDLE_SECONDS = float(os.getenv("DB_POOL_PRE_PING_IDLE_SECONDS", "30"))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "2"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "2"))
+
+if DB_POOL_PRE_PING not in ("always", "idle", "off"):
+    raise ValueError(f"Nieznana wartość DB_POOL_PRE_PING: {DB_POOL_PRE_PING} (always / idle / off)")
+
+# Pobranie wolnego połączenia trwa mikrosekundy - domyślne kubełki (od 5 ms) pokazałyby tylko oczekiwanie
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CHECKOUT_SECONDS = metrics.REGISTRY.histogram(
+    "stumedica_db_pool_checkout_seconds", "Czas pobrania połączenia z puli (z oczekiwaniem i nawiązaniem)",
+    ("engine",), buckets=CHECKOUT_BUCKETS)
+POOL_WAITS = metrics.REGISTRY.counter(
+    "stumedica_db_pool_waits_total", "Pobrania połączenia przy wyczerpanej puli (trzeba czekać na zwrot)", ("engine",))
+POOL_TIMEOUTS = metrics.REGISTRY.counter(
+    "stumedica_db_pool_timeouts_total", "Pobrania połączenia przerwane po DB_POOL_TIMEOUT", ("engine",))
+POOL_CONNECTIONS = metrics.REGISTRY.gauge(
+    "stumedica_db_pool_connections", "Połączenia w puli wg stanu (checked_out / idle / overflow)", ("engine", "state"))
+POOL_CONNECTS = metrics.REGISTRY.counter(
+    "stumedica_db_pool_connects_total", "Nowe połączenia nawiązane przez pulę", ("engine",))
+POOL_INVALIDATIONS = metrics.REGISTRY.counter(
+    "stumedica_db_pool_invalidations_total", "Połączenia unieważnione (hard - zamknięte od razu, soft - przy zwrocie)",
+    ("engine", "kind"))
+POOL_PINGS = metrics.REGISTRY.counter(
+    "stumedica_db_pool_pings_total", "Sprawdzenia bezczynnych połączeń (DB_POOL_PRE_PING=idle)", ("engine", "result"))
+
+
+class _InstrumentedPool:
+    """Domieszka do klasy puli: mierzy czas pobrania połączenia i liczy oczekiwania na wyczerpanej puli."""
+
+    engine_name = "primary"
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.max_overflow_limit = kw.get("max_overflow", 10)
+
+    def connect(self):
+        waiting = (isinstance(self, QueuePool) and self.checkedin() == 0
+                   and self.checkedout() >= self.size() + self.max_overflow_limit)
+        if waiting:
+            POOL_WAITS.labels(self.engine_name).inc()
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.labels(self.engine_name).inc()
+            logger.warning("Pula połączeń %s wyczerpana - brak wolnego połączenia po %ss",
+                           self.engine_name, DB_POOL_TIMEOUT)
+            raise
+        finally:
+            CHECKOUT_SECONDS.labels(self.engine_name).observe(time.perf_counter() - start)
+
+
+def _pool_class(base, name: str):
+    # recreate() (np. po dispose) tworzy pulę z self.__class__, więc nazwa silnika zostaje
+    return type(f"Instrumented{base.__name__}", (_InstrumentedPool, base), {"engine_name": name})
+
+
+def engine_options(url: URL, name: str, connect_args: dict, is_async: bool) -> Tuple[URL, dict]:
+    """Adres i argumenty create_engine / create_async_engine według ustawień DB_POOL_* i DB_PGBOUNCER."""
+    if url.get_backend_name() == "sqlite":
+        return url, _sqlite_options(url, name, connect_args, is_async)
+
+    if DB_PGBOUNCER:
+        if is_async and url.get_backend_name() == "postgresql":
+            url = url.update_query_dict({"prepared_statement_cache_size": "0"})
+            connect_args = {
+                **connect_args,
+                "statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        return url, {"poolclass": _pool_class(NullPool, name), "connect_args": connect_args}
+
+    return url, {
+        "poolclass": _pool_class(AsyncAdaptedQueuePool if is_async else QueuePool, name),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_use_lifo": DB_POOL_LIFO,
+        "pool_pre_ping": DB_POOL_PRE_PING == "always",
+        "connect_args": connect_args,
+    }
+
+
+def _sqlite_options(url: URL, name: str, connect_args: dict, is_async: bool) -> dict:
+    if url.database in (None, "", ":memory:"):
+        # Silnik synchroniczny (migracje) i async dostałyby dwie osobne, puste bazy
+        raise ValueError("Baza SQLite w pamięci nie jest obsługiwana - podaj plik, np. sqlite:////tmp/stumedica.sqlite")
+    # Plik lokalny: połączenie się nie zrywa (bez pre-ping i recycle). W WAL czytelnicy działają równolegle,
+    # a zapisy i tak ustawiają się w kolejce do jednego pisarza (busy_timeout w app/database.py).
+    # LIFO - w użyciu są głównie te same połączenia, z rozgrzaną pamięcią podręczną stron (cache_size)
+    return {
+        "poolclass": _pool_class(AsyncAdaptedQueuePool if is_async else QueuePool, name),
+        "pool_size": SQLITE_POOL_SIZE,
+        "max_overflow": SQLITE_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_use_lifo": True,
+        "connect_args": connect_args,
+    }
+
+
+def instrument_pool(engine, name: str):
+    """Metryki zdarzeń puli i sprawdzanie bezczynnych połączeń (dla AsyncEngine przekaż async_engine.sync_engine)."""
+
+    def update_gauges(returning: bool = False):
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            return
+        checked_out, idle, overflow = pool.checkedout(), pool.checkedin(), pool.overflow()
+        if returning:
+            # Zdarzenie checkin przychodzi przed odłożeniem połączenia: trafi do puli albo (pełna) zostanie zamknięte
+            checked_out -= 1
+            if idle < pool.size():
+                idle += 1
+            else:
+                overflow -= 1
+        POOL_CONNECTIONS.labels(name, "checked_out").set(checked_out)
+        POOL_CONNECTIONS.labels(name, "idle").set(idle)
+        POOL_CONNECTIONS.labels(name, "overflow").set(max(overflow, 0))
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        POOL_CONNECTS.labels(name).inc()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.pop("checked_in_at", None)
+        if (DB_POOL_PRE_PING == "idle" and checked_in_at is not None
+                and time.monotonic() - checked_in_at > DB_POOL_PRE_PING_IDLE_SECONDS):
+            try:
+                engine.dialect.do_ping(dbapi_connection)
+            except Exception:
+                POOL_PINGS.labels(name, "failed").inc()
+                # Pula unieważnia połączenie i pobiera kolejne
+                raise exc.DisconnectionError()
+            POOL_PINGS.labels(name, "ok").inc()
+        update_gauges()
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+        update_gauges(returning=True)
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        POOL_INVALIDATIONS.labels(name, "hard").inc()
+
+    @event.listens_for(engine, "soft_invalidate")
+    def _on_soft_invalidate(dbapi_connection, connection_record, exception):
+        POOL_INVALIDATIONS.labels(name, "soft").inc()
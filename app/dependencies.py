@@ -2,11 +2,14 @@ from fastapi import Request, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer
 from typing import Optional
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
 from app import models
+from app import replicas
 from app import security
+from app import tracing
+from app import user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
@@ -28,7 +31,19 @@ async def get_token(
 
 async def get_current_user(
         token: str = Depends(get_token),
-        db: Session = Depends(get_db)):
+        db: AsyncSession = Depends(replicas.get_routed_db)) -> user_cache.UserSnapshot:
+    """Konto z tokenu jako UserSnapshot - z pamięci podręcznej (app/user_cache.py), a przy chybieniu z bazy."""
+    user = user_cache.cache.get(token)
+    if user is None:
+        user = await _load_user(token, db)
+
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Konto jest nieaktywne")
+
+    tracing.user_id_var.set(user.id)
+    return user
+
+async def _load_user(token: str, db: AsyncSession) -> user_cache.UserSnapshot:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Nie można zweryfikować poświadczeń",
@@ -42,9 +57,40 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(models.User.email == email).first()
+    # Zapamiętana przed odczytem - unieważnienie w trakcie zapytania odrzuca ten wpis
+    generation = user_cache.cache.generation
+    user = user_cache.snapshot_from_claims(payload)
+    if user is not None:
+        user_cache.cache.put(token, user, payload.get("exp"), generation)
+        return user
 
-    if user is None:
+    query = select(*user_cache.SNAPSHOT_COLUMNS).where(models.User.email == email)
+    row = (await db.execute(query)).first()
+    if row is None and replicas.used_replica(db):
+        # Konto założone przed chwilą mogło jeszcze nie dotrzeć na replikę
+        replicas.use_primary(db)
+        row = (await db.execute(query)).first()
+
+    if row is None:
         raise credentials_exception
 
-    return user
\ No newline at end of file
+    user = user_cache.snapshot_from_row(row)
+    user_cache.cache.put(token, user, payload.get("exp"), generation)
+    return user
+
+async def get_current_user_id(current_user: user_cache.UserSnapshot = Depends(get_current_user)) -> int:
+    """Dla endpointów, którym wystarczy id zalogowanego konta."""
+    return current_user.id
+
+async def get_current_doctor(
+        db: AsyncSession = Depends(replicas.get_routed_db),
+        current_user: user_cache.UserSnapshot = Depends(get_current_user)) -> models.Doctor:
+    """Profil lekarza powiązany z kontem lekarza (doctors.user_id ustawia administrator w bazie)."""
+    if current_user.account_type != "doctor":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Grafikiem zarządzają tylko konta lekarzy")
+
+    doctor = await db.scalar(select(models.Doctor).where(models.Doctor.user_id == current_user.id))
+    if doctor is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Konto lekarza nie jest powiązane z profilem lekarza")
+    return doctor
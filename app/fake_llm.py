@@ -0,0 +1,193 @@
+"""Deterministyczna atrapa LLM i embeddingów do testów wydajności bez klucza API i sieci.
+
+Włączenie: LLM_PROVIDER=fake. Konfiguracja (zmienne środowiskowe):
+- FAKE_LLM_SEED - ziarno losowości (te same wejścia + ziarno = te same odpowiedzi i opóźnienia). Losowanie
+  zależy od wejścia i od tego, który raz pada to samo wejście - nie od kolejności innych wywołań, więc
+  przebieg jest powtarzalny także przy współbieżnych zapytaniach i po rozgrzewce RAG
+- FAKE_LLM_LATENCY - rozkład opóźnienia jednego "wywołania modelu", np. "fixed:0.5",
+  "uniform:0.2:1.5", "normal:0.8:0.2", "lognormal:-0.5:0.6" (parametry ln), "none"
+- FAKE_EMBED_LATENCY - jak wyżej, dla embeddingów (na jedno wywołanie)
+- FAKE_LLM_TOKEN_DELAY - opóźnienie między kawałkami przy strumieniowaniu (s)
+- FAKE_LLM_FAILURE_RATE - ułamek wywołań kończących się LLMProviderError
+- FAKE_LLM_TIMEOUT_RATE, FAKE_LLM_TIMEOUT_SECONDS - ułamek wywołań, które "wiszą" podany czas
+"""
+import hashlib
+import os
+import random
+import re
+import threading
+from collections import Counter
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.llm import EmbeddingProvider, LLMProvider, LLMProviderError
+
+EMBEDDING_DIM = 256
+
+SPECIALIZATION_STEMS = {
+    "kardiolog": "Kardiolog",
+    "internist": "Internista",
+    "stomatolog": "Stomatolog",
+    "dentyst": "Stomatolog",
+    "dermatolog": "Dermatolog",
+    "okulist": "Okulista",
+}
+
+
+class LatencyModel:
+    def __init__(self, spec: str):
+        parts = (spec or "none").split(":")
+        self.kind = parts[0].lower()
+        self.params = [float(p) for p in parts[1:]]
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(p[0], p[1])
+        else:
+            value = 0.0
+        return max(0.0, value)
+
+
+def _stable_seed(*parts) -> int:
+    digest = hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def _extract_user_query(message: str) -> str:
+    match = re.search(r"<user_query>\s*(.*?)\s*</user_query>", message, re.S)
+    return match.group(1) if match else message
+
+
+class FakeProvider(LLMProvider, EmbeddingProvider):
+    name = "fake"
+
+    def __init__(self, seed: int = 0, latency: str = "none", embed_latency: str = "none",
+                 token_delay: float = 0.0, failure_rate: float = 0.0,
+                 timeout_rate: float = 0.0, timeout_seconds: float = 30.0, model: str = "fake-llm"):
+        LLMProvider.__init__(self, model)
+        EmbeddingProvider.__init__(self, "fake-embedding")
+        self.seed = seed
+        self.latency = LatencyModel(latency)
+        self.embed_latency = LatencyModel(embed_latency)
+        self.token_delay = token_delay
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self._occurrences: Counter = Counter()
+        self._occurrences_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FakeProvider":
+        return cls(
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+            latency=os.getenv("FAKE_LLM_LATENCY", "none"),
+            embed_latency=os.getenv("FAKE_EMBED_LATENCY", "none"),
+            token_delay=float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0")),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+            timeout_rate=float(os.getenv("FAKE_LLM_TIMEOUT_RATE", "0")),
+            timeout_seconds=float(os.getenv("FAKE_LLM_TIMEOUT_SECONDS", "30")),
+        )
+
+    def _rng(self, *parts) -> random.Random:
+        # Numer wystąpienia tego samego wejścia w ziarnie - powtórzone pytanie losuje nowe opóźnienie,
+        # a wywołania z innymi wejściami (inne wątki, embeddingi) nie przesuwają losowania
+        key = _stable_seed(self.seed, *parts)
+        with self._occurrences_lock:
+            self._occurrences[key] += 1
+            occurrence = self._occurrences[key]
+        return random.Random(_stable_seed(key, occurrence))
+
+    def _simulate_call(self, rng: random.Random, latency: LatencyModel):
+        roll = rng.random()
+        if roll < self.failure_rate:
+            time.sleep(latency.sample(rng))
+            raise LLMProviderError("FakeProvider: symulowany błąd dostawcy")
+        if roll < self.failure_rate + self.timeout_rate:
+            time.sleep(self.timeout_seconds)
+            raise LLMProviderError("FakeProvider: symulowany timeout dostawcy")
+        time.sleep(latency.sample(rng))
+
+    # --- Generowanie ---
+
+    def _plan_tool_call(self, query: str, tools: Dict[str, Callable]) -> Optional[Tuple[str, dict]]:
+        """Prosty router słów kluczowych naśladujący wybór funkcji przez model."""
+        q = query.lower()
+
+        if "add_medication" in tools and re.search(r"\bdodaj\b", q) and "lek" in q:
+            match = re.search(r"lek\w*\s+(\S+)(?:,?\s*dawk\w*\s+(.+))?", query, re.I)
+            name = match.group(1).strip(" ,.") if match else "Lek"
+            dose = (match.group(2) or "1 tabletka").strip(" .") if match else "1 tabletka"
+            return "add_medication", {"nazwa_leku": name, "dawka": dose}
+
+        if "search_knowledge_base" in tools and re.search(r"(ile kosztuje|koszt|cen[aęy]|cennik)", q):
+            return "search_knowledge_base", {"pytanie": query}
+
+        if "book_appointment_by_id" in tools and re.search(r"(zarezerwuj|umów|umow|rezerw)", q):
+            match = re.search(r"(?:id|nr|numer)\D{0,3}(\d+)", q)
+            if match:
+                return "book_appointment_by_id", {"wizyta_id": int(match.group(1)), "powod": "Konsultacja"}
+
+        if "find_available_slots" in tools and re.search(r"(termin|wizyt|umów|umow)", q):
+            for stem, spec in SPECIALIZATION_STEMS.items():
+                if stem in q:
+                    return "find_available_slots", {"specjalizacja": spec}
+
+        if "get_my_appointments_history" in tools and re.search(r"(histori|moje wizyty|nadchodz)", q):
+            return "get_my_appointments_history", {}
+
+        if "get_my_medications" in tools and "lek" in q and re.search(r"(moje|jakie|lista|przyjmuj)", q):
+            return "get_my_medications", {}
+
+        if "search_knowledge_base" in tools and re.search(r"(jak |kontakt|adres|gdzie|telefon)", q):
+            return "search_knowledge_base", {"pytanie": query}
+
+        return None
+
+    def _chat(self, message, history, system_instruction, tools):
+        rng = self._rng("chat", message, len(history))
+        query = _extract_user_query(message)
+        self._simulate_call(rng, self.latency)
+
+        tool_map = {t.__name__: t for t in (tools or [])}
+        planned = self._plan_tool_call(query, tool_map)
+        if planned is None:
+            return f"[fake] Odpowiedź na: {query[:200]}"
+
+        name, args = planned
+        result = tool_map[name](**args)
+        # Drugie "wywołanie modelu" - podsumowanie wyniku narzędzia, jak w automatic function calling
+        self._simulate_call(rng, self.latency)
+        return str(result)
+
+    def _stream(self, message, history, system_instruction):
+        rng = self._rng("stream", message, len(history))
+        self._simulate_call(rng, self.latency)
+        words = f"[fake] Odpowiedź na: {_extract_user_query(message)[:200]}".split(" ")
+        for i, word in enumerate(words):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
+
+    # --- Embeddingi ---
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        self._simulate_call(self._rng("embed", *texts), self.embed_latency)
+
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype="float32")
+        for row, text in enumerate(texts):
+            # Haszowany worek słów - podobne teksty dają bliskie wektory, więc wyniki FAISS mają sens
+            for token in re.findall(r"\w+", text.lower()):
+                vectors[row, _stable_seed(token) % EMBEDDING_DIM] += 1.0
+            norm = np.linalg.norm(vectors[row])
+            if norm:
+                vectors[row] /= norm
+        return vectors
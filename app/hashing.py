@@ -0,0 +1,99 @@
+"""Hashowanie haseł (Argon2) we własnej, ograniczonej puli wątków.
+
+Hasz z security.pwd_context zajmuje na czas liczenia ARGON2_MEMORY_COST KiB pamięci (domyślnie 64 MiB).
+Liczony we wspólnej puli run_in_threadpool (40 wątków) pozwalał fali logowań zająć gigabajty RAM i wszystkie
+wątki endpointów synchronicznych. Tutaj liczy najwyżej HASH_WORKERS wątków (argon2-cffi zwalnia GIL, więc
+liczą równolegle), na wolny wątek czeka najwyżej HASH_QUEUE_LIMIT zadań, a kolejne od razu dostają 503
+z Retry-After - pamięć hashowania jest ograniczona do HASH_WORKERS × ARGON2_MEMORY_COST.
+
+Logowanie na nieistniejący e-mail weryfikuje hasło z haszem-atrapą o tych samych parametrach - odpowiedź trwa
+tyle samo co przy złym haśle, więc czas nie zdradza, które konta istnieją. Atrapę liczy raz start aplikacji
+(prepare_dummy_hash w fazie background, app/startup.py), więc pierwsze takie logowanie nie trwa dłużej od
+kolejnych. Hasze o innych parametrach niż obecne są przeliczane przy udanym logowaniu (verify_password zwraca
+nowy hasz).
+
+HASH_WORKERS - liczba wątków liczących hasze (domyślnie liczba procesorów)
+HASH_QUEUE_LIMIT - ile haszy może czekać na wolny wątek (domyślnie 4 × HASH_WORKERS, 0 - bez kolejki)
+"""
+import asyncio
+import os
+import secrets
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app import metrics, security
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", str(4 * HASH_WORKERS)))
+
+PENDING = metrics.REGISTRY.gauge(
+    "stumedica_password_hashing_pending", "Hasze haseł liczone i czekające w kolejce")
+REJECTED = metrics.REGISTRY.counter(
+    "stumedica_password_hashing_rejected_total", "Żądania odrzucone (503) przy pełnej kolejce hashowania")
+REHASHED = metrics.REGISTRY.counter(
+    "stumedica_password_rehashed_total", "Hasze przeliczone na obecne parametry Argon2 przy logowaniu")
+
+
+class HashingPool:
+    def __init__(self, workers: int, queue_limit: int):
+        self.capacity = workers + queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hashing")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+            PENDING.set(self._pending)
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.capacity:
+                REJECTED.inc()
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Serwer jest obecnie przeciążony. Spróbuj ponownie za chwilę.",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+            PENDING.set(self._pending)
+        future = self._executor.submit(fn, *args)
+        # Miejsce zwalnia koniec liczenia, a nie żądania - rozłączony klient nie przerywa już zajętego wątku
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+
+pool = HashingPool(HASH_WORKERS, HASH_QUEUE_LIMIT)
+
+_dummy_hash: Optional[Future] = None
+
+
+def prepare_dummy_hash():
+    """Zleca hasz-atrapę puli hashowania - logowania zlecone później czekają na niego w kolejce."""
+    global _dummy_hash
+    _dummy_hash = pool._executor.submit(security.get_password_hash, secrets.token_urlsafe(16))
+
+
+def _verify_dummy(password: str) -> bool:
+    security.verify_password(password, _dummy_hash.result())
+    return False
+
+
+async def hash_password(password: str) -> str:
+    return await pool.run(security.get_password_hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """(czy hasło pasuje, nowy hasz do zapisania albo None)."""
+    valid, new_hash = await pool.run(security.verify_and_update_password, password, password_hash)
+    if new_hash is not None:
+        REHASHED.inc()
+    return valid, new_hash
+
+
+async def verify_unknown_user(password: str) -> bool:
+    """Weryfikacja dla nieistniejącego konta - ten sam koszt co dla istniejącego, zawsze False."""
+    return await pool.run(_verify_dummy, password)
@@ -0,0 +1,269 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+import time
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    import numpy as np  # import przy pierwszym embeddingu - nie spowalnia startu aplikacji
+
+from app import metrics
+from app import tracing
+
+# LLM_PROVIDER - "gemini" (domyślnie) lub "fake" (lokalna atrapa do testów wydajności, patrz app/fake_llm.py)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+DEFAULT_CHAT_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+DEFAULT_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "gemini-embedding-001")
+EMBED_BATCH_SIZE = 100
+
+
+class LLMProviderError(Exception):
+    """Błąd dostawcy modelu (sieć, limit, odpowiedź niezdatna do użycia)."""
+
+
+class Message:
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+
+
+class LLMProvider(ABC):
+    """Interfejs generowania odpowiedzi. Podklasy implementują _chat/_stream, metryki i spany są tutaj."""
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def chat(self, message: str, history: Sequence[Message] = (), system_instruction: str = "",
+             tools: Optional[List[Callable]] = None) -> str:
+        """Zwraca tekst odpowiedzi. Jeśli podano tools, dostawca sam wywołuje narzędzia (function calling)."""
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            with tracing.span(f"{self.name}.chat", kind="client", **{"llm.model": self.model}):
+                return self._chat(message, list(history), system_instruction, tools)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            # Uwaga: przy function calling czas obejmuje też wykonanie narzędzi
+            metrics.LLM_LATENCY.labels(self.model, status).observe(time.perf_counter() - start)
+
+    def stream(self, message: str, history: Sequence[Message] = (), system_instruction: str = "") -> Iterator[str]:
+        """Zwraca odpowiedź kawałkami (bez narzędzi)."""
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            with tracing.span(f"{self.name}.stream", kind="client", **{"llm.model": self.model}):
+                yield from self._stream(message, list(history), system_instruction)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            metrics.LLM_LATENCY.labels(self.model, status).observe(time.perf_counter() - start)
+
+    @abstractmethod
+    def _chat(self, message: str, history: List[Message], system_instruction: str,
+              tools: Optional[List[Callable]]) -> str:
+        ...
+
+    @abstractmethod
+    def _stream(self, message: str, history: List[Message], system_instruction: str) -> Iterator[str]:
+        ...
+
+
+class EmbeddingProvider(ABC):
+    name = "base"
+
+    def __init__(self, embedding_model: str):
+        self.embedding_model = embedding_model
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        """Zwraca macierz float32 o kształcie (len(texts), wymiar)."""
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            with tracing.span(f"{self.name}.embed", kind="client",
+                              **{"llm.model": self.embedding_model, "embed.count": len(texts)}):
+                return self._embed(texts)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            metrics.EMBEDDING_LATENCY.labels(self.embedding_model, status).observe(time.perf_counter() - start)
+
+    @abstractmethod
+    def _embed(self, texts: List[str]) -> "np.ndarray":
+        ...
+
+
+class GeminiProvider(LLMProvider, EmbeddingProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str = DEFAULT_CHAT_MODEL,
+                 embedding_model: str = DEFAULT_EMBEDDING_MODEL):
+        from google import genai  # import ciężkiego SDK dopiero przy tworzeniu dostawcy
+
+        LLMProvider.__init__(self, model)
+        EmbeddingProvider.__init__(self, embedding_model)
+        self.client = genai.Client(api_key=api_key)
+
+    def _contents(self, history: List[Message]):
+        from google.genai import types
+
+        return [types.Content(role=m.role, parts=[types.Part.from_text(text=m.content)]) for m in history]
+
+    def _chat(self, message, history, system_instruction, tools):
+        from google.genai import types
+
+        chat = self.client.chats.create(
+            model=self.model,
+            history=self._contents(history),
+            config=types.GenerateContentConfig(
+                tools=tools,
+                automatic_function_calling=types.AutomaticFunctionCallingConfig(
+                    disable=not tools,
+                ),
+                system_instruction=system_instruction or None
+            )
+        )
+        response = chat.send_message(message)
+        return response.text if response.text else ""
+
+    def _stream(self, message, history, system_instruction):
+        from google.genai import types
+
+        chat = self.client.chats.create(
+            model=self.model,
+            history=self._contents(history),
+            config=types.GenerateContentConfig(system_instruction=system_instruction or None)
+        )
+        for chunk in chat.send_message_stream(message):
+            if chunk.text:
+                yield chunk.text
+
+    def _embed(self, texts):
+        import numpy as np
+
+        vectors = []
+        # API przyjmuje listę tekstów - jedno wywołanie na paczkę zamiast jednego na fragment
+        for i in range(0, len(texts), EMBED_BATCH_SIZE):
+            result = self.client.models.embed_content(
+                model=self.embedding_model,
+                contents=texts[i:i + EMBED_BATCH_SIZE]
+            )
+            vectors.extend(e.values for e in result.embeddings)
+        return np.array(vectors, dtype="float32")
+
+
+class OllamaProvider(LLMProvider):
+    """Model lokalny przez Ollamę (opcjonalny pakiet `ollama`), np. spec "ollama:qwen3:14b"."""
+
+    name = "ollama"
+
+    def __init__(self, model: str, host: Optional[str] = None):
+        import ollama  # opcjonalna zależność - tylko gdy skonfigurowano model lokalny
+
+        super().__init__(model)
+        self.client = ollama.Client(host=host) if host else ollama.Client()
+
+    def _messages(self, message, history, system_instruction):
+        messages = [{"role": "system", "content": system_instruction}] if system_instruction else []
+        messages += [{"role": m.role, "content": m.content} for m in history]
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def _chat(self, message, history, system_instruction, tools):
+        messages = self._messages(message, history, system_instruction)
+        response = self.client.chat(model=self.model, messages=messages, tools=tools or None)
+
+        if tools and response.message.tool_calls:
+            available = {t.__name__: t for t in tools}
+            messages.append(response.message)
+            for call in response.message.tool_calls:
+                func = available.get(call.function.name)
+                if func is None:
+                    continue
+                messages.append({
+                    "role": "tool",
+                    "content": str(func(**call.function.arguments)),
+                    "tool_name": call.function.name
+                })
+            response = self.client.chat(model=self.model, messages=messages)
+
+        return response.message.content or ""
+
+    def _stream(self, message, history, system_instruction):
+        messages = self._messages(message, history, system_instruction)
+        for chunk in self.client.chat(model=self.model, messages=messages, stream=True):
+            if chunk.message.content:
+                yield chunk.message.content
+
+
+def create_provider(spec: str):
+    """Tworzy dostawcę ze specyfikacji "rodzaj:model", np. "gemini:gemini-2.5-flash-lite". None = brak konfiguracji."""
+    kind, _, model = spec.strip().partition(":")
+    kind = kind.lower()
+
+    if kind == "fake":
+        from app.fake_llm import FakeProvider
+        provider = FakeProvider.from_env()
+        if model:
+            provider.model = model
+        return provider
+
+    if kind == "ollama":
+        return OllamaProvider(model or "qwen3:14b", host=os.getenv("OLLAMA_HOST"))
+
+    if kind == "gemini":
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            return None
+        return GeminiProvider(api_key=api_key, model=model or DEFAULT_CHAT_MODEL)
+
+    raise ValueError(f"Nieznany dostawca LLM: {spec}")
+
+
+_providers = {}
+_provider_lock = threading.RLock()
+
+
+def _cached(key: str, factory):
+    if key not in _providers:
+        with _provider_lock:
+            if key not in _providers:
+                _providers[key] = factory()
+    return _providers[key]
+
+
+def get_provider(spec: str):
+    """Współdzielona instancja dostawcy dla danej specyfikacji (jeden klient API na proces)."""
+    return _cached(f"spec:{spec}", lambda: create_provider(spec))
+
+
+def _primary_spec() -> str:
+    return f"{LLM_PROVIDER}:{DEFAULT_CHAT_MODEL}" if LLM_PROVIDER == "gemini" else LLM_PROVIDER
+
+
+def get_llm_provider() -> Optional[LLMProvider]:
+    """Dostawca dla asystenta: główny model z terminem, hedgingiem, modelami zapasowymi i circuit breakerem."""
+    def build():
+        from app.llm_resilience import ResilientProvider
+        return ResilientProvider.from_env(_primary_spec())
+
+    return _cached("chat", build)
+
+
+def get_local_llm_provider() -> Optional[LLMProvider]:
+    """Model lokalny dla local_mode (LLM_LOCAL_MODEL, np. "ollama:qwen3:14b") albo None."""
+    spec = os.getenv("LLM_LOCAL_MODEL")
+    if not spec:
+        return None
+    return get_provider(spec)
+
+
+def get_embedding_provider() -> Optional[EmbeddingProvider]:
+    return get_provider(_primary_spec())
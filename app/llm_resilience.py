@@ -0,0 +1,253 @@
+import concurrent.futures
+import contextvars
+import os
+import threading
+import time
+from typing import List, Optional
+
+from app import metrics
+from app.llm import LLMProvider, LLMProviderError, get_provider
+
+# LLM_FALLBACK_MODELS - lista zapasowych dostawców "rodzaj:model" (po przecinku), np.
+#   "gemini:gemini-2.5-flash-lite,ollama:qwen3:14b"
+# LLM_HEDGE - "p95" (drugie zapytanie po p95 latencji głównego modelu), liczba sekund lub "off"
+# LLM_HEDGE_DEFAULT_SECONDS - opóźnienie hedge'a, dopóki nie ma dość próbek do policzenia p95
+# LLM_DEADLINE_SECONDS - całkowity limit czasu na odpowiedź (wszystkie próby łącznie)
+# LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_SECONDS - próg kolejnych błędów i czas otwarcia breakera
+# LLM_MAX_INFLIGHT_PER_PROVIDER - ile prób jednego dostawcy może naraz zajmować wątki puli; zawieszony
+#   dostawca nie zablokuje wtedy całej puli (LLM_MAX_WORKERS), a kolejne zapytania idą do modelu zapasowego
+LLM_FALLBACK_MODELS = os.getenv("LLM_FALLBACK_MODELS", "")
+LLM_HEDGE = os.getenv("LLM_HEDGE", "p95").lower()
+LLM_HEDGE_DEFAULT_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_SECONDS", "8"))
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "25"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "32"))
+LLM_MAX_INFLIGHT_PER_PROVIDER = int(os.getenv("LLM_MAX_INFLIGHT_PER_PROVIDER", str(max(1, LLM_MAX_WORKERS // 4))))
+
+LLM_ATTEMPTS = metrics.REGISTRY.counter(
+    "stumedica_llm_attempts_total", "Próby wywołania dostawców LLM", ("model", "role", "outcome"))
+BREAKER_STATE = metrics.REGISTRY.gauge(
+    "stumedica_llm_breaker_open", "1 = circuit breaker dostawcy otwarty", ("model",))
+
+# Wspólna pula wątków dla prób - nie tworzymy wątku na każde zapytanie
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
+
+
+class CircuitBreaker:
+    """Po N kolejnych błędach przestaje wysyłać zapytania na czas cooldown, potem wpuszcza jedną próbę."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                return True  # jedna próba kontrolna
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+        BREAKER_STATE.labels(self.name).set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                opened = True
+            else:
+                opened = False
+        if opened:
+            BREAKER_STATE.labels(self.name).set(1)
+
+    def abort_probe(self):
+        """Próba kontrolna nie dała wyniku (anulowana przed startem, przerwany strumień) - breaker wraca do OPEN.
+
+        Bez tego stan HALF_OPEN zostałby na zawsze: allow() nie wpuszcza już kolejnej próby. Próba nic nie
+        powiedziała o dostawcy, więc następne allow() od razu wpuszcza nową, bez czekania kolejnego cooldownu.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic() - self.cooldown
+
+
+class ResilientProvider(LLMProvider):
+    """Łańcuch dostawców: termin na całe zapytanie, hedging po p95 i przejście na model zapasowy po błędzie.
+
+    Uwaga: przy hedgingu dwie próby mogą równolegle wywoływać narzędzia - narzędzia zapisujące
+    muszą być idempotentne w obrębie zapytania (patrz once_per_request w routers/chat.py).
+    """
+
+    name = "llm"
+
+    def __init__(self, providers: List[LLMProvider], hedge: str = "p95", deadline: float = 25.0,
+                 breaker_failures: int = 5, breaker_cooldown: float = 30.0,
+                 max_inflight: int = LLM_MAX_INFLIGHT_PER_PROVIDER):
+        super().__init__("router")
+        self.providers = providers
+        self.hedge = hedge
+        self.deadline = deadline
+        self.breakers = {
+            id(p): CircuitBreaker(p.model, breaker_failures, breaker_cooldown) for p in providers
+        }
+        # Próby w locie (także te po terminie, których wątku nie da się przerwać) - limit na dostawcę
+        self.inflight = {id(p): threading.BoundedSemaphore(max_inflight) for p in providers}
+
+    @classmethod
+    def from_env(cls, primary_spec: str) -> Optional["ResilientProvider"]:
+        specs = [primary_spec] + [s for s in LLM_FALLBACK_MODELS.split(",") if s.strip()]
+        providers = [p for p in (get_provider(spec) for spec in specs) if p is not None]
+        if not providers:
+            return None
+        return cls(providers, hedge=LLM_HEDGE, deadline=LLM_DEADLINE_SECONDS,
+                   breaker_failures=LLM_BREAKER_FAILURES, breaker_cooldown=LLM_BREAKER_COOLDOWN_SECONDS)
+
+    def hedge_delay(self, provider: LLMProvider) -> Optional[float]:
+        if self.hedge == "off":
+            return None
+        if self.hedge != "p95":
+            return float(self.hedge)
+
+        child = metrics.LLM_LATENCY.labels(provider.model, "ok")
+        with child._lock:
+            counts = list(child.counts)
+        if sum(counts) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_SECONDS
+        return metrics.quantile(0.95, metrics.LLM_LATENCY.buckets, counts)
+
+    def _submit(self, provider: LLMProvider, role: str, args) -> concurrent.futures.Future:
+        """Wysyła próbę do puli; miejsce w limicie dostawcy musi być już zajęte (next_provider)."""
+        breaker = self.breakers[id(provider)]
+        slots = self.inflight[id(provider)]
+        ctx = contextvars.copy_context()
+        try:
+            future = _executor.submit(ctx.run, provider.chat, *args)
+        except BaseException:
+            slots.release()
+            raise
+
+        def _done(f: concurrent.futures.Future):
+            slots.release()
+            if f.cancelled():
+                breaker.abort_probe()
+                LLM_ATTEMPTS.labels(provider.model, role, "cancelled").inc()
+            elif f.exception() is None:
+                breaker.record_success()
+                LLM_ATTEMPTS.labels(provider.model, role, "ok").inc()
+            else:
+                breaker.record_failure()
+                LLM_ATTEMPTS.labels(provider.model, role, "error").inc()
+
+        future.add_done_callback(_done)
+        return future
+
+    def _chat(self, message, history, system_instruction, tools):
+        args = (message, history, system_instruction, tools)
+        deadline = time.monotonic() + self.deadline
+
+        candidates = list(self.providers)
+
+        def next_provider() -> Optional[LLMProvider]:
+            # allow() sprawdzamy dopiero przy faktycznym użyciu - półotwarty breaker dostaje swoją próbę
+            while candidates:
+                provider = candidates.pop(0)
+                slots = self.inflight[id(provider)]
+                if not slots.acquire(blocking=False):
+                    LLM_ATTEMPTS.labels(provider.model, "-", "saturated").inc()
+                    continue
+                if self.breakers[id(provider)].allow():
+                    return provider
+                slots.release()
+            return None
+
+        primary = next_provider()
+        if primary is None:
+            raise LLMProviderError("Wszyscy dostawcy LLM są chwilowo wyłączeni (circuit breaker) lub przeciążeni.")
+
+        pending = {self._submit(primary, "primary", args)}
+        hedge_at = None
+        delay = self.hedge_delay(primary)
+        if delay is not None and candidates:
+            hedge_at = time.monotonic() + delay
+
+        try:
+            last_error: Optional[BaseException] = None
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+
+                wake_at = min(deadline, hedge_at) if hedge_at else deadline
+                done, _ = concurrent.futures.wait(
+                    pending, timeout=max(0.0, wake_at - now),
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+
+                for future in done:
+                    pending.discard(future)
+                    if future.exception() is None:
+                        return future.result()
+                    last_error = future.exception()
+
+                if done and not pending:
+                    # Błąd bez drugiej próby w locie - od razu model zapasowy
+                    fallback = next_provider()
+                    if fallback is not None:
+                        pending.add(self._submit(fallback, "fallback", args))
+                    hedge_at = None
+                elif hedge_at and time.monotonic() >= hedge_at:
+                    hedge = next_provider()
+                    if hedge is not None:
+                        pending.add(self._submit(hedge, "hedge", args))
+                    hedge_at = None
+
+            if last_error is not None and not pending:
+                raise LLMProviderError(f"Dostawcy LLM zwrócili błąd: {last_error}") from last_error
+            raise LLMProviderError(f"Przekroczono limit czasu odpowiedzi modelu ({self.deadline:g}s).")
+        finally:
+            # Próby, które jeszcze nie wystartowały, nie są już potrzebne; działających wątków nie da się
+            # przerwać - wynik odrzucamy, a narzędzia odmawiają pracy po zakończeniu zapytania (routers/chat.py)
+            for future in pending:
+                future.cancel()
+
+    def _stream(self, message, history, system_instruction):
+        # Strumień trudno hedgować - bierzemy pierwszego dostępnego dostawcę
+        for provider in self.providers:
+            breaker = self.breakers[id(provider)]
+            if not breaker.allow():
+                continue
+            received = False
+            try:
+                for chunk in provider.stream(message, history, system_instruction):
+                    received = True
+                    yield chunk
+            except GeneratorExit:
+                # Odbiorca przerwał strumień - dostawca działał, o ile zdążył cokolwiek wysłać
+                if received:
+                    breaker.record_success()
+                else:
+                    breaker.abort_probe()
+                raise
+            except Exception:
+                breaker.record_failure()
+                raise
+            breaker.record_success()
+            return
+        raise LLMProviderError("Wszyscy dostawcy LLM są chwilowo wyłączeni (circuit breaker).")
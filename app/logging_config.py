@@ -0,0 +1,159 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import zlib
+from datetime import datetime, timezone
+
+from app import metrics
+from app import tracing
+
+# LOG_LEVEL - poziom logowania (domyślnie INFO)
+# LOG_FILE - plik logu (domyślnie server.log), LOG_FORMAT - "json" (domyślnie) lub "text"
+# LOG_MAX_BYTES, LOG_BACKUP_COUNT - rotacja po rozmiarze; LOG_ROTATE_WHEN (np. "midnight") - rotacja po czasie
+# LOG_ROTATION - "internal" (rotacja w procesie, powyższe ustawienia) lub "external" (WatchedFileHandler -
+#   plik obraca logrotate, proces otwiera go na nowo). Rotacja w procesie działa tylko przy jednym workerze:
+#   kilka procesów obracających ten sam plik pisze dalej do przemianowanego pliku i nadpisuje kopie.
+#   Domyślnie "external", gdy WEB_CONCURRENCY > 1 (tę zmienną czyta też uvicorn jako liczbę workerów)
+# LOG_SAMPLE_RATES - próbkowanie INFO/DEBUG per logger, np. "StuMedica.tools=0.1"
+#   (decyzja per request id - z próbkowanego żądania zapisują się wszystkie linie)
+# LOG_QUEUE_SIZE - pojemność kolejki; przy przepełnieniu wpisy są odrzucane zamiast blokować żądanie
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "server.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+LOG_ROTATION = os.getenv("LOG_ROTATION", "external" if WEB_CONCURRENCY > 1 else "internal").lower()
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+DROPPED_LOGS = metrics.REGISTRY.counter(
+    "stumedica_log_records_dropped_total", "Wpisy logu odrzucone przez przepełnioną kolejkę")
+
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "user_id"}
+
+
+class ContextFilter(logging.Filter):
+    """Dopisuje request id i id użytkownika (z contextvars) - musi działać w wątku żądania, przed kolejką."""
+
+    def filter(self, record):
+        record.request_id = tracing.request_id_var.get()
+        record.user_id = tracing.user_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Przepuszcza ułamek wpisów INFO/DEBUG z wybranych loggerów. WARNING i wyższe zawsze przechodzą."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+
+        rate = None
+        name = record.name
+        while name:
+            if name in self.rates:
+                rate = self.rates[name]
+                break
+            name = name.rpartition(".")[0]
+        if rate is None or rate >= 1.0:
+            return True
+
+        key = getattr(record, "request_id", None) or f"{record.created}"
+        return (zlib.crc32(key.encode()) % 10000) < rate * 10000
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "user_id": getattr(record, "user_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Kolejka jest w obrębie procesu - formatowanie (i interpolacja argumentów) odbywa się w wątku zapisującym
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_LOGS.inc()
+
+
+def _parse_sample_rates(spec: str) -> dict:
+    rates = {}
+    for part in spec.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+_listener = None
+
+
+def setup_logging():
+    """Konfiguruje root logger: kolejka + wątek zapisujący (plik i konsola). Wywołanie jest idempotentne."""
+    global _listener
+    if _listener is not None:
+        return
+
+    if LOG_ROTATION == "external":
+        file_handler = logging.handlers.WatchedFileHandler(LOG_FILE, encoding="utf-8")
+    elif LOG_ROTATE_WHEN:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+
+    text_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else text_formatter)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(text_formatter)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(_parse_sample_rates(LOG_SAMPLE_RATES)))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Opróżnia kolejkę i zatrzymuje wątek zapisujący (przy zamykaniu aplikacji)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,14 +1,26 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
-from app import models
-from app.database import engine
-from app.routers import auth, base, medications, appointments, chat
+from app import metrics, query_count, startup, tracing
+from app.routers import auth, base, medications, appointments, chat, schedule
+
+startup.instrument_engines()
+
 
-models.Base.metadata.create_all(bind=engine)
-app = FastAPI(title="StuMedica API", version="0.6")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Logi, migracje, metryki i zadania tła - w fazach app/startup.py, a nie przy imporcie
+    tasks = await startup.run(app)
+    yield
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(title="StuMedica API", version="0.6", lifespan=lifespan)
 
 origins = [
     "http://stumedica.pl",
@@ -28,14 +40,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # kursor kolejnej strony GET /appointments/slots
 )
 
+app.add_middleware(query_count.QueryCountMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 app.include_router(base.router)
 app.include_router(auth.router)
 app.include_router(medications.router)
 app.include_router(appointments.router)
+app.include_router(schedule.router)
 app.include_router(chat.router)
 
 # uvicorn app.main:app --reload --port 4000
@@ -0,0 +1,523 @@
+import bisect
+from abc import ABC, abstractmethod
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Stałe kubełki (w sekundach) - wspólne dla wszystkich histogramów latencji,
+# dzięki czemu snapshoty z wielu workerów można po prostu zsumować.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+METRICS_DIR = os.getenv("METRICS_DIR")  # np. /tmp/stumedica-metrics (tylko przy wielu workerach)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_float(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value", "_file", "_offset")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+        self._file = None
+        self._offset = 0
+
+    def attach(self, file: "_MmapFile", offset: int):
+        """Od teraz każda zmiana trafia też do slotu w pliku workera (METRICS_DIR)."""
+        with self._lock:
+            self._file = file
+            self._offset = offset
+            file.write(offset, self.value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+            if self._file is not None:
+                _DOUBLE.pack_into(self._file.mm, self._offset, self.value)
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = float(value)
+            if self._file is not None:
+                _DOUBLE.pack_into(self._file.mm, self._offset, self.value)
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "buckets", "counts", "sum", "count", "_file", "_offset")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # ostatni kubełek = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._file = None
+        self._offset = 0
+
+    def attach(self, file: "_MmapFile", offset: int):
+        """Sloty w pliku: kubełki, suma, liczba obserwacji."""
+        with self._lock:
+            self._file = file
+            self._offset = offset
+            for idx, count in enumerate(self.counts):
+                file.write(offset + idx * 8, count)
+            _SUM_COUNT.pack_into(file.mm, offset + len(self.counts) * 8, self.sum, self.count)
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+            if self._file is not None:
+                mm = self._file.mm
+                _DOUBLE.pack_into(mm, self._offset + idx * 8, self.counts[idx])
+                _SUM_COUNT.pack_into(mm, self._offset + len(self.counts) * 8, self.sum, self.count)
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """Context manager mierzący czas bloku i zapisujący go do histogramu."""
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _new_child(self):
+        ...
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: oczekiwano etykiet {self.labelnames}")
+
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    if _store is not None:
+                        _attach_child(self, key, child)
+                    self._children[key] = child
+        return child
+
+    def items(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+def quantile(q: float, buckets: Sequence[float], counts: Sequence[int]) -> Optional[float]:
+    """Szacuje kwantyl z kubełków histogramu (interpolacja liniowa, jak histogram_quantile)."""
+    total = sum(counts)
+    if total == 0:
+        return None
+
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for idx, count in enumerate(counts):
+        upper = buckets[idx] if idx < len(buckets) else None
+        if cumulative + count >= rank and count > 0:
+            if upper is None:
+                # Wartość w kubełku +Inf - najlepsze co wiemy to górna granica poprzedniego
+                return buckets[-1] if buckets else None
+            return lower + (upper - lower) * ((rank - cumulative) / count)
+        cumulative += count
+        if upper is not None:
+            lower = upper
+    return buckets[-1] if buckets else None
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                return existing
+            metric = metric_cls(name, documentation, labelnames, **kwargs)
+            self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Zrzut wszystkich metryk do postaci JSON (do łączenia między workerami)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        result = {}
+        for metric in metrics:
+            samples = []
+            for key, child in metric.items():
+                if metric.kind == "histogram":
+                    with child._lock:
+                        samples.append({
+                            "labels": list(key),
+                            "counts": list(child.counts),
+                            "sum": child.sum,
+                            "count": child.count,
+                        })
+                else:
+                    samples.append({"labels": list(key), "value": child.value})
+
+            entry = {
+                "type": metric.kind,
+                "help": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "samples": samples,
+            }
+            if metric.kind == "histogram":
+                entry["buckets"] = list(metric.buckets)
+            result[metric.name] = entry
+        return result
+
+
+def merge_snapshots(snapshots: List[Dict[str, dict]]) -> Dict[str, dict]:
+    """Sumuje snapshoty z wielu procesów (liczniki i kubełki dodają się wprost)."""
+    merged: Dict[str, dict] = {}
+    for snap in snapshots:
+        for name, entry in snap.items():
+            target = merged.setdefault(name, {**entry, "samples": []})
+            index = {tuple(s["labels"]): s for s in target["samples"]}
+            for sample in entry["samples"]:
+                key = tuple(sample["labels"])
+                existing = index.get(key)
+                if existing is None:
+                    copy = dict(sample)
+                    if "counts" in copy:
+                        copy["counts"] = list(copy["counts"])
+                    target["samples"].append(copy)
+                    index[key] = copy
+                elif entry["type"] == "histogram":
+                    existing["counts"] = [a + b for a, b in zip(existing["counts"], sample["counts"])]
+                    existing["sum"] += sample["sum"]
+                    existing["count"] += sample["count"]
+                else:
+                    existing["value"] += sample["value"]
+    return merged
+
+
+def render_prometheus(snapshot: Dict[str, dict]) -> str:
+    """Formatuje snapshot w formacie tekstowym Prometheusa (text/plain; version=0.0.4)."""
+    lines = []
+    for name in sorted(snapshot):
+        entry = snapshot[name]
+        labelnames = entry["labelnames"]
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+
+        for sample in entry["samples"]:
+            values = sample["labels"]
+            if entry["type"] == "histogram":
+                cumulative = 0
+                bounds = list(entry["buckets"]) + [float("inf")]
+                for bound, count in zip(bounds, sample["counts"]):
+                    cumulative += count
+                    le = 'le="' + _format_float(bound) + '"'
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_float(sample['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labelnames, values)} {sample['count']}")
+            else:
+                lines.append(f"{name}{_format_labels(labelnames, values)} {_format_float(sample['value'])}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+TOOL_CALLS = REGISTRY.counter(
+    "stumedica_tool_calls_total", "Wywołania narzędzi asystenta AI", ("tool", "status"))
+TOOL_LATENCY = REGISTRY.histogram(
+    "stumedica_tool_duration_seconds", "Czas wykonania narzędzi asystenta AI", ("tool",))
+LLM_LATENCY = REGISTRY.histogram(
+    "stumedica_llm_request_duration_seconds", "Czas wywołań modelu językowego", ("model", "status"))
+EMBEDDING_LATENCY = REGISTRY.histogram(
+    "stumedica_embedding_duration_seconds", "Czas wywołań API embeddingów", ("model", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "stumedica_http_request_duration_seconds", "Czas obsługi żądań HTTP", ("method", "route", "status"))
+
+
+# --- Agregacja między workerami: plik mmap na worker w METRICS_DIR ---
+#
+# Każdy worker zapisuje swoje liczniki, wskaźniki i kubełki histogramów do własnego pliku
+# metrics-<pid>.db, zmapowanego w pamięć. Plik to nagłówek (zajęte bajty) i kolejne wpisy:
+# [długość klucza, liczba wartości][klucz JSON: nazwa metryki i etykiety][wartości float64].
+# Seria dostaje sloty raz, przy pierwszym użyciu; potem zapis to nadpisanie 8 bajtów w mapie -
+# bez wywołań systemowych i bez blokad między procesami (do pliku pisze tylko jego worker).
+# collect() czyta pliki wszystkich workerów i sumuje je jak merge_snapshots.
+
+_HEADER = struct.Struct("<Q")
+_ENTRY = struct.Struct("<II")
+_DOUBLE = struct.Struct("<d")
+_SUM_COUNT = struct.Struct("<dd")
+_INITIAL_FILE_BYTES = 64 * 1024
+
+
+def _file_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"metrics-{pid}.db")
+
+
+def _series_key(name: str, labels: Sequence[str]) -> bytes:
+    return json.dumps([name, list(labels)], separators=(",", ":")).encode("utf-8")
+
+
+class _MmapFile:
+    """Plik metryk jednego workera. Nowe wpisy pod blokadą, zapis wartości - bez blokady."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(self._fd, _INITIAL_FILE_BYTES)
+        self.mm = mmap.mmap(self._fd, _INITIAL_FILE_BYTES)
+        self._used = _HEADER.size
+        _HEADER.pack_into(self.mm, 0, self._used)
+
+    def allocate(self, key: bytes, size: int) -> int:
+        """Rezerwuje size wartości dla serii i zwraca przesunięcie pierwszej z nich."""
+        padded = key + b" " * (-(_ENTRY.size + len(key)) % 8)
+        needed = _ENTRY.size + len(padded) + size * _DOUBLE.size
+        with self._lock:
+            if self._used + needed > len(self.mm):
+                new_size = len(self.mm)
+                while self._used + needed > new_size:
+                    new_size *= 2
+                self.mm.resize(new_size)  # powiększa też plik
+            entry = self._used
+            _ENTRY.pack_into(self.mm, entry, len(padded), size)
+            self.mm[entry + _ENTRY.size:entry + _ENTRY.size + len(padded)] = padded
+            # Nagłówek na końcu - czytelnik nigdy nie widzi wpisu zapisanego do połowy
+            self._used += needed
+            _HEADER.pack_into(self.mm, 0, self._used)
+        return entry + _ENTRY.size + len(padded)
+
+    def write(self, offset: int, value: float):
+        _DOUBLE.pack_into(self.mm, offset, value)
+
+
+def _read_file(path: str) -> Dict[Tuple[str, Tuple[str, ...]], Tuple[float, ...]]:
+    """{(nazwa, etykiety): wartości} z pliku workera."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        return {}
+    used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+    series = {}
+    position = _HEADER.size
+    while position + _ENTRY.size <= used:
+        key_length, size = _ENTRY.unpack_from(data, position)
+        position += _ENTRY.size
+        name, labels = json.loads(data[position:position + key_length])
+        position += key_length
+        series[(name, tuple(labels))] = struct.unpack_from(f"<{size}d", data, position)
+        position += size * _DOUBLE.size
+    return series
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_store: Optional[_MmapFile] = None
+
+
+def _attach_child(metric: "_Metric", key: Tuple[str, ...], child):
+    size = len(child.counts) + 2 if metric.kind == "histogram" else 1
+    offset = _store.allocate(_series_key(metric.name, key), size)
+    child.attach(_store, offset)
+
+
+def open_worker_file():
+    """Przenosi metryki tego workera do pliku mmap w METRICS_DIR (wywoływane w lifespan, już po fork)."""
+    global _store
+    if not METRICS_DIR or (_store is not None and _store.path == _file_path(os.getpid())):
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    store = _MmapFile(_file_path(os.getpid()))
+    _store = store  # nowe serie od tej chwili dostają sloty w labels(), istniejące - poniżej
+    with REGISTRY._lock:
+        registered = list(REGISTRY._metrics.values())
+    for metric in registered:
+        with metric._lock:
+            for key, child in metric._children.items():
+                if child._file is not store:
+                    _attach_child(metric, key, child)
+
+
+def collect() -> Dict[str, dict]:
+    """Zwraca metryki tego procesu, a przy ustawionym METRICS_DIR - zsumowane ze wszystkich workerów.
+
+    Liczniki i histogramy zakończonych workerów zostają w sumie (nie maleją po restarcie workera),
+    wskaźniki liczą się tylko z żyjących procesów.
+    """
+    own = REGISTRY.snapshot()
+    if not METRICS_DIR:
+        return own
+
+    with REGISTRY._lock:
+        registered = dict(REGISTRY._metrics)
+    snapshots = [own]
+    own_path = _file_path(os.getpid())
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.db")):
+        if path == own_path:
+            continue
+        try:
+            series = _read_file(path)
+            pid = int(os.path.basename(path)[len("metrics-"):-len(".db")])
+        except (OSError, ValueError, struct.error):
+            continue
+        alive = _pid_alive(pid)
+        snapshot: Dict[str, dict] = {}
+        for (name, labels), values in series.items():
+            metric = registered.get(name)
+            if metric is None or (metric.kind == "gauge" and not alive):
+                continue
+            entry = snapshot.setdefault(name, {
+                "type": metric.kind, "help": metric.documentation,
+                "labelnames": list(metric.labelnames), "samples": [],
+            })
+            if metric.kind == "histogram":
+                entry["buckets"] = list(metric.buckets)
+                entry["samples"].append({"labels": list(labels), "counts": [int(v) for v in values[:-2]],
+                                         "sum": values[-2], "count": int(values[-1])})
+            else:
+                entry["samples"].append({"labels": list(labels), "value": values[0]})
+        snapshots.append(snapshot)
+    return merge_snapshots(snapshots)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI mierzący czas obsługi żądań HTTP per szablon ścieżki."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Szablon ścieżki (np. /medications/{med_id}) zamiast surowego URL - ogranicza kardynalność
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.labels(scope["method"], path, str(status_code)).observe(
+                time.perf_counter() - start
+            )
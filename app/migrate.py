@@ -0,0 +1,46 @@
+"""Aktualizacja schematu bazy migracjami Alembica (zastępuje Base.metadata.create_all).
+
+Uruchomienie ręczne: python -m app.migrate (lub alembic upgrade head).
+"""
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+
+from app.database import engine
+
+logger = logging.getLogger("StuMedica")
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+BASELINE_REVISION = "0001"
+# Stały klucz blokady doradczej Postgresa - kilka workerów startujących naraz nie migruje równolegle.
+# Blokada transakcyjna (pg_advisory_xact_lock) zwalnia się przy commit - działa też przez PgBouncera w trybie transakcji.
+MIGRATION_LOCK_KEY = 7_320_118
+
+
+def _config(connection) -> Config:
+    config = Config(ALEMBIC_INI)
+    config.attributes["connection"] = connection
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def upgrade_database(revision: str = "head"):
+    """Doprowadza schemat do podanej rewizji. Bazy utworzone wcześniej przez create_all są najpierw oznaczane jako baseline."""
+    with engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        config = _config(connection)
+        tables = set(inspect(connection).get_table_names())
+        if "alembic_version" not in tables and "users" in tables:
+            logger.info("Baza bez historii migracji - oznaczam jako rewizję %s", BASELINE_REVISION)
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, revision)
+        connection.commit()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade_database()
@@ -1,8 +1,32 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, JSON, Boolean, DateTime, Float
+from datetime import timezone
+
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, JSON, Boolean, Date, DateTime, Float, Index, Time, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 from app.database import Base
 
+
+class UTCDateTime(TypeDecorator):
+    """DateTime(timezone=True) zapisywany w UTC i zawsze odczytywany ze strefą.
+
+    SQLite nie ma typu ze strefą: zapisuje same składowe daty, a odczytuje datę bez strefy.
+    Dlatego przed zapisem sprowadzamy wartość do UTC, a po odczycie dopisujemy UTC.
+    """
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -12,11 +36,35 @@ class User(Base):
     password_hash = Column(String, nullable=False)
     # age = Column(Integer) # Opcjonalnie, jeśli używasz
     account_type = Column(String, nullable=False)  # 'patient' lub 'doctor'
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(UTCDateTime, server_default=func.now())
     ai_allowed = Column(Boolean, default=False)
     is_active = Column(Boolean, default=True)
 
-    medications = relationship("Medication", back_populates="owner")
+    # lazy="raise_on_sql" - niejawne doczytanie relacji (N+1) kończy się błędem; ładujemy je jawnie w zapytaniu
+    medications = relationship("Medication", back_populates="owner", lazy="raise_on_sql")
+
+
+class UsersVersion(Base):
+    """Jeden wiersz (id = 1): licznik zmian kont podbijany triggerem na users (migracja 0005), app/user_cache.py."""
+    __tablename__ = "users_version"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(BigInteger, nullable=False)
+
+
+class RefreshToken(Base):
+    """Token odświeżania (app/tokens.py) - w bazie tylko skrót SHA-256, każdy token jest jednorazowy."""
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Kolejne tokeny z jednego logowania - ponowne użycie zużytego tokenu unieważnia całą rodzinę
+    family_id = Column(String, nullable=False, index=True)
+    token_hash = Column(String, nullable=False, unique=True)
+    created_at = Column(UTCDateTime, server_default=func.now())
+    expires_at = Column(UTCDateTime, nullable=False)
+    used_at = Column(UTCDateTime, nullable=True)
+    revoked_at = Column(UTCDateTime, nullable=True)
 
 
 class Medication(Base):
@@ -31,7 +79,14 @@ class Medication(Base):
     reminders = Column(JSON, default=[])
     is_active = Column(Boolean, default=True)
 
-    owner = relationship("User", back_populates="medications")
+    owner = relationship("User", back_populates="medications", lazy="raise_on_sql")
+
+    # Indeksy zakładają migracje (alembic/versions) - tutaj są dla create_all i autogenerate
+    __table_args__ = (
+        # GET /medications/ i narzędzie get_my_medications: user_id = ? AND is_active
+        Index("ix_medications_user_active", "user_id",
+              postgresql_where=text("is_active = true"), sqlite_where=text("is_active = 1")),
+    )
 
 
 class Doctor(Base):
@@ -41,22 +96,93 @@ class Doctor(Base):
     name = Column(String, nullable=False)
     specialization = Column(String, nullable=False, index=True)  # np. 'Kardiolog'
     price_private = Column(Float, nullable=False)  # Cena wizyty prywatnej
+    # Konto lekarza (account_type == 'doctor') zarządzające grafikiem; Null = grafik tylko z poziomu bazy
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, unique=True, index=True)
 
-    appointments = relationship("Appointment", back_populates="doctor")
+    appointments = relationship("Appointment", back_populates="doctor", lazy="raise_on_sql")
 
 
 class Appointment(Base):
+    # W Postgresie tabela partycjonowana po miesiącach date_time (migracja 0004, app/archive.py)
     __tablename__ = "appointments"
 
     id = Column(Integer, primary_key=True, index=True)
     doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
     patient_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Null = termin wolny
 
-    date_time = Column(DateTime(timezone=True), nullable=False)  # Data i godzina wizyty
+    date_time = Column(UTCDateTime, nullable=False)  # Data i godzina wizyty
     is_booked = Column(Boolean, default=False)
     notes = Column(String, nullable=True)  # Np. powód wizyty
 
     type = Column(String, default="PRIVATE")  # 'NFZ' lub 'PRIVATE'
 
-    doctor = relationship("Doctor", back_populates="appointments")
-    patient = relationship("User")
\ No newline at end of file
+    doctor = relationship("Doctor", back_populates="appointments", lazy="raise_on_sql")
+    patient = relationship("User", lazy="raise_on_sql")
+
+    __table_args__ = (
+        # Wolne terminy: is_booked = false AND date_time > now() ORDER BY date_time
+        Index("ix_appointments_free_slots", "date_time", "id",
+              postgresql_where=text("is_booked = false"), sqlite_where=text("is_booked = 0")),
+        # Historia pacjenta: patient_id = ? ORDER BY date_time DESC
+        Index("ix_appointments_patient_date", "patient_id", text("date_time DESC")),
+        # Jeden termin lekarza o danej godzinie (ON CONFLICT w app/seed.py); obsługuje też doctor_id + date_time
+        Index("uq_appointments_doctor_date", "doctor_id", "date_time", unique=True),
+        # SQLite: id usuniętych wierszy nie wracają - wizyty w archiwum zachowują swoje id (migracja 0004)
+        {"sqlite_autoincrement": True},
+    )
+
+
+class ArchivedAppointment(Base):
+    """Minione zarezerwowane wizyty przeniesione z appointments (app/archive.py) - te same kolumny i id."""
+    __tablename__ = "appointments_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
+    patient_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    date_time = Column(UTCDateTime, nullable=False)
+    is_booked = Column(Boolean)
+    notes = Column(String, nullable=True)
+    type = Column(String)
+
+    archived_at = Column(UTCDateTime, server_default=func.now())
+
+    __table_args__ = (
+        # Historia pacjenta: patient_id = ? ORDER BY date_time DESC
+        Index("ix_appointments_archive_patient_date", "patient_id", text("date_time DESC")),
+    )
+
+
+class ScheduleTemplate(Base):
+    """Tygodniowe godziny przyjęć lekarza - wolne terminy liczy z nich app/schedule.py, bez wierszy w appointments."""
+    __tablename__ = "schedule_templates"
+
+    id = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False, index=True)
+
+    weekday = Column(Integer, nullable=False)  # 1 = poniedziałek ... 7 = niedziela
+    start_time = Column(Time, nullable=False)  # Godziny lokalne przychodni (CLINIC_TIMEZONE)
+    end_time = Column(Time, nullable=False)
+    slot_minutes = Column(Integer, nullable=False, default=30)
+    type = Column(String, nullable=False, default="PRIVATE")
+    valid_from = Column(Date, nullable=True)  # Null = bez ograniczenia
+    valid_to = Column(Date, nullable=True)
+
+    doctor = relationship("Doctor", lazy="raise_on_sql")
+
+
+class ScheduleException(Base):
+    """Dzień lub godziny bez przyjęć (urlop, święto) - bez start_time i end_time cały dzień."""
+    __tablename__ = "schedule_exceptions"
+
+    id = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
+
+    date = Column(Date, nullable=False)
+    start_time = Column(Time, nullable=True)
+    end_time = Column(Time, nullable=True)
+    reason = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_schedule_exceptions_doctor_date", "doctor_id", "date"),
+    )
@@ -0,0 +1,98 @@
+"""Liczenie zapytań SQL w obrębie żądania - wykrywanie N+1.
+
+count_queries() to menedżer kontekstu: liczy zapytania wykonane w bieżącym kontekście (także w zadaniach
+i wątkach, które go skopiowały, np. narzędziach asystenta) i rzuca TooManyQueries po przekroczeniu limitu.
+
+DB_QUERY_COUNT_HEADER - "true" dodaje nagłówek X-DB-Queries do każdej odpowiedzi (testy, diagnostyka)
+DB_MAX_QUERIES_PER_REQUEST - po przekroczeniu zapisuje ostrzeżenie w logu (0 = wyłączone)
+"""
+import contextvars
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+logger = logging.getLogger("StuMedica")
+
+DB_QUERY_COUNT_HEADER = os.getenv("DB_QUERY_COUNT_HEADER", "false").lower() == "true"
+DB_MAX_QUERIES_PER_REQUEST = int(os.getenv("DB_MAX_QUERIES_PER_REQUEST", "0"))
+QUERY_COUNT_HEADER = b"x-db-queries"
+
+_counter_var: contextvars.ContextVar[Optional["QueryCounter"]] = contextvars.ContextVar("query_counter", default=None)
+
+
+class TooManyQueries(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def add(self, statement: str):
+        with self._lock:
+            self.statements.append(statement)
+
+    def report(self) -> str:
+        return "\n".join(f"  {i + 1}. {' '.join(s.split())[:200]}" for i, s in enumerate(self.statements))
+
+
+@contextmanager
+def count_queries(max_statements: Optional[int] = None):
+    """Liczy zapytania SQL w bloku. Z max_statements - rzuca TooManyQueries, gdy limit zostanie przekroczony."""
+    counter = QueryCounter()
+    token = _counter_var.set(counter)
+    try:
+        yield counter
+    finally:
+        _counter_var.reset(token)
+
+    if max_statements is not None and counter.count > max_statements:
+        raise TooManyQueries(
+            f"Wykonano {counter.count} zapytań SQL (limit {max_statements}):\n{counter.report()}"
+        )
+
+
+def instrument_engine(engine):
+    """Rejestruje licznik dla zapytań silnika (dla AsyncEngine przekaż async_engine.sync_engine)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        counter = _counter_var.get()
+        if counter is not None:
+            counter.add(statement)
+
+
+class QueryCountMiddleware:
+    """Middleware ASGI: liczy zapytania każdego żądania (nagłówek X-DB-Queries i ostrzeżenie po przekroczeniu limitu)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (DB_QUERY_COUNT_HEADER or DB_MAX_QUERIES_PER_REQUEST):
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as counter:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and DB_QUERY_COUNT_HEADER:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (QUERY_COUNT_HEADER, str(counter.count).encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+        if DB_MAX_QUERIES_PER_REQUEST and counter.count > DB_MAX_QUERIES_PER_REQUEST:
+            route = getattr(scope.get("route"), "path", scope["path"])
+            logger.warning("Żądanie %s %s wykonało %s zapytań SQL (limit %s)", scope["method"], route,
+                           counter.count, DB_MAX_QUERIES_PER_REQUEST,
+                           extra={"db_queries": counter.count, "route": route})
@@ -1,15 +1,16 @@
 import os
-import faiss
-import numpy as np
 import logging
+import threading
 # from transformers import logging as hf_logging
 # from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 
-from google import genai
+if TYPE_CHECKING:
+    import numpy as np  # faiss i numpy importujemy dopiero przy budowie indeksu (app/startup.py)
+
+from app import llm
 
 KNOWLEDGE_DIR = "app/knowledge"
-EMBEDDING_MODEL = "gemini-embedding-001"
 
 # MODEL_NAME = "all-MiniLM-L6-v2"
 # hf_logging.set_verbosity_error()
@@ -21,44 +22,32 @@ class MiniRAG:
         print("RAG: Ładowanie modelu embeddingów...")
         # self.encoder = SentenceTransformer(MODEL_NAME)
 
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
+        self.client = llm.get_embedding_provider()
+        if self.client is None:
             logger.error("RAG: Brak klucza GOOGLE_API_KEY!")
-            self.client = None
-        else:
-            self.client = genai.Client(api_key=api_key)
 
         self.chunks: List[Dict[str, Any]] = []
         self.index = None
         self._build_index()
 
-    def _get_embedding(self, text: str) -> np.ndarray:
-        """Pobiera embedding z API Google."""
+    def _get_embedding(self, text: str) -> "np.ndarray":
+        """Pobiera embedding od dostawcy (Gemini lub atrapa)."""
         try:
-            result = self.client.models.embed_content(
-                model=EMBEDDING_MODEL,
-                contents=text
-            )
-            return np.array(result.embeddings[0].values, dtype='float32')
+            return self.client.embed([text])[0]
         except Exception as e:
-            logger.error(f"RAG: Błąd generowania embeddingu: {e}")
+            logger.error("RAG: Błąd generowania embeddingu: %s", e)
             return None
 
-    def _get_batch_embeddings(self, texts: List[str]) -> np.ndarray:
+    def _get_batch_embeddings(self, texts: List[str]) -> "np.ndarray":
         """Pobiera embeddingi dla listy tekstów (batch)."""
         try:
-            embeddings = []
-            for text in texts:
-                emb = self._get_embedding(text)
-                if emb is not None:
-                    embeddings.append(emb)
-
-            if not embeddings:
+            embeddings = self.client.embed(texts)
+            if len(embeddings) == 0:
                 return None
 
-            return np.vstack(embeddings)
+            return embeddings
         except Exception as e:
-            logger.error(f"RAG: Błąd batch embedding: {e}")
+            logger.error("RAG: Błąd batch embedding: %s", e)
             return None
 
     def _build_index(self):
@@ -115,6 +104,8 @@ class MiniRAG:
             print("RAG: Nie udało się pobrać embeddingów.")
             return
 
+        import faiss
+
         dimension = embeddings.shape[1]
         self.index = faiss.IndexFlatL2(dimension)
         self.index.add(embeddings)
@@ -152,4 +143,15 @@ class MiniRAG:
         return final_context
 
 
-rag_system = MiniRAG()
\ No newline at end of file
+_rag_system: Optional[MiniRAG] = None
+_rag_lock = threading.Lock()
+
+
+def get_rag_system() -> MiniRAG:
+    """Indeks wiedzy budowany raz na proces: w tle po starcie (RAG_WARMUP) albo przy pierwszym pytaniu."""
+    global _rag_system
+    if _rag_system is None:
+        with _rag_lock:
+            if _rag_system is None:
+                _rag_system = MiniRAG()
+    return _rag_system
@@ -0,0 +1,210 @@
+import math
+from abc import ABC, abstractmethod
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, status
+
+from app import metrics
+from app.dependencies import get_current_user
+from app.user_cache import UserSnapshot
+
+# Format limitu: "<liczba żądań>/<okno w sekundach>:<burst>", np. "10/60:5"
+DEFAULT_USER_LIMITS = {
+    "patient": os.getenv("CHAT_RATE_LIMIT_PATIENT", "10/60:5"),
+    "doctor": os.getenv("CHAT_RATE_LIMIT_DOCTOR", "30/60:10"),
+}
+DEFAULT_ACCOUNT_TYPE_LIMITS = {
+    "patient": os.getenv("CHAT_RATE_LIMIT_ALL_PATIENTS", "600/60:100"),
+    "doctor": os.getenv("CHAT_RATE_LIMIT_ALL_DOCTORS", "300/60:50"),
+}
+FALLBACK_ACCOUNT_TYPE = "patient"
+
+CHAT_MAX_IN_FLIGHT = int(os.getenv("CHAT_MAX_IN_FLIGHT", "16"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "memory" lub "redis"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+
+ADMISSIONS = metrics.REGISTRY.counter(
+    "stumedica_chat_admission_total", "Decyzje kontroli dostępu do /chat/ask", ("decision", "reason"))
+IN_FLIGHT = metrics.REGISTRY.gauge(
+    "stumedica_chat_in_flight", "Liczba trwających wywołań asystenta AI")
+
+
+@dataclass(frozen=True)
+class BucketLimit:
+    rate: float   # tokeny na sekundę
+    burst: float  # pojemność wiadra
+
+    @classmethod
+    def parse(cls, spec: str) -> "BucketLimit":
+        amount, rest = spec.split("/", 1)
+        window, _, burst = rest.partition(":")
+        rate = float(amount) / float(window)
+        return cls(rate=rate, burst=float(burst) if burst else float(amount))
+
+
+class RateLimitBackend(ABC):
+    """Interfejs magazynu stanu wiader. Zwraca (czy_wpuszczono, ile_sekund_czekać)."""
+
+    @abstractmethod
+    def acquire(self, key: str, limit: BucketLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        ...
+
+    def refund(self, key: str, limit: BucketLimit, cost: float = 1.0):
+        """Zwraca tokeny pobrane przez acquire (nadmiar ponad burst obetnie następne doliczanie)."""
+        self.acquire(key, limit, -cost)
+
+
+class InMemoryBackend(RateLimitBackend):
+    """Stan w pamięci procesu (każdy worker liczy osobno). Najstarsze klucze są usuwane po max_keys."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_keys = max_keys
+
+    def acquire(self, key: str, limit: BucketLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - last) * limit.rate)
+
+            if tokens >= cost:
+                allowed, retry_after = True, 0.0
+                tokens -= cost
+            else:
+                allowed, retry_after = False, (cost - tokens) / limit.rate
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+
+        return allowed, retry_after
+
+
+class RedisBackend(RateLimitBackend):
+    """Wspólny stan dla wielu workerów/hostów (wymaga pakietu `redis`)."""
+
+    _SCRIPT = """
+    local key = KEYS[1]
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = redis.call('TIME')
+    local now_s = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now_s
+    tokens = math.min(burst, tokens + (now_s - ts) * rate)
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= cost then
+        allowed = 1
+        tokens = tokens - cost
+    else
+        retry_after = (cost - tokens) / rate
+    end
+    redis.call('HSET', key, 'tokens', tokens, 'ts', now_s)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+    return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, url: str):
+        import redis  # opcjonalna zależność - tylko dla RATE_LIMIT_BACKEND=redis
+
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self._SCRIPT)
+
+    def acquire(self, key: str, limit: BucketLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        allowed, retry_after = self._script(keys=[f"rl:{key}"], args=[limit.rate, limit.burst, cost])
+        return bool(allowed), float(retry_after)
+
+
+def _create_backend() -> RateLimitBackend:
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend(RATE_LIMIT_REDIS_URL)
+    return InMemoryBackend()
+
+
+class ChatAdmission:
+    """Token bucket per użytkownik i per typ konta + globalny limit równoległych wywołań LLM."""
+
+    def __init__(self, backend: RateLimitBackend, user_limits: Dict[str, str],
+                 account_type_limits: Dict[str, str], max_in_flight: int):
+        self.backend = backend
+        self.user_limits = {k: BucketLimit.parse(v) for k, v in user_limits.items()}
+        self.account_type_limits = {k: BucketLimit.parse(v) for k, v in account_type_limits.items()}
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def _reject(self, reason: str, retry_after: float, status_code: int, detail: str):
+        ADMISSIONS.labels("rejected", reason).inc()
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    def check_rate(self, user_id: int, account_type: Optional[str]):
+        account_type = account_type if account_type in self.user_limits else FALLBACK_ACCOUNT_TYPE
+        user_key, user_limit = f"user:{user_id}", self.user_limits[account_type]
+
+        allowed, retry_after = self.backend.acquire(user_key, user_limit)
+        if not allowed:
+            self._reject("user_rate", retry_after, status.HTTP_429_TOO_MANY_REQUESTS,
+                         "Zbyt wiele zapytań do asystenta. Spróbuj ponownie za chwilę.")
+
+        type_limit = self.account_type_limits.get(account_type)
+        if type_limit is not None:
+            allowed, retry_after = self.backend.acquire(f"type:{account_type}", type_limit)
+            if not allowed:
+                # Zapytanie odrzucone przez wspólne wiadro nie zużywa limitu użytkownika
+                self.backend.refund(user_key, user_limit)
+                self._reject("account_type_rate", retry_after, status.HTTP_429_TOO_MANY_REQUESTS,
+                             "Asystent jest obecnie mocno obciążony. Spróbuj ponownie za chwilę.")
+
+    def enter(self, user_id: int, account_type: Optional[str]):
+        """Najpierw miejsce w puli, potem wiadra - odrzucone zapytanie nie zużywa tokenów."""
+        # Bez czekania - przy braku wolnych miejsc odrzucamy od razu zamiast kolejkować do timeoutu
+        if not self._slots.acquire(blocking=False):
+            self._reject("concurrency", 1, status.HTTP_503_SERVICE_UNAVAILABLE,
+                         "Asystent jest obecnie przeciążony. Spróbuj ponownie za chwilę.")
+        try:
+            self.check_rate(user_id, account_type)
+        except HTTPException:
+            self._slots.release()
+            raise
+        IN_FLIGHT.labels().inc()
+        ADMISSIONS.labels("admitted", "ok").inc()
+
+    def leave(self):
+        IN_FLIGHT.labels().dec()
+        self._slots.release()
+
+
+chat_admission = ChatAdmission(
+    backend=_create_backend(),
+    user_limits=DEFAULT_USER_LIMITS,
+    account_type_limits=DEFAULT_ACCOUNT_TYPE_LIMITS,
+    max_in_flight=CHAT_MAX_IN_FLIGHT,
+)
+
+
+def admit_chat_request(current_user: UserSnapshot = Depends(get_current_user)):
+    """Zależność dla /chat/ask: miejsce w puli równoległych wywołań LLM i limit zapytań.
+
+    Konto bez dostępu do AI nie zużywa wspólnego wiadra typu konta ani miejsca w puli - komunikat
+    o niedostępności zwraca sam endpoint.
+    """
+    if not current_user.ai_allowed:
+        yield
+        return
+    chat_admission.enter(current_user.id, current_user.account_type)
+    try:
+        yield
+    finally:
+        chat_admission.leave()
@@ -0,0 +1,193 @@
+"""Odczyty z replik bazy (DATABASE_REPLICA_URLS), zapisy na bazę główną.
+
+get_routed_db daje sesję, w której silnik jest wybierany dla każdego zapytania (RoutingSession.get_bind):
+- zapisy (flush, INSERT/UPDATE/DELETE) i wszystko po nich w tej samej sesji - baza główna
+  (do końca transakcji przez database.write_engine - w SQLite osobna pula jednego pisarza),
+- odczyty użytkownika, który zapisał coś w ostatnich REPLICA_READ_YOUR_WRITES_SECONDS - baza główna,
+- pozostałe odczyty - jedna ze zdrowych replik (ta sama do końca sesji), a gdy żadnej nie ma - baza główna.
+Repliki sprawdza okresowo run_health_checks() (połączenie i opóźnienie replikacji), a zerwane połączenie
+od razu wyłącza replikę do następnego sprawdzenia.
+Konto z tokenu (get_current_user) jest wczytywane przed ustaleniem użytkownika, więc zawsze może iść na replikę.
+Okno read-your-writes jest pamiętane w procesie - przy kilku workerach żądanie trafiające do innego workera
+może przez chwilę czytać z repliki.
+
+DATABASE_REPLICA_URLS - adresy replik oddzielone przecinkami (puste - wszystko na bazę główną)
+REPLICA_READ_YOUR_WRITES_SECONDS - jak długo po zapisie odczyty użytkownika idą na bazę główną
+REPLICA_HEALTH_CHECK_SECONDS - co ile sekund sprawdzać repliki
+REPLICA_MAX_LAG_SECONDS - replika opóźniona bardziej niż tyle sekund nie dostaje odczytów
+"""
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+from app import db_pool, metrics, tracing
+from app.database import async_engine, to_async_url, write_engine
+
+logger = logging.getLogger("StuMedica")
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_READ_YOUR_WRITES_SECONDS = float(os.getenv("REPLICA_READ_YOUR_WRITES_SECONDS", "5"))
+REPLICA_HEALTH_CHECK_SECONDS = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", "10"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "30"))
+HEALTH_CHECK_TIMEOUT = 5.0
+
+REPLICA_HEALTHY = metrics.REGISTRY.gauge(
+    "stumedica_db_replica_healthy", "1 - replika przyjmuje odczyty, 0 - wyłączona", ("replica",))
+REPLICA_LAG = metrics.REGISTRY.gauge(
+    "stumedica_db_replica_lag_seconds", "Opóźnienie replikacji z ostatniego sprawdzenia", ("replica",))
+ROUTED_STATEMENTS = metrics.REGISTRY.counter(
+    "stumedica_db_routed_statements_total", "Zapytania SQL sesji z routingiem wg bazy docelowej", ("target",))
+
+# Na replice bez ruchu pg_last_xact_replay_timestamp() stoi w miejscu - wtedy liczy się tylko, czy WAL jest odtworzony
+POSTGRES_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        is_postgres = make_url(url).get_backend_name() == "postgresql"
+        replica_url, options = db_pool.engine_options(
+            to_async_url(url), name, connect_args={"timeout": 15} if is_postgres else {}, is_async=True)
+        self.engine = create_async_engine(replica_url, **options)
+        db_pool.instrument_pool(self.engine.sync_engine, name)
+        self.lag_sql = POSTGRES_LAG_SQL if is_postgres else text("SELECT 0")
+        # Do pierwszego udanego sprawdzenia odczyty idą na bazę główną
+        self.healthy = False
+        REPLICA_HEALTHY.labels(name).set(0)
+
+        @event.listens_for(self.engine.sync_engine, "handle_error")
+        def _on_error(context):
+            if context.is_disconnect:
+                self.mark(False, "zerwane połączenie")
+
+    def mark(self, healthy: bool, reason: str = ""):
+        if healthy != self.healthy:
+            if healthy:
+                logger.info("Replika %s przyjmuje odczyty", self.name)
+            else:
+                logger.warning("Replika %s wyłączona z odczytów: %s", self.name, reason)
+        self.healthy = healthy
+        REPLICA_HEALTHY.labels(self.name).set(1 if healthy else 0)
+
+    async def check(self):
+        try:
+            async with self.engine.connect() as conn:
+                lag = float(await asyncio.wait_for(conn.scalar(self.lag_sql), HEALTH_CHECK_TIMEOUT))
+        except Exception as e:
+            self.mark(False, str(e) or type(e).__name__)
+            return
+        REPLICA_LAG.labels(self.name).set(lag)
+        if lag > REPLICA_MAX_LAG_SECONDS:
+            self.mark(False, f"opóźnienie {lag:.1f}s")
+        else:
+            self.mark(True)
+
+
+class ReplicaRouter:
+    def __init__(self, replicas: List[Replica]):
+        self.replicas = replicas
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._recent_writes: Dict[int, float] = {}
+
+    def record_write(self, user_id: int):
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[user_id] = now
+            if len(self._recent_writes) > 10_000:
+                cutoff = now - REPLICA_READ_YOUR_WRITES_SECONDS
+                self._recent_writes = {uid: t for uid, t in self._recent_writes.items() if t > cutoff}
+
+    def wrote_recently(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return False
+        written_at = self._recent_writes.get(user_id)
+        return written_at is not None and time.monotonic() - written_at < REPLICA_READ_YOUR_WRITES_SECONDS
+
+    def pick_replica(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._round_robin) % len(healthy)]
+
+
+router = ReplicaRouter([Replica(f"replica{i + 1}", url) for i, url in enumerate(DATABASE_REPLICA_URLS)])
+
+
+class RoutingSession(Session):
+    """Sesja wybierająca bazę dla każdego zapytania - zasady w opisie modułu."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["writing"] = True
+            self.info["wrote"] = True
+            self.info["primary"] = True
+
+        if self.info.get("writing"):
+            # Do końca transakcji z zapisem - to samo połączenie (widzi własne niezatwierdzone zmiany)
+            ROUTED_STATEMENTS.labels("primary").inc()
+            return write_engine.sync_engine
+
+        if not self.info.get("primary") and not router.wrote_recently(tracing.user_id_var.get()):
+            replica = self.info.get("replica")
+            if replica is None or not replica.healthy:
+                replica = self.info["replica"] = router.pick_replica()
+            if replica is not None:
+                ROUTED_STATEMENTS.labels(replica.name).inc()
+                return replica.engine.sync_engine
+
+        ROUTED_STATEMENTS.labels("primary").inc()
+        return async_engine.sync_engine
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_write(session):
+    session.info.pop("writing", None)
+    user_id = tracing.user_id_var.get()
+    if session.info.get("wrote") and user_id is not None:
+        router.record_write(user_id)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _end_write(session):
+    session.info.pop("writing", None)
+
+
+def use_primary(db: AsyncSession):
+    """Kolejne zapytania tej sesji idą na bazę główną (np. gdy replika mogła jeszcze nie dostać zapisu)."""
+    db.info["primary"] = True
+
+
+def used_replica(db: AsyncSession) -> bool:
+    return db.info.get("replica") is not None and not db.info.get("primary")
+
+
+RoutedSessionLocal = async_sessionmaker(sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False)
+
+
+async def get_routed_db():
+    async with RoutedSessionLocal() as db:
+        yield db
+
+
+async def run_health_checks():
+    """Zadanie tła: okresowe sprawdzanie replik."""
+    while True:
+        await asyncio.gather(*(replica.check() for replica in router.replicas))
+        await asyncio.sleep(REPLICA_HEALTH_CHECK_SECONDS)
@@ -1,70 +1,178 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+import base64
+from datetime import datetime, timezone
 
-from app import schemas, models
-from app.database import get_db
-from app.dependencies import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Response
+from pydantic import Field
+from sqlalchemy import extract, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
+from typing import Annotated, List, Literal, Optional
+
+from app import archive, availability, booking, schemas, models
+from app.replicas import get_routed_db
+from app.dependencies import get_current_user, get_current_user_id
+from app.user_cache import UserSnapshot
 
 router = APIRouter(
     prefix="/appointments",
     tags=["Appointments"]
 )
 
+SLOTS_DEFAULT_PAGE_SIZE = 50
+SLOTS_MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_cursor(appointment) -> str:
+    raw = f"{appointment.date_time.isoformat()}|{appointment.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date_time, appointment_id = raw.split("|")
+        return datetime.fromisoformat(date_time), int(appointment_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Nieprawidłowy kursor stronicowania")
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Data bez strefy czasowej jest traktowana jako UTC (tak samo w indeksie i w zapytaniu SQL)
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
 @router.get("/doctors", response_model=List[schemas.DoctorResponse])
-def get_doctors(
+async def get_doctors(
     specialization: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_routed_db)
 ):
-    query = db.query(models.Doctor)
+    query = select(models.Doctor)
     if specialization:
-        query = query.filter(models.Doctor.specialization == specialization)
-    return query.all()
+        query = query.where(models.Doctor.specialization == specialization)
+    return (await db.scalars(query)).all()
 
 
 @router.get("/slots", response_model=List[schemas.AppointmentResponse])
-def get_available_slots(
+async def get_available_slots(
+        response: Response,
         specialization: Optional[str] = None,
         doctor_id: Optional[int] = None,
-        db: Session = Depends(get_db)
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        price_min: Optional[float] = Query(None, ge=0),
+        price_max: Optional[float] = Query(None, ge=0),
+        visit_type: Optional[Literal["NFZ", "PRIVATE"]] = Query(None, alias="type"),
+        weekday: Optional[List[Annotated[int, Field(ge=1, le=7)]]] = Query(None),  # 1 = poniedziałek ... 7 = niedziela
+        hour_from: Optional[int] = Query(None, ge=0, le=23),
+        hour_to: Optional[int] = Query(None, ge=0, le=23),
+        first_per_doctor: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = Query(SLOTS_DEFAULT_PAGE_SIZE, ge=1, le=SLOTS_MAX_PAGE_SIZE),
+        db: AsyncSession = Depends(get_routed_db)
 ):
-    query = db.query(models.Appointment).filter(
-        models.Appointment.is_booked == False,
-        models.Appointment.date_time > datetime.now()
+    date_from, date_to = _as_utc(date_from), _as_utc(date_to)
+    after = _decode_cursor(cursor) if cursor else None
+    # Te same filtry dla indeksu i dla terminów z grafików (app/schedule.py)
+    filters = dict(
+        specialization=specialization, doctor_id=doctor_id, date_from=date_from, date_to=date_to,
+        price_min=price_min, price_max=price_max, visit_type=visit_type,
+        weekdays={day % 7 for day in weekday} if weekday else None,
+        hour_from=hour_from, hour_to=hour_to, first_per_doctor=first_per_doctor,
+        after=after, limit=limit + 1
     )
 
-    if doctor_id:
-        query = query.filter(models.Appointment.doctor_id == doctor_id)
+    if availability.AVAILABILITY_INDEX and availability.index.ready:
+        entries = availability.index.find(**filters)
+        if len(entries) > limit:
+            entries = entries[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(entries[-1])
+        return [entry.to_response() for entry in entries]
 
+    conditions = [
+        models.Appointment.is_booked == False,
+        models.Appointment.date_time > func.now()
+    ]
+    if doctor_id:
+        conditions.append(models.Appointment.doctor_id == doctor_id)
     if specialization:
-        query = query.join(models.Doctor).filter(models.Doctor.specialization == specialization)
+        conditions.append(models.Doctor.specialization == specialization)
+    if date_from:
+        conditions.append(models.Appointment.date_time >= date_from)
+    if date_to:
+        conditions.append(models.Appointment.date_time < date_to)
+    if price_min is not None:
+        conditions.append(models.Doctor.price_private >= price_min)
+    if price_max is not None:
+        conditions.append(models.Doctor.price_private <= price_max)
+    if visit_type:
+        conditions.append(models.Appointment.type == visit_type)
+    if weekday:
+        # dow: 0 = niedziela (Postgres i SQLite), w API numeracja ISO
+        conditions.append(extract("dow", models.Appointment.date_time).in_([day % 7 for day in weekday]))
+    if hour_from is not None:
+        conditions.append(extract("hour", models.Appointment.date_time) >= hour_from)
+    if hour_to is not None:
+        conditions.append(extract("hour", models.Appointment.date_time) <= hour_to)
+
+    # Lekarz jest w odpowiedzi - dołączamy go w tym samym zapytaniu (async nie doczytuje relacji leniwie)
+    query = select(models.Appointment).join(models.Appointment.doctor).options(
+        contains_eager(models.Appointment.doctor)
+    )
 
-    return query.order_by(models.Appointment.date_time).all()
+    if first_per_doctor:
+        # Najbliższy pasujący termin każdego lekarza
+        rank = func.row_number().over(
+            partition_by=models.Appointment.doctor_id,
+            order_by=(models.Appointment.date_time, models.Appointment.id)
+        )
+        ranked = select(models.Appointment.id, rank.label("rank")).join(models.Appointment.doctor).where(
+            *conditions
+        ).subquery()
+        query = query.join(ranked, ranked.c.id == models.Appointment.id).where(ranked.c.rank == 1)
+    else:
+        query = query.where(*conditions)
+
+    # Przy first_per_doctor kursor i limit dopiero po połączeniu z grafikami (najbliższy termin lekarza z obu źródeł)
+    if after and not first_per_doctor:
+        after_date_time, after_id = after
+        # Keyset: kolejna strona zaczyna się za ostatnim (date_time, id) - bez OFFSET, ten sam koszt dla każdej strony
+        query = query.where(
+            tuple_(models.Appointment.date_time, models.Appointment.id) > tuple_(after_date_time, after_id)
+        )
+
+    query = query.order_by(models.Appointment.date_time, models.Appointment.id)
+    if not first_per_doctor:
+        query = query.limit(limit + 1)
+    slots = (await db.scalars(query)).all()
+
+    virtual = await availability.find_virtual_slots(db, **filters)
+    slots = availability.merge_slots(slots, virtual, first_per_doctor=first_per_doctor, after=after, limit=limit + 1)
+
+    if len(slots) > limit:
+        slots = slots[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(slots[-1])
+
+    return [slot.to_response() if isinstance(slot, availability.SlotEntry) else slot for slot in slots]
 
 
 @router.post("/{appointment_id}/book", response_model=schemas.AppointmentResponse)
-def book_appointment(
+async def book_appointment(
         appointment_id: int,
         booking_data: schemas.AppointmentCreate,
         background_tasks: BackgroundTasks,
-        db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        db: AsyncSession = Depends(get_routed_db),
+        current_user: UserSnapshot = Depends(get_current_user)
 ):
-    appointment = db.query(models.Appointment).filter(
-        models.Appointment.id == appointment_id,
-        models.Appointment.is_booked == False
-    ).first()
+    result = await booking.book_slot(db, appointment_id, current_user.id, booking_data.notes)
 
-    if not appointment:
+    if result.status is booking.BookingStatus.CONFLICT:
+        raise HTTPException(status_code=409, detail="Termin został już zarezerwowany")
+    if not result.booked:
         raise HTTPException(status_code=404, detail="Termin niedostępny lub nie istnieje")
 
-    appointment.is_booked = True
-    appointment.patient_id = current_user.id
-    appointment.notes = booking_data.notes
-
-    db.commit()
-    db.refresh(appointment)
+    appointment = result.appointment
 
     # background_tasks.add_task(
     #     send_appointment_confirmation,
@@ -78,10 +186,9 @@ def book_appointment(
     return appointment
 
 @router.get("/my-history", response_model=List[schemas.AppointmentResponse])
-def get_my_appointments(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+async def get_my_appointments(
+    db: AsyncSession = Depends(get_routed_db),
+    user_id: int = Depends(get_current_user_id)
 ):
-    return db.query(models.Appointment).filter(
-        models.Appointment.patient_id == current_user.id
-    ).order_by(models.Appointment.date_time.desc()).all()
\ No newline at end of file
+    # Bieżące partycje appointments i archiwum minionych wizyt (app/archive.py) w jednym zapytaniu
+    return (await db.scalars(archive.patient_appointments(user_id))).all()
\ No newline at end of file
@@ -1,56 +1,115 @@
-from fastapi import APIRouter, HTTPException, Depends, Response, status
-from sqlalchemy.orm import Session
+from typing import Optional
 
-from app import security, models
-from app.database import get_db
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import hashing, models, tokens
+from app.database import get_async_db  # zawsze baza główna - bez replik (app/replicas.py), konto musi być widoczne od razu
 from app.dependencies import get_current_user
-from app.schemas import UserLogin, UserCreate
+from app.user_cache import UserSnapshot
+from app.schemas import RefreshRequest, UserLogin, UserCreate
 
 router = APIRouter(
     prefix="/auth",
     tags=["Authentication"]
 )
 
-@router.post("/login")
-def login(data: UserLogin, response: Response, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == data.email).first()
-
-    if not user or not security.verify_password(data.password, user.password_hash):
-        raise HTTPException(status_code=401, detail="Niepoprawne dane logowania.")
+REFRESH_COOKIE = "refresh_token"
 
-    access_token = security.create_access_token(data={"sub": user.email})
 
+def _set_token_cookies(response: Response, pair: tokens.TokenPair):
     response.set_cookie(
         key="access_token",
-        value=access_token,
+        value=pair.access_token,
         httponly=True,
         secure=True,  # True na produkcji (wymaga HTTPS), False na localhost
         samesite="lax",  # Zabezpieczenie CSRF
-        max_age=7 * 24 * 3600
+        max_age=int(tokens.ACCESS_TOKEN_MINUTES * 60)
     )
+    response.set_cookie(
+        key=REFRESH_COOKIE,
+        value=pair.refresh_token,
+        httponly=True,
+        secure=True,
+        samesite="strict",
+        path="/auth",  # wysyłane tylko do /auth/refresh i /auth/logout
+        max_age=int(tokens.REFRESH_TOKEN_DAYS * 24 * 3600)
+    )
+
+
+def _refresh_token(request: Request, data: Optional[RefreshRequest]) -> Optional[str]:
+    return (data.refresh_token if data else None) or request.cookies.get(REFRESH_COOKIE)
+
+
+@router.post("/login")
+async def login(data: UserLogin, response: Response, db: AsyncSession = Depends(get_async_db)):
+    # Licznik zmian kont przed kontem - claimy tokenu nie mogą być nowsze niż zapisany w nim ver (app/tokens.py)
+    version = await tokens.users_version(db)
+    user = await db.scalar(select(models.User).where(models.User.email == data.email))
+
+    # Argon2 celowo obciąża CPU i pamięć - liczy go ograniczona pula (app/hashing.py), przy pełnej kolejce 503
+    if not user:
+        await hashing.verify_unknown_user(data.password)
+        raise HTTPException(status_code=401, detail="Niepoprawne dane logowania.")
+
+    valid, new_hash = await hashing.verify_password(data.password, user.password_hash)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Niepoprawne dane logowania.")
+    if user.is_active is False:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Konto jest nieaktywne")
+    if new_hash is not None:
+        # Hasz sprzed zmiany parametrów Argon2 - zapisujemy przeliczony (razem z tokenem odświeżania)
+        user.password_hash = new_hash
+
+    pair = await tokens.issue_tokens(db, user, version)
+    _set_token_cookies(response, pair)
 
     return {
         "success": True,
         "message": "Zalogowano",
-        "token": access_token,
+        "token": pair.access_token,
+        "refresh_token": pair.refresh_token,
+        "expires_in": int(tokens.ACCESS_TOKEN_MINUTES * 60),
         "user": user.name
     }
 
+@router.post("/refresh")
+async def refresh(request: Request, response: Response, data: Optional[RefreshRequest] = None,
+                  db: AsyncSession = Depends(get_async_db)):
+    refresh_token = _refresh_token(request, data)
+    pair = await tokens.rotate(db, refresh_token) if refresh_token else None
+    if pair is None:
+        raise HTTPException(status_code=401, detail="Sesja wygasła. Zaloguj się ponownie.")
+
+    _set_token_cookies(response, pair)
+    return {
+        "success": True,
+        "token": pair.access_token,
+        "refresh_token": pair.refresh_token,
+        "expires_in": int(tokens.ACCESS_TOKEN_MINUTES * 60)
+    }
+
 @router.post("/logout")
-def logout(response: Response):
+async def logout(request: Request, response: Response, data: Optional[RefreshRequest] = None,
+                 db: AsyncSession = Depends(get_async_db)):
+    refresh_token = _refresh_token(request, data)
+    if refresh_token:
+        await tokens.revoke(db, refresh_token)
     response.delete_cookie("access_token")
+    response.delete_cookie(REFRESH_COOKIE, path="/auth")
     return {"success": True, "message": "Wylogowano"}
 
 @router.post("/register")
-def register(data: UserCreate, db: Session = Depends(get_db)):
+async def register(data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     clean_name = " ".join(data.name.split())
     clean_email = data.email.strip().replace(" ", "")
 
-    existing_user = db.query(models.User).filter(models.User.email == clean_email).first()
+    existing_user = await db.scalar(select(models.User).where(models.User.email == clean_email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email zajęty")
 
-    password_hash = security.get_password_hash(data.password)
+    password_hash = await hashing.hash_password(data.password)
 
     new_user = models.User(
         name=clean_name,
@@ -62,17 +121,16 @@ def register(data: UserCreate, db: Session = Depends(get_db)):
 
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
     except Exception as e:
         print(f"Error: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Błąd podczas tworzenia konta")
 
     return {"success": True, "message": "Utworzono konto"}
 
 @router.get("/me")
-async def get_me(current_user: models.User = Depends(get_current_user)):
+async def get_me(current_user: UserSnapshot = Depends(get_current_user)):
     return {
         "success": True,
         "name": current_user.name,
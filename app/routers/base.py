@@ -1,8 +1,15 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import HTMLResponse
+import os
+import secrets
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse
+
+from app import metrics
 
 router = APIRouter(tags=["General"])
 
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 @router.get("/", response_class=HTMLResponse)
 async def main_site_html():
     return """
@@ -26,6 +33,20 @@ async def main_site_html():
 async def get_test_value():
     return {"success": True, "message": "Welcome to the StuMedica API!"}
 
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def prometheus_metrics(request: Request):
+    """Metryki w formacie Prometheusa. Jeśli ustawiono METRICS_TOKEN, wymagany jest nagłówek Bearer."""
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if not secrets.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Brak autoryzacji")
+
+    return PlainTextResponse(
+        metrics.render_prometheus(metrics.collect()),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 # @router.post("/send-test")
 # async def send_test_email_endpoint(request: EmailRequest):
 #     try:
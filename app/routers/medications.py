@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from app import schemas, models
-from app.database import get_db
-from app.dependencies import get_current_user
+from app.replicas import get_routed_db
+from app.dependencies import get_current_user_id
 
 router = APIRouter(
     prefix="/medications",
@@ -12,66 +13,66 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=List[schemas.MedicationResponse])
-def get_medications(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+async def get_medications(
+    db: AsyncSession = Depends(get_routed_db),
+    user_id: int = Depends(get_current_user_id)
 ):
-    return db.query(models.Medication).filter(
-        models.Medication.user_id == current_user.id,
+    return (await db.scalars(select(models.Medication).where(
+        models.Medication.user_id == user_id,
         models.Medication.is_active == True
-    ).all()
+    ))).all()
 
 @router.post("/", response_model=schemas.MedicationResponse)
-def create_medication(
+async def create_medication(
     medication: schemas.MedicationCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_routed_db),
+    user_id: int = Depends(get_current_user_id)
 ):
     new_med = models.Medication(
         **medication.model_dump(),
-        user_id=current_user.id
+        user_id=user_id
     )
     db.add(new_med)
-    db.commit()
-    db.refresh(new_med)
+    await db.commit()
+    await db.refresh(new_med)
     return new_med
 
 @router.put("/{med_id}", response_model=schemas.MedicationResponse)
-def update_medication(
+async def update_medication(
         med_id: int,
         medication_update: schemas.MedicationCreate,
-        db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        db: AsyncSession = Depends(get_routed_db),
+        user_id: int = Depends(get_current_user_id)
 ):
-    med_query = db.query(models.Medication).filter(
-        models.Medication.id == med_id,
-        models.Medication.user_id == current_user.id
+    # Jedno zapytanie zamiast SELECT + UPDATE + odświeżenia
+    db_med = await db.scalar(
+        update(models.Medication).where(
+            models.Medication.id == med_id,
+            models.Medication.user_id == user_id
+        ).values(**medication_update.model_dump()).returning(models.Medication),
+        execution_options={"synchronize_session": False}
     )
-
-    db_med = med_query.first()
     if not db_med:
         raise HTTPException(status_code=404, detail="Lek nie znaleziony")
 
-    med_query.update(medication_update.model_dump(), synchronize_session=False)
-    db.commit()
-    db.refresh(db_med)
+    await db.commit()
     return db_med
 
 @router.delete("/{med_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_medication(
+async def delete_medication(
         med_id: int,
-        db: Session = Depends(get_db),
-        current_user: models.User = Depends(get_current_user)
+        db: AsyncSession = Depends(get_routed_db),
+        user_id: int = Depends(get_current_user_id)
 ):
-    med_query = db.query(models.Medication).filter(
-        models.Medication.id == med_id,
-        models.Medication.user_id == current_user.id
+    result = await db.execute(
+        delete(models.Medication).where(
+            models.Medication.id == med_id,
+            models.Medication.user_id == user_id
+        ),
+        execution_options={"synchronize_session": False}
     )
-
-    med = med_query.first()
-    if not med:
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Lek nie znaleziony")
 
-    med_query.delete(synchronize_session=False)
-    db.commit()
+    await db.commit()
     return None
\ No newline at end of file
@@ -0,0 +1,156 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import availability, models, schedule, schemas
+from app.dependencies import get_current_doctor
+from app.replicas import get_routed_db
+
+router = APIRouter(
+    prefix="/schedule",
+    tags=["Schedule"]
+)
+
+
+def _refresh_availability(background_tasks: BackgroundTasks):
+    # Nowy grafik widoczny w wyszukiwaniu od razu, a nie po najbliższej synchronizacji indeksu
+    if availability.AVAILABILITY_INDEX:
+        background_tasks.add_task(availability.reconcile)
+
+
+async def _ensure_no_overlap(db: AsyncSession, doctor_id: int, template: schemas.ScheduleTemplateCreate,
+                             template_id: Optional[int] = None):
+    """Nakładające się szablony dałyby wizyty zachodzące na siebie - jeden przedział godzin na raz."""
+    existing = (await db.scalars(select(models.ScheduleTemplate).where(
+        models.ScheduleTemplate.doctor_id == doctor_id,
+        models.ScheduleTemplate.weekday == template.weekday,
+        models.ScheduleTemplate.id != template_id
+    ))).all()
+    for other in existing:
+        same_period = ((other.valid_to is None or template.valid_from is None or template.valid_from <= other.valid_to)
+                       and (template.valid_to is None or other.valid_from is None
+                            or other.valid_from <= template.valid_to))
+        if same_period and template.start_time < other.end_time and other.start_time < template.end_time:
+            raise HTTPException(status_code=409, detail=f"Godziny nakładają się na szablon {other.id}")
+
+
+@router.get("/templates", response_model=List[schemas.ScheduleTemplateResponse])
+async def get_templates(
+    db: AsyncSession = Depends(get_routed_db),
+    doctor: models.Doctor = Depends(get_current_doctor)
+):
+    return (await db.scalars(
+        select(models.ScheduleTemplate).where(models.ScheduleTemplate.doctor_id == doctor.id)
+        .order_by(models.ScheduleTemplate.weekday, models.ScheduleTemplate.start_time)
+    )).all()
+
+@router.post("/templates", response_model=schemas.ScheduleTemplateResponse)
+async def create_template(
+    template: schemas.ScheduleTemplateCreate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_routed_db),
+    doctor: models.Doctor = Depends(get_current_doctor)
+):
+    await _ensure_no_overlap(db, doctor.id, template)
+    new_template = models.ScheduleTemplate(**template.model_dump(), doctor_id=doctor.id)
+    db.add(new_template)
+    await db.commit()
+    _refresh_availability(background_tasks)
+    return new_template
+
+@router.put("/templates/{template_id}", response_model=schemas.ScheduleTemplateResponse)
+async def update_template(
+    template_id: int,
+    template: schemas.ScheduleTemplateCreate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_routed_db),
+    doctor: models.Doctor = Depends(get_current_doctor)
+):
+    db_template = await db.scalar(select(models.ScheduleTemplate).where(
+        models.ScheduleTemplate.id == template_id,
+        models.ScheduleTemplate.doctor_id == doctor.id
+    ))
+    if not db_template:
+        raise HTTPException(status_code=404, detail="Szablon nie znaleziony")
+
+    await _ensure_no_overlap(db, doctor.id, template, template_id)
+    for field, value in template.model_dump().items():
+        setattr(db_template, field, value)
+    await db.commit()
+    _refresh_availability(background_tasks)
+    return db_template
+
+@router.delete("/templates/{template_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_template(
+    template_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_routed_db),
+    doctor: models.Doctor = Depends(get_current_doctor)
+):
+    # Zarezerwowane wizyty zostają - mają własne wiersze w appointments
+    result = await db.execute(
+        delete(models.ScheduleTemplate).where(
+            models.ScheduleTemplate.id == template_id,
+            models.ScheduleTemplate.doctor_id == doctor.id
+        ),
+        execution_options={"synchronize_session": False}
+    )
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Szablon nie znaleziony")
+
+    await db.commit()
+    _refresh_availability(background_tasks)
+    return None
+
+
+@router.get("/exceptions", response_model=List[schemas.ScheduleExceptionResponse])
+async def get_exceptions(
+    db: AsyncSession = Depends(get_routed_db),
+    doctor: models.Doctor = Depends(get_current_doctor)
+):
+    """Nadchodzące dni i godziny bez przyjęć."""
+    today = datetime.now(schedule.CLINIC_TIMEZONE).date()
+    return (await db.scalars(
+        select(models.ScheduleException).where(
+            models.ScheduleException.doctor_id == doctor.id,
+            models.ScheduleException.date >= today
+        ).order_by(models.ScheduleException.date, models.ScheduleException.start_time)
+    )).all()
+
+@router.post("/exceptions", response_model=schemas.ScheduleExceptionResponse)
+async def create_exception(
+    exception: schemas.ScheduleExceptionCreate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_routed_db),
+    doctor: models.Doctor = Depends(get_current_doctor)
+):
+    # Wyjątek ukrywa wolne terminy z grafiku - już zarezerwowane wizyty trzeba odwołać osobno
+    new_exception = models.ScheduleException(**exception.model_dump(), doctor_id=doctor.id)
+    db.add(new_exception)
+    await db.commit()
+    _refresh_availability(background_tasks)
+    return new_exception
+
+@router.delete("/exceptions/{exception_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_exception(
+    exception_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_routed_db),
+    doctor: models.Doctor = Depends(get_current_doctor)
+):
+    result = await db.execute(
+        delete(models.ScheduleException).where(
+            models.ScheduleException.id == exception_id,
+            models.ScheduleException.doctor_id == doctor.id
+        ),
+        execution_options={"synchronize_session": False}
+    )
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Wyjątek nie znaleziony")
+
+    await db.commit()
+    _refresh_availability(background_tasks)
+    return None
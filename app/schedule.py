@@ -0,0 +1,127 @@
+"""Grafiki lekarzy: tygodniowe godziny przyjęć (ScheduleTemplate) i wyjątki - urlopy, święta (ScheduleException).
+
+Wolne terminy z grafiku nie są zapisywane w bazie - Schedule liczy je na bieżąco z szablonów i wyjątków,
+a app/availability.py odejmuje terminy już zapisane w appointments. Wiersz powstaje dopiero przy rezerwacji
+(app/booking.py), więc rozmiar tabeli zależy od liczby rezerwacji, a nie od długości kalendarza.
+Termin z grafiku ma ujemne id zakodowane z (lekarz, godzina) - działa z tym samym endpointem rezerwacji
+i kursorem stronicowania co terminy zapisane w tabeli.
+
+CLINIC_TIMEZONE - strefa czasowa godzin w grafikach (domyślnie Europe/Warsaw)
+SCHEDULE_HORIZON_DAYS - na ile dni naprzód pokazywać terminy z grafików (domyślnie 90)
+"""
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+CLINIC_TIMEZONE = ZoneInfo(os.getenv("CLINIC_TIMEZONE", "Europe/Warsaw"))
+SCHEDULE_HORIZON_DAYS = int(os.getenv("SCHEDULE_HORIZON_DAYS", "90"))
+
+# id = -(doctor_id * 2^32 + minuty od 1970) - mieści się w liczbach całkowitych JSON-a (2^53) do ok. 2 mln lekarzy
+_DOCTOR_ID_SHIFT = 2 ** 32
+
+
+def virtual_slot_id(doctor_id: int, date_time: datetime) -> int:
+    return -(doctor_id * _DOCTOR_ID_SHIFT + int(date_time.timestamp()) // 60)
+
+
+def decode_virtual_slot_id(slot_id: int) -> Optional[Tuple[int, datetime]]:
+    """(lekarz, godzina w UTC) dla terminu z grafiku, None dla id wiersza z tabeli albo id spoza zakresu."""
+    if slot_id >= 0:
+        return None
+    doctor_id, minutes = divmod(-slot_id, _DOCTOR_ID_SHIFT)
+    try:
+        return doctor_id, datetime.fromtimestamp(minutes * 60, timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def horizon_end(now: datetime) -> datetime:
+    return now + timedelta(days=SCHEDULE_HORIZON_DAYS)
+
+
+@dataclass(frozen=True)
+class _Hours:
+    start: time
+    end: time
+    slot_minutes: int
+    type: str
+    valid_from: Optional[date]
+    valid_to: Optional[date]
+
+
+class Schedule:
+    """Szablony i wyjątki wybranych lekarzy - kopia niezależna od sesji, można ją trzymać w pamięci."""
+
+    def __init__(self, templates: Iterable[models.ScheduleTemplate], exceptions: Iterable[models.ScheduleException]):
+        self._hours: Dict[int, Dict[int, List[_Hours]]] = {}
+        for t in templates:
+            self._hours.setdefault(t.doctor_id, {}).setdefault(t.weekday, []).append(
+                _Hours(t.start_time, t.end_time, t.slot_minutes, t.type, t.valid_from, t.valid_to))
+        self._blocked: Dict[Tuple[int, date], List[Tuple[Optional[time], Optional[time]]]] = {}
+        for e in exceptions:
+            self._blocked.setdefault((e.doctor_id, e.date), []).append((e.start_time, e.end_time))
+
+    @property
+    def doctor_ids(self) -> List[int]:
+        return list(self._hours)
+
+    def day_slots(self, doctor_id: int, day: date) -> List[Tuple[datetime, str]]:
+        """Terminy lekarza w dniu (data lokalna przychodni) jako (godzina w UTC, typ), po kolei."""
+        blocked = self._blocked.get((doctor_id, day), ())
+        slots: Dict[datetime, str] = {}
+        for hours in self._hours.get(doctor_id, {}).get(day.isoweekday(), ()):
+            if (hours.valid_from and day < hours.valid_from) or (hours.valid_to and day > hours.valid_to):
+                continue
+            step = timedelta(minutes=hours.slot_minutes)
+            start, end = datetime.combine(day, hours.start), datetime.combine(day, hours.end)
+            while start + step <= end:
+                if not any(_overlaps(start, start + step, day, block) for block in blocked):
+                    slots.setdefault(start, hours.type)
+                start += step
+        return sorted((local.replace(tzinfo=CLINIC_TIMEZONE).astimezone(timezone.utc), slot_type)
+                      for local, slot_type in slots.items())
+
+    def slot_times(self, doctor_id: int, start: datetime, end: datetime) -> Iterator[Tuple[datetime, str]]:
+        """Terminy z przedziału [start, end) po kolei - liczone dzień po dniu, dopiero gdy są potrzebne."""
+        day = start.astimezone(CLINIC_TIMEZONE).date()
+        last_day = end.astimezone(CLINIC_TIMEZONE).date()
+        while day <= last_day:
+            for slot_time, slot_type in self.day_slots(doctor_id, day):
+                if start <= slot_time < end:
+                    yield slot_time, slot_type
+            day += timedelta(days=1)
+
+    def slot_type(self, doctor_id: int, date_time: datetime) -> Optional[str]:
+        """Typ wizyty, jeśli grafik ma termin o tej godzinie, inaczej None."""
+        for slot_time, slot_type in self.day_slots(doctor_id, date_time.astimezone(CLINIC_TIMEZONE).date()):
+            if slot_time == date_time:
+                return slot_type
+        return None
+
+
+def _overlaps(start: datetime, end: datetime, day: date, block: Tuple[Optional[time], Optional[time]]) -> bool:
+    block_start, block_end = block
+    if block_start is None and block_end is None:
+        return True
+    block_start = datetime.combine(day, block_start or time.min)
+    block_end = datetime.combine(day, block_end) if block_end else datetime.combine(day + timedelta(days=1), time.min)
+    return start < block_end and block_start < end
+
+
+async def load_doctor_schedule(db: AsyncSession, doctor_id: int, day: date) -> Schedule:
+    """Grafik jednego lekarza z wyjątkami w danym dniu - do sprawdzenia terminu przy rezerwacji."""
+    templates = (await db.scalars(
+        select(models.ScheduleTemplate).where(models.ScheduleTemplate.doctor_id == doctor_id)
+    )).all()
+    exceptions = (await db.scalars(
+        select(models.ScheduleException).where(
+            models.ScheduleException.doctor_id == doctor_id, models.ScheduleException.date == day)
+    )).all()
+    return Schedule(templates, exceptions)
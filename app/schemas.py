@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, field_validator
-from typing import List, Optional
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+from typing import List, Literal, Optional
+from datetime import date, datetime, time, timedelta
 import re
 
 class UserBase(BaseModel):
@@ -15,6 +15,10 @@ class UserCreate(UserBase):
 class UserLogin(UserBase):
     password: str
 
+class RefreshRequest(BaseModel):
+    # Bez pola - token z ciasteczka refresh_token
+    refresh_token: Optional[str] = None
+
 
 class MedicationBase(BaseModel):
     name: str
@@ -75,4 +79,56 @@ class AppointmentResponse(AppointmentBase):
 
 
 class EmailRequest(BaseModel):
-    email: EmailStr
\ No newline at end of file
+    email: EmailStr
+
+
+# Pole "date" wyjątku w grafiku zasłania w klasie typ date
+Date = date
+
+
+class ScheduleTemplateCreate(BaseModel):
+    weekday: int = Field(ge=1, le=7)  # 1 = poniedziałek ... 7 = niedziela
+    start_time: time  # Godziny lokalne przychodni
+    end_time: time
+    slot_minutes: int = Field(30, ge=5, le=240)
+    type: Literal["NFZ", "PRIVATE"] = "PRIVATE"
+    valid_from: Optional[date] = None
+    valid_to: Optional[date] = None
+
+    @model_validator(mode="after")
+    def validate_hours(self):
+        length = datetime.combine(date.min, self.end_time) - datetime.combine(date.min, self.start_time)
+        if length < timedelta(minutes=self.slot_minutes):
+            raise ValueError("Godziny przyjęć muszą mieścić co najmniej jedną wizytę (end_time po start_time)")
+        if self.valid_from and self.valid_to and self.valid_to < self.valid_from:
+            raise ValueError("valid_to nie może być wcześniejsze niż valid_from")
+        return self
+
+
+class ScheduleTemplateResponse(ScheduleTemplateCreate):
+    id: int
+    doctor_id: int
+
+    class Config:
+        from_attributes = True
+
+
+class ScheduleExceptionCreate(BaseModel):
+    date: Date
+    start_time: Optional[time] = None  # Bez godzin - cały dzień bez przyjęć
+    end_time: Optional[time] = None
+    reason: Optional[str] = Field(None, max_length=200)
+
+    @model_validator(mode="after")
+    def validate_hours(self):
+        if self.start_time and self.end_time and self.end_time <= self.start_time:
+            raise ValueError("end_time musi być po start_time")
+        return self
+
+
+class ScheduleExceptionResponse(ScheduleExceptionCreate):
+    id: int
+    doctor_id: int
+
+    class Config:
+        from_attributes = True
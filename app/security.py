@@ -1,5 +1,5 @@
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from jose import jwt
 from dotenv import load_dotenv  # <--- Import
@@ -11,12 +11,17 @@ if not SECRET_KEY:
 
 ALGORITHM = "HS256"
 
+# Zmiana parametrów nie unieważnia haseł - stare hasze są przeliczane przy najbliższym logowaniu (app/hashing.py)
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "2"))
+
 pwd_context = CryptContext(
     schemes=["argon2"],
     default="argon2",
-    argon2__time_cost=3,
-    argon2__memory_cost=65536,
-    argon2__parallelism=2,
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
     bcrypt__rounds=12,
     deprecated="auto"
 )
@@ -24,14 +29,19 @@ pwd_context = CryptContext(
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password, hashed_password):
+    """(czy hasło pasuje, nowy hasz albo None) - nowy, gdy hasz ma inne parametry niż pwd_context."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def create_access_token(data: dict):
+def create_access_token(data: dict, expires_delta: timedelta):
     to_encode = data.copy()
 
-    expire = datetime.now() + timedelta(days=7)
+    # Strefa UTC - naiwne datetime.now() przesuwało exp o różnicę strefy serwera
+    expire = datetime.now(timezone.utc) + expires_delta
     to_encode.update({"exp": expire})
 
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
@@ -0,0 +1,285 @@
+"""Generator danych: lekarze, terminy (wolne i zarezerwowane), pacjenci i ich leki - do seedowania i testów obciążeniowych.
+
+Wiersze trafiają do bazy partiami (--batch-size): w Postgresie przez COPY (terminy i pacjenci przez tabelę
+tymczasową i INSERT ... ON CONFLICT DO NOTHING), w SQLite przez wielowierszowe INSERT ... ON CONFLICT DO NOTHING.
+Te same parametry i --seed dają te same dane, a ponowne uruchomienie nie dubluje terminów, pacjentów ani leków.
+
+Przykłady:
+    python -m app.seed                      # 5 lekarzy, terminy na 60 dni od dziś
+    python -m app.seed --start 2026-01-01 --end 2026-12-31 --doctors 2000 --slot-minutes 30 \\
+        --patients 200000 --medications 2 --booked 0.3 --seed 7
+"""
+import argparse
+import io
+import json
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import JSON, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import models
+from app.database import engine
+from app.migrate import upgrade_database
+from app.security import get_password_hash
+
+DOCTORS = [
+    ("dr n. med. Anna Nowak", "Kardiolog", 200.0),
+    ("lek. Piotr Kowalski", "Internista", 150.0),
+    ("dr Janusz Malinowski", "Stomatolog", 250.0),
+    ("lek. Maria Wiśniewska", "Dermatolog", 180.0),
+    ("dr Adam Zieliński", "Okulista", 160.0),
+]
+SPECIALIZATIONS = ["Kardiolog", "Internista", "Stomatolog", "Dermatolog", "Okulista",
+                   "Neurolog", "Pediatra", "Ortopeda", "Laryngolog", "Ginekolog"]
+MEDICATIONS = [("Metformina", "500 mg"), ("Ramipril", "5 mg"), ("Atorwastatyna", "20 mg"), ("Euthyrox", "50 µg"),
+               ("Bisoprolol", "2,5 mg"), ("Omeprazol", "20 mg"), ("Witamina D3", "2000 j.m.")]
+REMINDERS = [[], ["08:00"], ["08:00", "20:00"], ["07:30", "13:30", "19:30"]]
+VISIT_NOTES = ["Wizyta kontrolna", "Ból głowy", "Wyniki badań", "Recepta", None]
+# Po domenie rozpoznajemy wygenerowanych pacjentów przy kolejnych uruchomieniach
+PATIENT_EMAIL_DOMAIN = "seed.stumedica.pl"
+
+
+def patient_email(number: int) -> str:
+    return f"pacjent{number:07d}@{PATIENT_EMAIL_DOMAIN}"
+
+
+def _batches(rows: Iterable[Sequence], size: int) -> Iterator[List[Sequence]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BulkWriter:
+    """Wstawianie partiami: COPY w Postgresie, wielowierszowy INSERT w pozostałych bazach."""
+
+    def __init__(self, bind, batch_size: int, use_copy: bool = True):
+        self.engine = bind
+        self.batch_size = batch_size
+        self.use_copy = use_copy and bind.dialect.name == "postgresql"
+        if bind.dialect.name not in ("postgresql", "sqlite"):
+            raise ValueError(f"Nieobsługiwana baza: {bind.dialect.name}")
+
+    def write(self, table, columns: Sequence[str], rows: Iterable[Sequence],
+              conflict: Optional[Sequence[str]] = None) -> int:
+        """Wstawia krotki (w kolejności columns); przy conflict pomija wiersze łamiące ten unikalny klucz.
+
+        Zwraca liczbę nowych wierszy.
+        """
+        batches = _batches(rows, self.batch_size)
+        if self.use_copy:
+            return self._copy(table, columns, batches, conflict)
+        return self._insert(table, columns, batches, conflict)
+
+    def _insert(self, table, columns, batches, conflict) -> int:
+        insert = postgresql.insert if self.engine.dialect.name == "postgresql" else sqlite.insert
+        # rowcount przy executemany obejmuje tylko ostatnią stronę INSERT-ów - wstawione wiersze liczy RETURNING
+        statement = insert(table).returning(table.c.id)
+        if conflict:
+            statement = statement.on_conflict_do_nothing(index_elements=list(conflict))
+        inserted = 0
+        for batch in batches:
+            with self.engine.begin() as conn:
+                inserted += len(conn.execute(statement, [dict(zip(columns, row)) for row in batch]).all())
+        return inserted
+
+    def _copy(self, table, columns, batches, conflict) -> int:
+        column_list = ", ".join(columns)
+        json_columns = {i for i, name in enumerate(columns) if isinstance(table.c[name].type, JSON)}
+        target = table.name
+        raw = self.engine.raw_connection()
+        inserted = 0
+        try:
+            cursor = raw.cursor()
+            if conflict:
+                # Bez kolumn z sekwencją - tabela tymczasowa nie zużywa identyfikatorów
+                target = f"seed_{table.name}"
+                cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {target} ON COMMIT DELETE ROWS AS "
+                               f"SELECT {column_list} FROM {table.name} WITH NO DATA")
+            for batch in batches:
+                buffer = io.StringIO()
+                for row in batch:
+                    if json_columns:
+                        row = [json.dumps(v) if i in json_columns else v for i, v in enumerate(row)]
+                    # Wartości pochodzą z generatora - bez tabulatorów, nowych linii i odwrotnych ukośników
+                    buffer.write("\t".join([r"\N" if v is None else str(v) for v in row]))
+                    buffer.write("\n")
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY {target} ({column_list}) FROM STDIN", buffer)
+                if conflict:
+                    cursor.execute(f"INSERT INTO {table.name} ({column_list}) SELECT {column_list} FROM {target} "
+                                   f"ON CONFLICT ({', '.join(conflict)}) DO NOTHING")
+                inserted += cursor.rowcount
+                raw.commit()
+        finally:
+            raw.close()
+        return inserted
+
+
+def doctor_rows(count: int):
+    """Lekarze z dotychczasowego seed_appointments.py, a po nich syntetyczni (specjalizacje po kolei)."""
+    for number in range(count):
+        if number < len(DOCTORS):
+            yield DOCTORS[number]
+        else:
+            yield (f"lek. Lekarz {number:05d}", SPECIALIZATIONS[number % len(SPECIALIZATIONS)],
+                   100.0 + (number * 37 % 20) * 10)
+
+
+def ensure_doctors(writer: BulkWriter, count: int) -> List[int]:
+    """Id lekarzy w kolejności generatora - brakujący (po nazwie) są dodawani."""
+    wanted = list(doctor_rows(count))
+
+    def existing() -> Dict[str, int]:
+        with engine.connect() as conn:
+            rows = conn.execute(select(models.Doctor.name, func.min(models.Doctor.id)).group_by(models.Doctor.name))
+            return dict(rows.all())
+
+    known = existing()
+    missing = [row for row in wanted if row[0] not in known]
+    if missing:
+        writer.write(models.Doctor.__table__, ("name", "specialization", "price_private"), missing)
+        known = existing()
+    print(f"Lekarze: {len(wanted)} (nowi: {len(missing)})")
+    return [known[name] for name, _, _ in wanted]
+
+
+def ensure_patients(writer: BulkWriter, count: int, password: str) -> List[int]:
+    """Id pacjentów pacjent0000000@... w kolejności numerów. Hasło jest hashowane raz, wspólne dla wszystkich."""
+    if count == 0:
+        return []
+    password_hash = get_password_hash(password)
+    rows = ((f"Pacjent {number:07d}", patient_email(number), password_hash, "patient", False, True)
+            for number in range(count))
+    inserted = writer.write(models.User.__table__,
+                            ("name", "email", "password_hash", "account_type", "ai_allowed", "is_active"),
+                            rows, conflict=("email",))
+    with engine.connect() as conn:
+        ids = dict(conn.execute(select(models.User.email, models.User.id)
+                                .where(models.User.email.like(f"%@{PATIENT_EMAIL_DOMAIN}"))).all())
+    print(f"Pacjenci: {count} (nowi: {inserted})")
+    return [ids[patient_email(number)] for number in range(count)]
+
+
+def medication_rows(rng: random.Random, patient_ids: List[int], per_patient: float, skip: set):
+    """Średnio per_patient leków na pacjenta. Losowanie idzie też dla pominiętych - wynik nie zależy od stanu bazy."""
+    for patient_id in patient_ids:
+        count = rng.randint(0, round(per_patient * 2))
+        picks = [(rng.choice(MEDICATIONS), rng.choice(REMINDERS)) for _ in range(count)]
+        if patient_id in skip:
+            continue
+        for (name, dosage), reminders in picks:
+            yield patient_id, name, dosage, None, reminders, True
+
+
+def add_medications(writer: BulkWriter, rng: random.Random, patient_ids: List[int], per_patient: float) -> int:
+    # Leki nie mają klucza unikalnego - pacjent, który już ma leki, jest pomijany
+    with engine.connect() as conn:
+        skip = set(conn.scalars(
+            select(models.Medication.user_id).distinct().join(models.User)
+            .where(models.User.email.like(f"%@{PATIENT_EMAIL_DOMAIN}"))).all())
+    inserted = writer.write(models.Medication.__table__,
+                            ("user_id", "name", "dosage", "note", "reminders", "is_active"),
+                            medication_rows(rng, patient_ids, per_patient, skip))
+    print(f"Leki: {inserted} nowych")
+    return inserted
+
+
+def slot_rows(rng: random.Random, doctor_ids: List[int], start: date, end: date, first_hour: int, last_hour: int,
+              slot_minutes: int, fill: float, weekends: bool, patient_ids: List[int], booked: float):
+    """Terminy dzień po dniu; godziny są lokalne serwera, zapisywane w UTC."""
+    day = start
+    while day <= end:
+        if weekends or day.weekday() < 5:
+            opening = datetime(day.year, day.month, day.day, first_hour)
+            closing = datetime(day.year, day.month, day.day, last_hour)
+            times = []
+            while opening <= closing:
+                times.append(opening.astimezone(timezone.utc))
+                opening += timedelta(minutes=slot_minutes)
+            for doctor_id in doctor_ids:
+                for slot_time in times:
+                    if rng.random() >= fill:
+                        continue
+                    if patient_ids and rng.random() < booked:
+                        yield doctor_id, slot_time, True, rng.choice(patient_ids), rng.choice(VISIT_NOTES), "PRIVATE"
+                    else:
+                        yield doctor_id, slot_time, False, None, None, "PRIVATE"
+        day += timedelta(days=1)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generator danych StuMedica (lekarze, terminy, pacjenci, leki).")
+    parser.add_argument("--start", type=date.fromisoformat, default=date.today(), help="pierwszy dzień (RRRR-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="ostatni dzień (domyślnie start + --days)")
+    parser.add_argument("--days", type=int, default=60, help="liczba dni, gdy nie podano --end")
+    parser.add_argument("--doctors", type=int, default=len(DOCTORS), help="liczba lekarzy")
+    parser.add_argument("--hours", default="9-16", help="godziny pierwszej i ostatniej wizyty, np. 9-16")
+    parser.add_argument("--slot-minutes", type=int, default=60, help="długość wizyty w minutach")
+    parser.add_argument("--weekends", action="store_true", help="terminy także w soboty i niedziele")
+    parser.add_argument("--fill", type=float, default=0.5, help="część godzin przyjęć z terminem (0-1)")
+    parser.add_argument("--patients", type=int, default=0, help="liczba syntetycznych pacjentów")
+    parser.add_argument("--password", default="password", help="hasło syntetycznych pacjentów")
+    parser.add_argument("--medications", type=float, default=0, help="średnia liczba leków na pacjenta")
+    parser.add_argument("--booked", type=float, default=0, help="część terminów zarezerwowanych przez pacjentów (0-1)")
+    parser.add_argument("--seed", type=int, default=1, help="ziarno generatora - te same dane przy tych samych opcjach")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="wierszy na partię")
+    parser.add_argument("--no-copy", action="store_true", help="INSERT zamiast COPY także w Postgresie")
+    args = parser.parse_args(argv)
+
+    try:
+        args.first_hour, args.last_hour = (int(part) for part in args.hours.split("-"))
+    except ValueError:
+        parser.error("--hours w formacie OD-DO, np. 9-16")
+    if not 0 <= args.first_hour <= args.last_hour <= 23:
+        parser.error("--hours: godziny 0-23, OD nie większe niż DO")
+    if args.end is None:
+        args.end = args.start + timedelta(days=args.days - 1)
+    if not 0 <= args.fill <= 1 or not 0 <= args.booked <= 1:
+        parser.error("--fill i --booked muszą być z zakresu 0-1")
+    if args.booked and not args.patients:
+        parser.error("--booked wymaga --patients")
+    if args.slot_minutes <= 0 or args.batch_size <= 0:
+        parser.error("--slot-minutes i --batch-size muszą być dodatnie")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    upgrade_database()
+    writer = BulkWriter(engine, args.batch_size, use_copy=not args.no_copy)
+    print(f"Baza: {engine.dialect.name}, {'COPY' if writer.use_copy else 'INSERT'}, partie po {args.batch_size}, "
+          f"ziarno {args.seed}")
+    started = time.perf_counter()
+
+    doctor_ids = ensure_doctors(writer, args.doctors)
+    patient_ids = ensure_patients(writer, args.patients, args.password)
+    if patient_ids and args.medications:
+        # Osobne generatory na etap - zmiana liczby leków nie zmienia terminów
+        add_medications(writer, random.Random(f"{args.seed}:medications"), patient_ids, args.medications)
+
+    print(f"--- Terminy od {args.start} do {args.end} ---")
+    stage_start = time.perf_counter()
+    rows = slot_rows(random.Random(f"{args.seed}:slots"), doctor_ids, args.start, args.end, args.first_hour,
+                     args.last_hour, args.slot_minutes, args.fill, args.weekends, patient_ids, args.booked)
+    inserted = writer.write(models.Appointment.__table__,
+                            ("doctor_id", "date_time", "is_booked", "patient_id", "notes", "type"),
+                            rows, conflict=("doctor_id", "date_time"))
+    elapsed = time.perf_counter() - stage_start
+    print(f"Terminy: {inserted} nowych w {elapsed:.1f}s ({inserted / max(elapsed, 1e-9):.0f} wierszy/s)")
+
+    # Statystyki dla planisty po dużym imporcie (autovacuum zrobiłby to dopiero po chwili)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"\nSukces! Czas całkowity: {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Start aplikacji w lifespan FastAPI - kolejne, mierzone fazy zamiast pracy przy imporcie app.main.
+
+Import app.main nie łączy się z bazą i nie ładuje ciężkich modułów (numpy, faiss, SDK Gemini, Alembic),
+więc worker szybko jest gotowy do startu, a narzędzia i testy importują aplikację bez kosztów. Przy imporcie
+zostaje tylko instrument_engines - same listenery, bez bazy, potrzebne też skryptom bez lifespan. Fazy (run):
+1. logging - kolejka logów i plik (app/logging_config.py),
+2. schema - migracje Alembica (app/migrate.py), pomijane przy SKIP_SCHEMA_CHECK=true,
+3. metrics - plik metryk workera współdzielony przez mmap (METRICS_DIR),
+4. background - zadania tła (indeks dostępności, repliki, konserwacja wizyt, licznik zmian kont) i hasz-atrapa
+   logowania liczony w puli hashowania (app/hashing.py),
+5. rag - budowa indeksu wiedzy asystenta w tle, bez wstrzymywania startu (RAG_WARMUP=false - przy pierwszym
+   pytaniu).
+Czas każdej fazy trafia do logu, metryki stumedica_startup_phase_seconds i app.state.startup_phases.
+
+SKIP_SCHEMA_CHECK - "true" pomija migracje przy starcie (produkcja: python -m app.migrate raz przy wdrożeniu,
+    a nie w każdym workerze)
+RAG_WARMUP - "false" wyłącza budowę indeksu wiedzy w tle po starcie (domyślnie "true")
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+from app import archive, availability, hashing, metrics, query_count, rag_engine, replicas, tracing, user_cache
+from app.database import engine, async_engine, write_engine
+from app.logging_config import setup_logging
+
+logger = logging.getLogger("StuMedica")
+
+SKIP_SCHEMA_CHECK = os.getenv("SKIP_SCHEMA_CHECK", "false").lower() == "true"
+RAG_WARMUP = os.getenv("RAG_WARMUP", "true").lower() == "true"
+
+PHASE_SECONDS = metrics.REGISTRY.gauge(
+    "stumedica_startup_phase_seconds", "Czas faz startu aplikacji (app/startup.py)", ["phase"])
+
+@contextmanager
+def _phase(phases: Dict[str, float], name: str):
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    phases[name] = elapsed
+    PHASE_SECONDS.labels(name).set(elapsed)
+    logger.info("Start: faza %s - %.1f ms", name, elapsed * 1000)
+
+
+def _upgrade_schema():
+    from app.migrate import upgrade_database  # Alembic tylko wtedy, gdy migracje są potrzebne
+
+    upgrade_database()
+
+
+def instrument_engines():
+    """Spany i licznik zapytań na wszystkich silnikach (wywoływane raz, przy imporcie app.main)."""
+    engines = [engine, async_engine.sync_engine]
+    engines += [replica.engine.sync_engine for replica in replicas.router.replicas]
+    if write_engine is not async_engine:
+        engines.append(write_engine.sync_engine)
+    for sync_engine in engines:
+        tracing.instrument_sqlalchemy(sync_engine)
+        query_count.instrument_engine(sync_engine)
+
+
+def _background_tasks() -> List[asyncio.Task]:
+    tasks = []
+    if availability.AVAILABILITY_INDEX:
+        tasks.append(asyncio.create_task(availability.run_reconciler()))
+    if replicas.router.replicas:
+        tasks.append(asyncio.create_task(replicas.run_health_checks()))
+    if archive.APPOINTMENT_MAINTENANCE_SECONDS > 0:
+        tasks.append(asyncio.create_task(archive.run_maintenance_loop()))
+    if user_cache.USER_CACHE_SIZE > 0:
+        tasks.append(asyncio.create_task(user_cache.run_version_checks()))
+    return tasks
+
+
+async def run(app) -> List[asyncio.Task]:
+    """Fazy startu po kolei. Zwraca zadania tła do anulowania przy zamykaniu."""
+    phases: Dict[str, float] = {}
+    app.state.startup_phases = phases
+    started = time.perf_counter()
+
+    with _phase(phases, "logging"):
+        setup_logging()
+    if SKIP_SCHEMA_CHECK:
+        logger.info("Start: faza schema pominięta (SKIP_SCHEMA_CHECK)")
+    else:
+        with _phase(phases, "schema"):
+            # Migracje używają synchronicznego silnika - w wątku, żeby nie blokować pętli zdarzeń
+            await asyncio.to_thread(_upgrade_schema)
+    with _phase(phases, "metrics"):
+        metrics.open_worker_file()
+    with _phase(phases, "background"):
+        tasks = _background_tasks()
+        hashing.prepare_dummy_hash()
+    with _phase(phases, "rag"):
+        if RAG_WARMUP:
+            tasks.append(asyncio.create_task(asyncio.to_thread(rag_engine.get_rag_system)))
+
+    logger.info("Start: gotowe po %.1f ms", (time.perf_counter() - started) * 1000)
+    return tasks
@@ -0,0 +1,123 @@
+"""Krótkie tokeny dostępu i rotowane tokeny odświeżania.
+
+Token dostępu (JWT) żyje ACCESS_TOKEN_MINUTES i niesie w claimach to, czego potrzebują endpointy: id konta,
+imię, e-mail, typ konta, ai_allowed oraz ver - licznik zmian kont (users_version) z chwili wydania. Dopóki
+licznik się nie zmienił, get_current_user buduje konto z samych claimów, bez zapytania do bazy
+(user_cache.snapshot_from_claims); po dowolnej zmianie kont token przechodzi raz przez bazę.
+
+Token odświeżania to losowy ciąg, w bazie (refresh_tokens) jest tylko jego skrót. Jest jednorazowy:
+POST /auth/refresh zużywa go i wydaje nową parę. Ponowne użycie zużytego tokenu oznacza, że ktoś go
+przechwycił - unieważniamy wtedy wszystkie tokeny z tego logowania (family_id).
+
+ACCESS_TOKEN_MINUTES - ważność tokenu dostępu (domyślnie 15)
+REFRESH_TOKEN_DAYS - ważność tokenu odświeżania (domyślnie 7)
+"""
+import hashlib
+import os
+import secrets
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics, models, security
+
+ACCESS_TOKEN_MINUTES = float(os.getenv("ACCESS_TOKEN_MINUTES", "15"))
+REFRESH_TOKEN_DAYS = float(os.getenv("REFRESH_TOKEN_DAYS", "7"))
+
+REFRESHES = metrics.REGISTRY.counter(
+    "stumedica_token_refresh_total", "Odświeżenia tokenów: rotated - nowa para, rejected - nieważny token, "
+    "reused - ponowne użycie zużytego tokenu (unieważniona rodzina)", ["result"])
+
+
+@dataclass
+class TokenPair:
+    access_token: str
+    refresh_token: str
+
+
+def _digest(refresh_token: str) -> str:
+    # Token ma 256 bitów losowości - wystarczy szybki skrót, bez Argon2
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+async def users_version(db: AsyncSession) -> Optional[int]:
+    """Licznik zmian kont - odczytywany PRZED kontem, żeby claimy nigdy nie były nowsze niż ver."""
+    return await db.scalar(select(models.UsersVersion.version).where(models.UsersVersion.id == 1))
+
+
+def create_access_token(user: models.User, version: Optional[int]) -> str:
+    return security.create_access_token(
+        {"sub": user.email, "uid": user.id, "name": user.name, "account_type": user.account_type,
+         "ai_allowed": bool(user.ai_allowed), "ver": version},
+        timedelta(minutes=ACCESS_TOKEN_MINUTES),
+    )
+
+
+async def issue_tokens(db: AsyncSession, user: models.User, version: Optional[int],
+                       family_id: Optional[str] = None) -> TokenPair:
+    """Nowa para tokenów. Bez family_id - nowe logowanie. Zatwierdza transakcję."""
+    now = datetime.now(timezone.utc)
+    refresh_token = secrets.token_urlsafe(32)
+    if family_id is None:
+        family_id = secrets.token_hex(16)
+        # Przy logowaniu sprzątamy wygasłe tokeny tego konta - tabela nie rośnie bez końca
+        await db.execute(delete(models.RefreshToken).where(
+            models.RefreshToken.user_id == user.id, models.RefreshToken.expires_at < now))
+    db.add(models.RefreshToken(user_id=user.id, family_id=family_id, token_hash=_digest(refresh_token),
+                               expires_at=now + timedelta(days=REFRESH_TOKEN_DAYS)))
+    await db.commit()
+    return TokenPair(create_access_token(user, version), refresh_token)
+
+
+async def rotate(db: AsyncSession, refresh_token: str) -> Optional[TokenPair]:
+    """Zużywa token odświeżania i wydaje nową parę. None - token nieważny, zużyty albo konto nieaktywne."""
+    now = datetime.now(timezone.utc)
+    digest = _digest(refresh_token)
+    version = await users_version(db)
+    # Warunkowy UPDATE - z dwóch równoczesnych odświeżeń tym samym tokenem wygrywa jedno (jak app/booking.py)
+    used = (await db.execute(
+        update(models.RefreshToken).where(
+            models.RefreshToken.token_hash == digest,
+            models.RefreshToken.used_at.is_(None),
+            models.RefreshToken.revoked_at.is_(None),
+            models.RefreshToken.expires_at > now,
+        ).values(used_at=now).returning(models.RefreshToken.user_id, models.RefreshToken.family_id)
+    )).first()
+
+    if used is None:
+        reused = await db.scalar(select(models.RefreshToken.family_id).where(
+            models.RefreshToken.token_hash == digest, models.RefreshToken.used_at.is_not(None)))
+        if reused is not None:
+            await revoke_family(db, reused)
+            REFRESHES.labels("reused").inc()
+        else:
+            REFRESHES.labels("rejected").inc()
+        return None
+
+    user = await db.get(models.User, used.user_id)
+    if user is None or user.is_active is False:
+        await revoke_family(db, used.family_id)
+        REFRESHES.labels("rejected").inc()
+        return None
+
+    REFRESHES.labels("rotated").inc()
+    return await issue_tokens(db, user, version, used.family_id)
+
+
+async def revoke_family(db: AsyncSession, family_id: str):
+    """Unieważnia wszystkie tokeny odświeżania z jednego logowania. Zatwierdza transakcję."""
+    await db.execute(update(models.RefreshToken).where(
+        models.RefreshToken.family_id == family_id, models.RefreshToken.revoked_at.is_(None)
+    ).values(revoked_at=datetime.now(timezone.utc)))
+    await db.commit()
+
+
+async def revoke(db: AsyncSession, refresh_token: str):
+    """Wylogowanie - unieważnia rodzinę, do której należy token (nieznany token nic nie zmienia)."""
+    family_id = await db.scalar(select(models.RefreshToken.family_id).where(
+        models.RefreshToken.token_hash == _digest(refresh_token)))
+    if family_id is not None:
+        await revoke_family(db, family_id)
@@ -0,0 +1,298 @@
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# TRACE_EXPORT_PATH - plik docelowy (brak = tracing wyłączony, zostaje tylko request id)
+# TRACE_EXPORT_FORMAT - "jsonl" (jeden span na linię) lub "otlp" (OTLP/JSON, jeden request na linię)
+# TRACE_SAMPLE_RATE - ułamek żądań zapisywanych zawsze (0.0 - 1.0)
+# TRACE_SLOW_MS - żądania wolniejsze niż próg są zapisywane niezależnie od próbkowania
+# TRACE_KEEP_ERRORS - zapisuj żądania zakończone błędem (5xx / wyjątek)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+TRACE_EXPORT_FORMAT = os.getenv("TRACE_EXPORT_FORMAT", "jsonl").lower()
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+TRACE_KEEP_ERRORS = os.getenv("TRACE_KEEP_ERRORS", "true").lower() == "true"
+
+SERVICE_NAME = "stumedica-api"
+REQUEST_ID_HEADER = "x-request-id"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+user_id_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("user_id", default=None)
+_trace_var: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+_span_var: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: str, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        self.trace.spans.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class Trace:
+    __slots__ = ("trace_id", "request_id", "sampled", "spans")
+
+    def __init__(self, request_id: str, sampled: bool):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.sampled = sampled
+        self.spans: List[Span] = []  # list.append jest atomowe - spany mogą kończyć się w wątkach narzędzi
+
+
+def current_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def current_span() -> Optional[Span]:
+    return _span_var.get()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """Otwiera span podrzędny względem aktualnego. Bez aktywnego śledzenia kosztuje jedno ContextVar.get()."""
+    trace = _trace_var.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _span_var.get()
+    new_span = Span(trace, name, parent.span_id if parent else None, kind, attributes)
+    token = _span_var.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _span_var.reset(token)
+        new_span.finish()
+
+
+def _should_record() -> Optional[bool]:
+    """None = nie nagrywaj, True = zapisz na pewno, False = nagrywaj i zdecyduj na końcu (tail sampling)."""
+    if not TRACE_EXPORT_PATH:
+        return None
+    if TRACE_SAMPLE_RATE >= 1.0 or random.random() < TRACE_SAMPLE_RATE:
+        return True
+    if TRACE_SLOW_MS > 0 or TRACE_KEEP_ERRORS:
+        return False
+    return None
+
+
+# --- Eksport (osobny wątek, żeby zapis na dysk nie wydłużał żądań) ---
+
+_export_queue: "queue.Queue[Trace]" = queue.Queue(maxsize=10000)
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def _attr_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_jsonl(trace: Trace) -> List[str]:
+    lines = []
+    for s in trace.spans:
+        lines.append(json.dumps({
+            "trace_id": trace.trace_id,
+            "request_id": trace.request_id,
+            "span_id": s.span_id,
+            "parent_id": s.parent_id,
+            "name": s.name,
+            "kind": s.kind,
+            "start_ns": s.start_ns,
+            "duration_ms": round(s.duration_ms, 3),
+            "attributes": s.attributes,
+            "error": s.error,
+        }, ensure_ascii=False, default=str))
+    return lines
+
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+def _to_otlp(trace: Trace) -> List[str]:
+    spans = []
+    for s in trace.spans:
+        attributes = [{"key": k, "value": _attr_value(v)} for k, v in s.attributes.items()]
+        attributes.append({"key": "stumedica.request_id", "value": {"stringValue": trace.request_id}})
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": _OTLP_KINDS.get(s.kind, 1),
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": attributes,
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            otlp_span["parentSpanId"] = s.parent_id
+        spans.append(otlp_span)
+
+    request = {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": spans}],
+        }]
+    }
+    return [json.dumps(request, ensure_ascii=False, default=str)]
+
+
+def _exporter_loop():
+    serialize = _to_otlp if TRACE_EXPORT_FORMAT == "otlp" else _to_jsonl
+    with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+        while True:
+            trace = _export_queue.get()
+            for line in serialize(trace):
+                f.write(line + "\n")
+            if _export_queue.empty():
+                f.flush()
+
+
+def _ensure_exporter():
+    global _exporter_started
+    if _exporter_started:
+        return
+    with _exporter_lock:
+        if not _exporter_started:
+            threading.Thread(target=_exporter_loop, name="trace-exporter", daemon=True).start()
+            _exporter_started = True
+
+
+def _export(trace: Trace):
+    _ensure_exporter()
+    try:
+        _export_queue.put_nowait(trace)
+    except queue.Full:
+        pass  # Przy przeciążeniu gubimy trace zamiast blokować żądanie
+
+
+# --- Integracje ---
+
+class TracingMiddleware:
+    """Middleware ASGI: nadaje request id (nagłówek X-Request-ID) i otwiera span główny żądania."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope.get("headers", []):
+            if key == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        rid_token = request_id_var.set(request_id)
+        uid_token = user_id_var.set(None)
+        record = _should_record()
+        trace = Trace(request_id, sampled=bool(record)) if record is not None else None
+        trace_token = _trace_var.set(trace)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (REQUEST_ID_HEADER.encode(), request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            with span("HTTP " + scope["method"], kind="server",
+                      **{"http.method": scope["method"], "http.target": scope["path"]}) as root:
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    if root is not None:
+                        route = scope.get("route")
+                        if getattr(route, "path", None):
+                            root.name = f"HTTP {scope['method']} {route.path}"
+                            root.set_attribute("http.route", route.path)
+                        root.set_attribute("http.status_code", status_code)
+                        user_id = user_id_var.get()
+                        if user_id is not None:
+                            root.set_attribute("enduser.id", user_id)
+        finally:
+            _trace_var.reset(trace_token)
+            user_id_var.reset(uid_token)
+            request_id_var.reset(rid_token)
+            if trace is not None and trace.spans:
+                keep = trace.sampled
+                if not keep and TRACE_KEEP_ERRORS and (status_code >= 500 or any(s.error for s in trace.spans)):
+                    keep = True
+                if not keep and TRACE_SLOW_MS > 0:
+                    root_span = trace.spans[-1]
+                    keep = root_span.duration_ms >= TRACE_SLOW_MS
+                if keep:
+                    _export(trace)
+
+
+def instrument_sqlalchemy(engine):
+    """Rejestruje spany dla każdego zapytania SQL wykonanego przez silnik."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _trace_var.get() is None:
+            return
+        cm = span("db.query", kind="client", **{
+            "db.system": conn.dialect.name,
+            "db.statement": statement[:500],
+        })
+        cm.__enter__()
+        conn.info.setdefault("_trace_spans", []).append(cm)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("_trace_spans")
+        if stack:
+            stack.pop().__exit__(None, None, None)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        stack = conn.info.get("_trace_spans") if conn is not None else None
+        if stack:
+            exc = exception_context.original_exception
+            stack.pop().__exit__(type(exc), exc, None)
@@ -0,0 +1,182 @@
+"""Pamięć podręczna kont z tokenów - get_current_user bez zapytania do users przy każdym żądaniu.
+
+Token zweryfikowany raz (podpis, ważność) wskazuje migawkę konta UserSnapshot: id, imię, e-mail, typ konta,
+ai_allowed i is_active. Wpis jest ważny USER_CACHE_TTL_SECONDS, ale nie dłużej niż sam token, a w pamięci
+jest najwyżej USER_CACHE_SIZE tokenów (najdawniej używane wypadają pierwsze).
+
+Zmiany kont:
+- w procesie - invalidate_user(user_id) po zmianie któregoś z tych pól,
+- poza procesem (inny worker, administrator w bazie) - trigger na users podbija licznik w users_version
+  (migracja 0005), a run_version_checks() co USER_CACHE_VERSION_CHECK_SECONDS porównuje go z ostatnio
+  widzianym i przy zmianie czyści całą pamięć.
+Token dostępu z claimami (app/tokens.py) wydany przy bieżącej wartości licznika nie wymaga zapytania nawet
+przy chybieniu - konto powstaje z claimów (snapshot_from_claims).
+Wpisom i claimom ufamy tylko wtedy, gdy licznik był sprawdzony w ciągu ostatnich trzech interwałów - dezaktywacja
+konta działa najpóźniej po kilku USER_CACHE_VERSION_CHECK_SECONDS, także gdy sprawdzanie przestało działać.
+Pamięć jest używana tylko z pętli zdarzeń (zależności async), więc nie ma blokad.
+
+USER_CACHE_SIZE - maksymalna liczba tokenów w pamięci (domyślnie 10000, 0 - wyłączona)
+USER_CACHE_TTL_SECONDS - jak długo wpis jest ważny (domyślnie 300)
+USER_CACHE_VERSION_CHECK_SECONDS - co ile sekund sprawdzać licznik zmian kont (domyślnie 5)
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from app import metrics, models
+from app.database import async_engine
+
+logger = logging.getLogger("StuMedica")
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+USER_CACHE_VERSION_CHECK_SECONDS = float(os.getenv("USER_CACHE_VERSION_CHECK_SECONDS", "5"))
+
+LOOKUPS = metrics.REGISTRY.counter(
+    "stumedica_user_cache_lookups_total", "Odczyty konta z tokenu: hit - z pamięci, miss - z bazy", ["result"])
+CACHE_SIZE = metrics.REGISTRY.gauge("stumedica_user_cache_entries", "Liczba tokenów w pamięci podręcznej kont")
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Pola konta potrzebne endpointom - bez obiektu ORM i bez sesji."""
+    id: int
+    name: str
+    email: str
+    account_type: str
+    ai_allowed: bool
+    is_active: bool
+
+
+SNAPSHOT_COLUMNS = (models.User.id, models.User.name, models.User.email, models.User.account_type,
+                    models.User.ai_allowed, models.User.is_active)
+
+
+def snapshot_from_claims(payload: dict) -> Optional[UserSnapshot]:
+    """Konto z claimów tokenu dostępu (app/tokens.py), o ile od jego wydania nie zmieniło się żadne konto."""
+    user_id = payload.get("uid")
+    if user_id is None or not cache.claims_current(user_id, payload.get("ver")):
+        return None
+    # Tokeny dostaje tylko aktywne konto, a dezaktywacja zmienia licznik
+    return UserSnapshot(user_id, payload["name"], payload["sub"], payload["account_type"],
+                        bool(payload["ai_allowed"]), True)
+
+
+def snapshot_from_row(row) -> UserSnapshot:
+    # NULL w ai_allowed / is_active (konta sprzed domyślnych wartości) - jak wartości domyślne modelu
+    return UserSnapshot(row.id, row.name, row.email, row.account_type, bool(row.ai_allowed),
+                        row.is_active is not False)
+
+
+class UserCache:
+    def __init__(self, max_size: int, ttl_seconds: float, check_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.check_seconds = check_seconds
+        self._entries: "OrderedDict[str, Tuple[UserSnapshot, float]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        # Podbijana przy każdym czyszczeniu - wpis z odczytu rozpoczętego przed czyszczeniem nie trafia do pamięci
+        self.generation = 0
+        self.version: Optional[int] = None
+        self._checked_at: Optional[float] = None
+        # Konta zmienione w tym procesie od ostatniej zmiany licznika - ich claimom nie ufamy
+        self._stale_users: Set[int] = set()
+
+    @property
+    def trusted(self) -> bool:
+        """Licznik zmian sprawdzony niedawno - bez tego wpisy mogłyby przeżyć dezaktywację konta."""
+        return self._checked_at is not None and time.monotonic() - self._checked_at < 3 * self.check_seconds
+
+    def get(self, token: str) -> Optional[UserSnapshot]:
+        entry = self._entries.get(token) if self.trusted else None
+        if entry is not None and time.time() >= entry[1]:
+            self._remove(token)
+            entry = None
+        if entry is None:
+            LOOKUPS.labels("miss").inc()
+            return None
+        self._entries.move_to_end(token)
+        LOOKUPS.labels("hit").inc()
+        return entry[0]
+
+    def put(self, token: str, user: UserSnapshot, token_expires_at: Optional[float], generation: int):
+        if self.max_size <= 0 or generation != self.generation:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        self._entries[token] = (user, expires_at)
+        self._entries.move_to_end(token)
+        self._tokens_by_user.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+        CACHE_SIZE.set(len(self._entries))
+
+    def _remove(self, token: str):
+        user, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user.id]
+        CACHE_SIZE.set(len(self._entries))
+
+    def claims_current(self, user_id: int, version: Optional[int]) -> bool:
+        """Claimy tokenu wydanego przy wersji version są aktualne - od tamtej pory nie zmieniło się żadne konto."""
+        return (version is not None and version == self.version and self.trusted
+                and user_id not in self._stale_users)
+
+    def invalidate_user(self, user_id: int):
+        self._stale_users.add(user_id)
+        for token in self._tokens_by_user.pop(user_id, ()):
+            self._entries.pop(token, None)
+        self.generation += 1
+        CACHE_SIZE.set(len(self._entries))
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+        self._stale_users.clear()
+        self.generation += 1
+        CACHE_SIZE.set(0)
+
+    def observe_version(self, version: int):
+        """Wynik sprawdzenia licznika - inna wartość niż ostatnio oznacza zmiany kont poza tym procesem."""
+        if version != self.version:
+            self.clear()
+            self.version = version
+        self._checked_at = time.monotonic()
+
+
+cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS, USER_CACHE_VERSION_CHECK_SECONDS)
+
+
+def invalidate_user(user_id: int):
+    """Do wywołania po zmianie imienia, e-maila, typu konta, ai_allowed albo is_active w tym procesie."""
+    cache.invalidate_user(user_id)
+
+
+async def check_version():
+    # Zawsze baza główna - replika mogłaby pokazać licznik sprzed dezaktywacji
+    async with async_engine.connect() as conn:
+        version = await conn.scalar(select(models.UsersVersion.version).where(models.UsersVersion.id == 1))
+    cache.observe_version(version)
+
+
+async def run_version_checks():
+    """Zadanie tła: okresowe sprawdzanie licznika zmian kont."""
+    while True:
+        try:
+            await check_version()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Bez sprawdzenia wpisy przestają być zaufane po trzech interwałach (UserCache.trusted)
+            logger.warning("Pamięć podręczna kont: błąd sprawdzania licznika zmian: %s", e)
+        await asyncio.sleep(USER_CACHE_VERSION_CHECK_SECONDS)
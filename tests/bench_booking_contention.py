@@ -0,0 +1,145 @@
+"""Rezerwacje pod współbieżnością: setki równoczesnych POST /appointments/{id}/book na kilka terminów.
+
+Sprawdza poprawność (każdy termin zarezerwowany dokładnie raz, pozostałe próby dostają 409,
+stan w bazie zgadza się z odpowiedziami) i mierzy przepustowość. Terminy testowe są tworzone
+w odległej przyszłości u pierwszego lekarza i usuwane na końcu.
+
+Uruchomienie (baza z DATABASE_URL, co najmniej jeden lekarz, konto testowe):
+    python -m tests.bench_booking_contention
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy import delete, select
+
+from app import models
+from app.database import SessionLocal
+from tests.bench_db_async import start_server, wait_ready
+from tests.common import TEST_EMAIL, TEST_PASSWORD
+
+PORT = 4102
+SLOTS = int(os.getenv("BENCH_SLOTS", "5"))
+ATTEMPTS = int(os.getenv("BENCH_ATTEMPTS", "300"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "100"))
+
+
+def create_slots() -> list:
+    db = SessionLocal()
+    try:
+        doctor = db.scalars(select(models.Doctor).limit(1)).first()
+        if doctor is None:
+            print("Brak lekarzy w bazie")
+            sys.exit(1)
+        # Losowy dzień w 2099 r. - bez kolizji z uq_appointments_doctor_date przy kolejnych uruchomieniach
+        base = datetime(2099, 1, 1, 8, tzinfo=timezone.utc) + timedelta(days=random.randrange(3000))
+        slots = [
+            models.Appointment(doctor_id=doctor.id, date_time=base + timedelta(minutes=30 * i), type="PRIVATE")
+            for i in range(SLOTS)
+        ]
+        db.add_all(slots)
+        db.commit()
+        return [slot.id for slot in slots]
+    finally:
+        db.close()
+
+
+def booked_in_db(slot_ids: list) -> dict:
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(models.Appointment.id, models.Appointment.is_booked, models.Appointment.notes)
+            .where(models.Appointment.id.in_(slot_ids))
+        ).all()
+        return {row.id: (row.is_booked, row.notes) for row in rows}
+    finally:
+        db.close()
+
+
+def delete_slots(slot_ids: list):
+    db = SessionLocal()
+    try:
+        db.execute(delete(models.Appointment).where(models.Appointment.id.in_(slot_ids)))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def fire_bookings(client: httpx.AsyncClient, base_url: str, headers: dict, slot_ids: list):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    results = []  # (slot_id, status, notatka, czas)
+
+    async def attempt(n: int):
+        slot_id = slot_ids[n % len(slot_ids)]
+        note = f"Próba {n}"
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(f"{base_url}/appointments/{slot_id}/book", json={"notes": note},
+                                         headers=headers)
+            results.append((slot_id, response.status_code, note, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(attempt(n) for n in range(ATTEMPTS)))
+    return results, time.perf_counter() - start
+
+
+async def main():
+    slot_ids = create_slots()
+    server = start_server("app.main:app", PORT)
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    failures = []
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+            base_url = f"http://localhost:{PORT}"
+            await wait_ready(client, base_url)
+            login = await client.post(f"{base_url}/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+            if login.status_code != 200:
+                print(f"Błąd logowania: {login.status_code} {login.text}")
+                sys.exit(1)
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+            results, elapsed = await fire_bookings(client, base_url, headers, slot_ids)
+
+        statuses = Counter(status for _, status, _, _ in results)
+        winners = {}
+        for slot_id, status, note, _ in results:
+            if status == 200:
+                winners.setdefault(slot_id, []).append(note)
+        db_state = booked_in_db(slot_ids)
+
+        checks = [
+            ("każdy termin zarezerwowany dokładnie raz",
+             all(len(winners.get(slot_id, [])) == 1 for slot_id in slot_ids)),
+            ("pozostałe próby dostały 409", statuses[409] == ATTEMPTS - len(slot_ids)),
+            ("brak innych kodów odpowiedzi", set(statuses) <= {200, 409}),
+            ("baza zgodna z odpowiedziami (notatka zwycięzcy)",
+             all(db_state[slot_id] == (True, winners.get(slot_id, [None])[0]) for slot_id in slot_ids)),
+        ]
+        for name, passed in checks:
+            print(f"{'✅ PASS' if passed else '❌ FAIL'} {name}")
+            if not passed:
+                failures.append(name)
+        print(f"    Kody odpowiedzi: {dict(statuses)}")
+
+        latencies = sorted(latency for _, _, _, latency in results)
+        print(f"\nTerminy: {len(slot_ids)}, próby: {ATTEMPTS}, współbieżność: {CONCURRENCY}\n")
+        print("| req/s | p50 [ms] | p95 [ms] | max [ms] |")
+        print("|---|---|---|---|")
+        print(f"| {len(results) / elapsed:.1f} | {statistics.median(latencies) * 1000:.1f} | "
+              f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} | {latencies[-1] * 1000:.1f} |")
+    finally:
+        server.terminate()
+        server.wait()
+        delete_slots(slot_ids)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
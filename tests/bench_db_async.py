@@ -0,0 +1,152 @@
+"""Porównanie przepustowości endpointów bazodanowych: stara wersja synchroniczna vs async (asyncpg).
+
+Uruchomienie (z katalogu głównego, baza z DATABASE_URL i konto testowe muszą istnieć):
+    python -m tests.bench_db_async
+
+Skrypt sam startuje dwa serwery uvicorn:
+- async: właściwa aplikacja (app.main:app),
+- sync: `sync_app` poniżej - te same zapytania na Session/get_db, jak przed przejściem na async.
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, Request
+from jose import JWTError, jwt
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+
+from app import metrics, models, schemas, security, tracing
+from app.database import get_db
+from tests.common import TEST_EMAIL, TEST_PASSWORD
+
+ASYNC_PORT = 4100
+SYNC_PORT = 4101
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "50"))
+DURATION = float(os.getenv("BENCH_DURATION", "10"))
+WORKERS = os.getenv("BENCH_WORKERS", "1")
+ENDPOINTS = ["/appointments/slots", "/medications/"]
+
+# --- Wersja synchroniczna (punkt odniesienia) ---
+
+sync_app = FastAPI()
+# Te same middleware co w app.main - różnica w wynikach wynika tylko z obsługi bazy
+sync_app.add_middleware(metrics.MetricsMiddleware)
+sync_app.add_middleware(tracing.TracingMiddleware)
+
+
+def get_current_user_sync(request: Request, db: Session = Depends(get_db)):
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    try:
+        email = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM]).get("sub")
+    except JWTError:
+        raise HTTPException(status_code=401)
+    user = db.query(models.User).filter(models.User.email == email).first()
+    if user is None:
+        raise HTTPException(status_code=401)
+    return user
+
+
+@sync_app.get("/appointments/slots", response_model=List[schemas.AppointmentResponse])
+def get_available_slots_sync(specialization: Optional[str] = None, db: Session = Depends(get_db)):
+    query = db.query(models.Appointment).options(joinedload(models.Appointment.doctor)).filter(
+        models.Appointment.is_booked == False,
+        models.Appointment.date_time > func.now()
+    )
+    if specialization:
+        query = query.join(models.Doctor).filter(models.Doctor.specialization == specialization)
+    return query.order_by(models.Appointment.date_time).all()
+
+
+@sync_app.get("/medications/", response_model=List[schemas.MedicationResponse])
+def get_medications_sync(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user_sync)):
+    return db.query(models.Medication).filter(
+        models.Medication.user_id == current_user.id,
+        models.Medication.is_active == True
+    ).all()
+
+
+# --- Generator obciążenia ---
+
+def start_server(target: str, port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--workers", WORKERS, "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get(f"{base_url}/appointments/slots")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"Serwer {base_url} nie wystartował")
+
+
+async def run_load(client: httpx.AsyncClient, url: str, headers: dict) -> dict:
+    latencies = []
+    errors = 0
+    stop_at = time.monotonic() + DURATION
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "errors": errors,
+    }
+
+
+async def main():
+    servers = [start_server("app.main:app", ASYNC_PORT), start_server("tests.bench_db_async:sync_app", SYNC_PORT)]
+    limits = httpx.Limits(max_connections=CONCURRENCY * 2, max_keepalive_connections=CONCURRENCY * 2)
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            async_url = f"http://localhost:{ASYNC_PORT}"
+            sync_url = f"http://localhost:{SYNC_PORT}"
+            await wait_ready(client, async_url)
+            await wait_ready(client, sync_url)
+
+            login = await client.post(f"{async_url}/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+            if login.status_code != 200:
+                print(f"Błąd logowania: {login.status_code} {login.text}")
+                sys.exit(1)
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+            print(f"Współbieżność: {CONCURRENCY}, czas: {DURATION}s na pomiar, workery: {WORKERS}\n")
+            print("| Endpoint | Tryb | req/s | p50 [ms] | p95 [ms] | Błędy |")
+            print("|---|---|---|---|---|---|")
+            for endpoint in ENDPOINTS:
+                for mode, base_url in (("sync", sync_url), ("async", async_url)):
+                    result = await run_load(client, f"{base_url}{endpoint}", headers)
+                    print(f"| {endpoint} | {mode} | {result['rps']} | {result['p50_ms']} | "
+                          f"{result['p95_ms']} | {result['errors']} |")
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
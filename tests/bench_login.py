@@ -0,0 +1,178 @@
+"""Logowanie pod współbieżnością: przepustowość, czasy i szczytowe RSS serwera przy ograniczonej puli Argon2.
+
+Dla kolejnych poziomów współbieżności wysyła BENCH_LOGINS równoczesnych POST /auth/login i mierzy odpowiedzi,
+czasy oraz szczytowe RSS procesu serwera (próbkowane z /proc). Sprawdza też (app/hashing.py):
+- przy pełnej kolejce hashowania serwer odpowiada szybko 503 zamiast 500 albo timeoutu,
+- pamięć ponad stan spoczynkowy nie przekracza HASH_WORKERS × ARGON2_MEMORY_COST (+ zapas),
+- hasz ze starymi parametrami Argon2 zostaje przeliczony przy logowaniu,
+- logowanie na nieistniejący e-mail trwa tyle co na złe hasło.
+
+Skrypt zakłada własne konto testowe i usuwa je na końcu. Uruchomienie (Linux - RSS z /proc):
+    python -m tests.bench_login
+BENCH_LOGIN_CONCURRENCY (np. "1,4,16,64"), BENCH_LOGINS, HASH_WORKERS, HASH_QUEUE_LIMIT - jak w aplikacji.
+"""
+import asyncio
+import os
+import secrets
+import statistics
+import threading
+import time
+from collections import Counter
+
+import httpx
+from passlib.context import CryptContext
+from sqlalchemy import delete, select
+
+from app import hashing, models, security
+from app.database import SessionLocal
+from tests.bench_db_async import start_server, wait_ready
+from tests.common import Checks
+
+PORT = 4103
+CONCURRENCY_LEVELS = [int(n) for n in os.getenv("BENCH_LOGIN_CONCURRENCY", "1,4,16,64").split(",")]
+LOGINS = int(os.getenv("BENCH_LOGINS", "64"))
+BENCH_EMAIL = f"bench-login-{secrets.token_hex(4)}@example.invalid"
+BENCH_PASSWORD = secrets.token_urlsafe(12)
+# Zapas na resztę procesu (bufory żądań, fragmentacja alokatora)
+RSS_MARGIN_MIB = 128
+
+
+def create_user():
+    """Konto z haszem o słabszych parametrach niż obecne - pierwsze logowanie musi go przeliczyć."""
+    old_context = CryptContext(schemes=["argon2"], argon2__time_cost=1, argon2__memory_cost=8192,
+                               argon2__parallelism=1)
+    with SessionLocal() as db:
+        db.add(models.User(name="Bench Login", email=BENCH_EMAIL, account_type="patient",
+                           password_hash=old_context.hash(BENCH_PASSWORD)))
+        db.commit()
+
+
+def stored_hash() -> str:
+    with SessionLocal() as db:
+        return db.scalar(select(models.User.password_hash).where(models.User.email == BENCH_EMAIL))
+
+
+def delete_user():
+    with SessionLocal() as db:
+        db.execute(delete(models.User).where(models.User.email == BENCH_EMAIL))
+        db.commit()
+
+
+def rss_mib(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class PeakRss:
+    """Próbkuje RSS procesu co 10 ms w osobnym wątku i zapamiętuje maksimum."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_mib(self.pid))
+            time.sleep(0.01)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+async def login(client: httpx.AsyncClient, base_url: str, email: str, password: str):
+    start = time.perf_counter()
+    response = await client.post(f"{base_url}/auth/login", json={"email": email, "password": password})
+    return response.status_code, time.perf_counter() - start
+
+
+async def run_level(client: httpx.AsyncClient, base_url: str, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def attempt():
+        async with semaphore:
+            return await login(client, base_url, BENCH_EMAIL, BENCH_PASSWORD)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(attempt() for _ in range(LOGINS)))
+    return results, time.perf_counter() - start
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[max(0, int(len(values) * q) - 1)] if values else 0.0
+
+
+async def main():
+    check = Checks()
+
+    create_user()
+    server = start_server("app.main:app", PORT)
+    limits = httpx.Limits(max_connections=max(CONCURRENCY_LEVELS), max_keepalive_connections=max(CONCURRENCY_LEVELS))
+    rows = []
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+            base_url = f"http://localhost:{PORT}"
+            await wait_ready(client, base_url)
+
+            status, _ = await login(client, base_url, BENCH_EMAIL, BENCH_PASSWORD)
+            new_hash = stored_hash()
+            check("hasz ze starymi parametrami przeliczony przy logowaniu",
+                  status == 200 and not security.pwd_context.needs_update(new_hash), new_hash.split("$")[3])
+
+            wrong = [await login(client, base_url, BENCH_EMAIL, "zle-haslo") for _ in range(5)]
+            unknown = [await login(client, base_url, f"brak-{BENCH_EMAIL}", "zle-haslo") for _ in range(5)]
+            wrong_ms = statistics.median(t for _, t in wrong) * 1000
+            unknown_ms = statistics.median(t for _, t in unknown) * 1000
+            check("nieistniejący e-mail - 401 w czasie złego hasła",
+                  {s for s, _ in wrong + unknown} == {401} and 0.5 <= unknown_ms / wrong_ms <= 2,
+                  f"złe hasło {wrong_ms:.0f} ms, brak konta {unknown_ms:.0f} ms")
+
+            idle_rss = rss_mib(server.pid)
+            for concurrency in CONCURRENCY_LEVELS:
+                with PeakRss(server.pid) as rss:
+                    level, elapsed = await run_level(client, base_url, concurrency)
+                statuses = Counter(status for status, _ in level)
+                ok = [t for status, t in level if status == 200]
+                rejected = [t for status, t in level if status == 503]
+                rows.append((concurrency, statuses, len(ok) / elapsed, ok, rejected, rss.peak))
+
+        capacity = hashing.HASH_WORKERS + hashing.HASH_QUEUE_LIMIT
+        rss_limit = idle_rss + hashing.HASH_WORKERS * security.ARGON2_MEMORY_COST / 1024 + RSS_MARGIN_MIB
+        check("tylko 200 i 503 pod obciążeniem", all(set(statuses) <= {200, 503} for _, statuses, *_ in rows))
+        overloaded = [row for row in rows if row[0] > capacity]
+        if overloaded:
+            check(f"współbieżność ponad {capacity} (pula + kolejka) - szybkie 503",
+                  all(row[4] and percentile(row[4], 0.95) < percentile(row[3], 0.5) for row in overloaded))
+        peak = max(row[5] for row in rows)
+        check("szczytowe RSS w granicy HASH_WORKERS × ARGON2_MEMORY_COST", peak <= rss_limit,
+              f"{peak:.0f} MiB (spoczynek {idle_rss:.0f} MiB, limit {rss_limit:.0f} MiB)")
+
+        print(f"\nHASH_WORKERS={hashing.HASH_WORKERS}, HASH_QUEUE_LIMIT={hashing.HASH_QUEUE_LIMIT}, "
+              f"Argon2: m={security.ARGON2_MEMORY_COST} KiB, t={security.ARGON2_TIME_COST}, "
+              f"p={security.ARGON2_PARALLELISM}, logowań na poziom: {LOGINS}\n")
+        print("| współbieżność | 200 | 503 | logowań/s | p50 200 [ms] | p95 200 [ms] | p95 503 [ms] | szczyt RSS [MiB] |")
+        print("|---|---|---|---|---|---|---|---|")
+        for concurrency, statuses, throughput, ok, rejected, peak_rss in rows:
+            print(f"| {concurrency} | {statuses[200]} | {statuses[503]} | {throughput:.1f} | "
+                  f"{percentile(ok, 0.5) * 1000:.0f} | {percentile(ok, 0.95) * 1000:.0f} | "
+                  f"{percentile(rejected, 0.95) * 1000:.0f} | {peak_rss:.0f} |")
+    finally:
+        server.terminate()
+        server.wait()
+        delete_user()
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
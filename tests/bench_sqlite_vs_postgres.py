@@ -0,0 +1,94 @@
+"""Porównanie endpointów na SQLite (WAL, app/database.py) i na Postgresie z DATABASE_URL.
+
+Skrypt kopiuje dane z Postgresa do pliku SQLite (schemat z migracji), startuje dwa serwery uvicorn
+z tymi samymi ustawieniami i mierzy req/s oraz opóźnienia na tych samych endpointach.
+Indeks dostępności jest wyłączony - porównujemy zapytania do bazy.
+
+Uruchomienie (Postgres z DATABASE_URL z danymi, konto testowe):
+    python -m tests.bench_sqlite_vs_postgres
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+
+import httpx
+from sqlalchemy import create_engine
+
+from app import models
+from app.database import engine as postgres_engine
+from tests.bench_db_async import CONCURRENCY, DURATION, run_load, wait_ready
+from tests.common import TEST_EMAIL, TEST_PASSWORD
+
+POSTGRES_PORT = 4103
+SQLITE_PORT = 4104
+ENDPOINTS = [
+    "/appointments/doctors",
+    "/appointments/slots?limit=50",
+    "/appointments/slots?specialization=Kardiolog&first_per_doctor=true",
+    "/medications/",
+    "/auth/me",
+]
+
+
+def copy_to_sqlite(sqlite_url: str):
+    """Schemat z migracji (osobny proces - DATABASE_URL czytany przy imporcie), potem dane tabela po tabeli."""
+    subprocess.run([sys.executable, "-m", "app.migrate"], env={**os.environ, "DATABASE_URL": sqlite_url},
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    sqlite_engine = create_engine(sqlite_url)
+    with postgres_engine.connect() as source, sqlite_engine.begin() as target:
+        for table in models.Base.metadata.sorted_tables:
+            rows = [dict(row._mapping) for row in source.execute(table.select())]
+            if rows:
+                target.execute(table.insert(), rows)
+            print(f"    {table.name}: {len(rows)} wierszy")
+    sqlite_engine.dispose()
+
+
+def start_server(port: int, database_url: str) -> subprocess.Popen:
+    env = {**os.environ, "DATABASE_URL": database_url, "AVAILABILITY_INDEX": "false"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def main():
+    workdir = tempfile.mkdtemp(prefix="stumedica-sqlite-")
+    sqlite_url = f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}"
+    print(f"Kopiowanie danych do {sqlite_url}")
+    copy_to_sqlite(sqlite_url)
+
+    backends = [("postgres", POSTGRES_PORT, postgres_engine.url.render_as_string(hide_password=False)),
+                ("sqlite", SQLITE_PORT, sqlite_url)]
+    servers = [start_server(port, url) for _, port, url in backends]
+    limits = httpx.Limits(max_connections=CONCURRENCY * 2, max_keepalive_connections=CONCURRENCY * 2)
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            headers = {}
+            for name, port, _ in backends:
+                await wait_ready(client, f"http://localhost:{port}")
+                login = await client.post(f"http://localhost:{port}/auth/login",
+                                          json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+                if login.status_code != 200:
+                    print(f"Błąd logowania ({name}): {login.status_code} {login.text}")
+                    sys.exit(1)
+                headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+            print(f"\nWspółbieżność: {CONCURRENCY}, czas: {DURATION}s na pomiar\n")
+            print("| Endpoint | Baza | req/s | p50 [ms] | p95 [ms] | Błędy |")
+            print("|---|---|---|---|---|---|")
+            for endpoint in ENDPOINTS:
+                for name, port, _ in backends:
+                    result = await run_load(client, f"http://localhost:{port}{endpoint}", headers)
+                    print(f"| {endpoint} | {name} | {result['rps']} | {result['p50_ms']} | "
+                          f"{result['p95_ms']} | {result['errors']} |")
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+"""Sprawdza konserwację appointments (app/archive.py): partycje, archiwum i historię z obu tabel.
+
+1. Zarezerwowana wizyta sprzed APPOINTMENT_HOT_MONTHS miesięcy trafia do appointments_archive,
+   a wolne terminy z tego okresu znikają (w Postgresie - razem z partycją).
+2. Nowsze wizyty i przyszłe terminy zostają w appointments.
+3. GET /appointments/my-history zwraca wizyty z appointments i z archiwum.
+4. Postgres: termin spoza założonych partycji czeka w appointments_default i przechodzi do nowej partycji,
+   a plan zapytania o wolne terminy nie zagląda do partycji minionych miesięcy.
+
+Skrypt dodaje własnego lekarza i terminy, a na końcu je usuwa. Uruchomienie (konto testowe):
+    python -m tests.check_appointment_archive
+"""
+import asyncio
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, select, text
+
+from app import archive, models
+from app.database import SessionLocal, engine, write_engine
+from app.main import app
+from tests.common import Checks, TEST_EMAIL, TEST_PASSWORD
+
+FREE_SLOTS_SQL = "SELECT id FROM appointments WHERE is_booked = false AND date_time > now() ORDER BY date_time, id"
+
+
+async def _create_partition(month):
+    async with write_engine.begin() as conn:
+        name = await archive.create_partition(conn, month)
+    await write_engine.dispose()
+    return name
+
+
+async def _maintenance(now):
+    result = await archive.run_maintenance(now)
+    # Pula asyncpg jest związana z pętlą zdarzeń - TestClient uruchomi własną
+    await write_engine.dispose()
+    return result
+
+
+def partition_of(db, appointment_id):
+    return db.scalar(text("SELECT tableoid::regclass::text FROM appointments WHERE id = :id"), {"id": appointment_id})
+
+
+def scanned_tables(plan, found):
+    if "Relation Name" in plan:
+        found.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scanned_tables(child, found)
+    return found
+
+
+def main():
+    check = Checks()
+
+    postgres = engine.dialect.name == "postgresql"
+    now = datetime.now(timezone.utc)
+    current_month = archive.month_start(now)
+    cutoff = archive.month_start(now, -archive.APPOINTMENT_HOT_MONTHS)
+    old_month = archive.month_start(cutoff, -1)
+    far_month = archive.month_start(now, archive.APPOINTMENT_PARTITION_MONTHS_AHEAD + 5)
+    created_partitions = []
+
+    with SessionLocal() as db:
+        patient_id = db.scalar(select(models.User.id).where(models.User.email == TEST_EMAIL))
+        if patient_id is None:
+            print(f"Brak konta testowego {TEST_EMAIL}")
+            sys.exit(1)
+        doctor = models.Doctor(name="dr Test Archiwum", specialization="Internista", price_private=1.0)
+        db.add(doctor)
+        db.commit()
+        doctor_id = doctor.id
+
+    try:
+        if postgres:
+            created_partitions.append(asyncio.run(_create_partition(old_month)))
+
+        with SessionLocal() as db:
+            def slot(date_time, booked=False):
+                appointment = models.Appointment(doctor_id=doctor_id, date_time=date_time, is_booked=booked,
+                                                 patient_id=patient_id if booked else None, type="PRIVATE")
+                db.add(appointment)
+                return appointment
+
+            old_booked = slot(old_month + timedelta(days=3, hours=9), booked=True)
+            slot(old_month + timedelta(days=3, hours=10))
+            slot(archive.month_start(old_month, -1) + timedelta(days=3, hours=9))  # w Postgresie poza partycjami
+            recent_booked = slot(current_month + timedelta(hours=1), booked=True)
+            future_free = slot(now + timedelta(days=2))
+            far_free = slot(far_month + timedelta(days=3, hours=9))
+            db.commit()
+            old_booked_id, recent_booked_id, far_free_id = old_booked.id, recent_booked.id, far_free.id
+            kept_ids = {recent_booked.id, future_free.id, far_free.id}
+            if postgres:
+                check("termin spoza partycji w appointments_default",
+                      partition_of(db, far_free_id) == archive.DEFAULT_PARTITION, partition_of(db, far_free_id))
+
+        archive.APPOINTMENT_PARTITION_MONTHS_AHEAD += 5
+        try:
+            result = asyncio.run(_maintenance(now))
+        finally:
+            archive.APPOINTMENT_PARTITION_MONTHS_AHEAD -= 5
+        created_partitions += result.created
+        print(f"Konserwacja: {result}")
+
+        with SessionLocal() as db:
+            archived_ids = set(db.scalars(select(models.ArchivedAppointment.id).where(
+                models.ArchivedAppointment.doctor_id == doctor_id)))
+            hot_ids = set(db.scalars(select(models.Appointment.id).where(models.Appointment.doctor_id == doctor_id)))
+            check("stara zarezerwowana wizyta w archiwum", archived_ids == {old_booked_id}, str(archived_ids))
+            check("stare wolne terminy usunięte, nowsze zostały", hot_ids == kept_ids,
+                  f"zostały: {sorted(hot_ids)}, oczekiwane: {sorted(kept_ids)}")
+            if postgres:
+                check("partycja minionego miesiąca usunięta", archive.partition_name(old_month) in result.dropped,
+                      str(result.dropped))
+                check("termin przeniesiony z appointments_default do nowej partycji",
+                      partition_of(db, far_free_id) == archive.partition_name(far_month),
+                      partition_of(db, far_free_id))
+                plan = db.execute(text("EXPLAIN (FORMAT JSON) " + FREE_SLOTS_SQL)).scalar()
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                past = {name for name in scanned_tables(plan[0]["Plan"], set())
+                        if archive.is_partition(name) and name != archive.DEFAULT_PARTITION
+                        and name < archive.partition_name(current_month)}
+                check("wolne terminy bez partycji minionych miesięcy", not past, str(sorted(past)))
+
+        with TestClient(app) as client:
+            login = client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+            response = client.get("/appointments/my-history", headers=headers)
+            history = response.json() if response.status_code == 200 else []
+            ids = [item["id"] for item in history]
+            dates = [item["date_time"] for item in history]
+            check("historia z appointments i archiwum", {old_booked_id, recent_booked_id} <= set(ids)
+                  and dates == sorted(dates, reverse=True), f"{len(history)} wizyt")
+    finally:
+        with SessionLocal() as db:
+            db.execute(delete(models.ArchivedAppointment).where(models.ArchivedAppointment.doctor_id == doctor_id))
+            db.execute(delete(models.Appointment).where(models.Appointment.doctor_id == doctor_id))
+            db.execute(delete(models.Doctor).where(models.Doctor.id == doctor_id))
+            # Puste partycje założone tylko na potrzeby testu
+            for name in created_partitions:
+                exists = db.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+                if exists and not db.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name})")):
+                    db.execute(text(f"DROP TABLE {name}"))
+            db.commit()
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
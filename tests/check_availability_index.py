@@ -0,0 +1,106 @@
+"""Porównuje indeks dostępności (app/availability.py) z zapytaniem SQL i mierzy czas odpowiedzi obu ścieżek.
+
+Dla każdego zestawu filtrów GET /appointments/slots musi zwrócić to samo z indeksu i z bazy (łącznie z kursorem).
+Sprawdzane jest też usunięcie terminu z indeksu po rezerwacji.
+
+Uruchomienie (baza z wolnymi terminami, konto testowe):
+    python -m tests.check_availability_index
+"""
+import os
+import statistics
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+from app import availability
+from app.main import app
+from tests.common import TEST_EMAIL, TEST_PASSWORD
+
+BENCH_ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "200"))
+
+FILTER_CASES = [
+    {},
+    {"limit": 7},
+    {"specialization": "Kardiolog", "limit": 10},
+    {"doctor_id": 1},
+    {"first_per_doctor": "true"},
+    {"price_max": 170},
+    {"price_min": 170, "type": "PRIVATE"},
+    {"type": "NFZ"},
+    {"weekday": [1, 3, 5], "hour_from": 10, "hour_to": 14},
+    {"date_from": "2026-01-01T00:00:00", "date_to": "2030-01-01T00:00:00Z", "limit": 3},
+]
+
+
+def fetch_all_pages(client, params):
+    """Wszystkie strony po kursorze - porównujemy też stronicowanie."""
+    items, cursor = [], None
+    for _ in range(1000):
+        response = client.get("/appointments/slots", params={**params, **({"cursor": cursor} if cursor else {})})
+        response.raise_for_status()
+        items += response.json()
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return items
+    raise RuntimeError("Stronicowanie się nie kończy")
+
+
+def timed(client, params):
+    samples = []
+    for _ in range(BENCH_ITERATIONS):
+        start = time.perf_counter()
+        client.get("/appointments/slots", params=params)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    failures = []
+    with TestClient(app) as client:
+        # Pierwsze wczytanie robi zadanie tła uruchamiane przy starcie aplikacji
+        deadline = time.monotonic() + 30
+        while not availability.index.ready and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if not availability.index.ready:
+            print("Indeks dostępności nie został wczytany")
+            sys.exit(1)
+
+        for params in FILTER_CASES:
+            availability.AVAILABILITY_INDEX = True
+            from_index = fetch_all_pages(client, params)
+            availability.AVAILABILITY_INDEX = False
+            from_db = fetch_all_pages(client, params)
+            passed = from_index == from_db
+            print(f"{'✅ PASS' if passed else '❌ FAIL'} {params} - indeks: {len(from_index)}, baza: {len(from_db)}")
+            if not passed:
+                failures.append(str(params))
+
+        availability.AVAILABILITY_INDEX = True
+        login = client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+        if login.status_code == 200:
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+            slot = client.get("/appointments/slots", params={"limit": 1}).json()
+            if slot:
+                client.post(f"/appointments/{slot[0]['id']}/book", json={"notes": "Test indeksu"}, headers=headers)
+                still_listed = any(s["id"] == slot[0]["id"] for s in fetch_all_pages(client, {}))
+                print(f"{'❌ FAIL' if still_listed else '✅ PASS'} zarezerwowany termin znika z indeksu")
+                if still_listed:
+                    failures.append("rezerwacja")
+        else:
+            print("Pominięto test rezerwacji (błąd logowania)")
+
+        print("\n| Zapytanie | indeks p50 [ms] | baza p50 [ms] |")
+        print("|---|---|---|")
+        for params in ({"specialization": "Kardiolog", "limit": 10}, {"limit": 50}):
+            availability.AVAILABILITY_INDEX = True
+            index_ms = timed(client, params)
+            availability.AVAILABILITY_INDEX = False
+            db_ms = timed(client, params)
+            print(f"| {params} | {index_ms:.2f} | {db_ms:.2f} |")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Sprawdza metryki i ustawienia puli połączeń (app/db_pool.py) na małej puli (2 połączenia, bez nadmiarowych).
+
+1. Zwykłe żądanie - histogram czasu pobrania połączenia i liczba połączeń w puli.
+2. DB_POOL_PRE_PING=idle - połączenia zerwane po stronie bazy (pg_terminate_backend) są wykrywane przy pobraniu,
+   a żądanie kończy się sukcesem na nowym połączeniu.
+3. Wyczerpana pula - oczekiwanie i przekroczenie DB_POOL_TIMEOUT są widoczne w metrykach.
+
+Uruchomienie (Postgres z DATABASE_URL):
+    python -m tests.check_db_pool
+"""
+import os
+import sys
+import time
+
+os.environ.update({
+    "DB_POOL_SIZE": "2",
+    "DB_MAX_OVERFLOW": "0",
+    "DB_POOL_TIMEOUT": "0.5",
+    "DB_POOL_PRE_PING": "idle",
+    "DB_POOL_PRE_PING_IDLE_SECONDS": "0",
+    "AVAILABILITY_INDEX": "false",
+})
+
+import anyio
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+
+from app import db_pool
+from app.database import async_engine, engine
+from app.main import app
+from tests.common import Checks
+
+server_pids = set()
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _remember_pid(dbapi_connection, connection_record):
+    server_pids.add(dbapi_connection.driver_connection.get_server_pid())
+
+
+def value(metric, *labels):
+    child = metric.labels(*labels)
+    return child.count if hasattr(child, "count") else child.value
+
+
+async def hold_connections(count: int, seconds: float):
+    """Zajmuje połączenia z puli async (jak długie zapytania), żeby kolejne żądanie musiało czekać."""
+    async with anyio.create_task_group() as group:
+        for _ in range(count):
+            async def hold():
+                async with async_engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+                    await anyio.sleep(seconds)
+            group.start_soon(hold)
+
+
+def main():
+    if async_engine.dialect.name != "postgresql":
+        print("Test puli wymaga Postgresa (DATABASE_URL).")
+        sys.exit(1)
+
+    check = Checks()
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        before = value(db_pool.CHECKOUT_SECONDS, "primary")
+        response = client.get("/appointments/doctors")
+        check("pobranie połączenia w histogramie",
+              response.status_code == 200 and value(db_pool.CHECKOUT_SECONDS, "primary") > before)
+        check("połączenia w puli widoczne w metrykach",
+              value(db_pool.POOL_CONNECTIONS, "primary", "idle") >= 1,
+              f"idle: {value(db_pool.POOL_CONNECTIONS, 'primary', 'idle')}")
+
+        with engine.connect() as conn:
+            for pid in server_pids:
+                conn.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": pid})
+        failed_pings = value(db_pool.POOL_PINGS, "primary", "failed")
+        response = client.get("/appointments/doctors")
+        check("zerwane połączenie wykryte przy pobraniu (idle pre-ping)",
+              response.status_code == 200 and value(db_pool.POOL_PINGS, "primary", "failed") > failed_pings,
+              f"status: {response.status_code}")
+
+        waits = value(db_pool.POOL_WAITS, "primary")
+        timeouts = value(db_pool.POOL_TIMEOUTS, "primary")
+        holder = client.portal.start_task_soon(hold_connections, db_pool.DB_POOL_SIZE, 2.0)
+        time.sleep(0.3)
+        response = client.get("/appointments/doctors")
+        holder.result()
+        check("wyczerpana pula: oczekiwanie i timeout w metrykach",
+              response.status_code == 500 and value(db_pool.POOL_WAITS, "primary") > waits
+              and value(db_pool.POOL_TIMEOUTS, "primary") > timeouts,
+              f"status: {response.status_code}")
+
+        response = client.get("/appointments/doctors")
+        check("po zwolnieniu połączeń pula działa", response.status_code == 200)
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
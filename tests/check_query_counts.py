@@ -0,0 +1,112 @@
+"""Pilnuje liczby zapytań SQL na żądanie - test nie przechodzi, gdy wraca N+1.
+
+Każdy endpoint i narzędzie asystenta ma stały limit zapytań, niezależny od liczby zwracanych wierszy.
+Limit liczy się z nagłówka X-DB-Queries (app/query_count.py). Dodatkowo skrypt sprawdza sam mechanizm:
+zapytanie z celowym N+1 musi zostać wykryte, a niejawne doczytanie relacji musi rzucić błąd (lazy="raise_on_sql").
+
+Uruchomienie (baza z danymi: co najmniej 2 wolne terminy, konto testowe z ai_allowed):
+    python -m tests.check_query_counts
+"""
+import os
+import sys
+
+os.environ["DB_QUERY_COUNT_HEADER"] = "true"
+os.environ["LLM_PROVIDER"] = "fake"
+# Sprawdzamy zapytania SQL - bez indeksu dostępności w pamięci (app/availability.py)
+os.environ["AVAILABILITY_INDEX"] = "false"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import lazyload
+
+from app import models
+from app.database import SessionLocal
+from app.main import app
+from app.query_count import TooManyQueries, count_queries
+from tests.common import Checks, TEST_EMAIL, TEST_PASSWORD
+
+# (metoda, URL, czy z tokenem, maksymalna liczba zapytań)
+# Terminy: zapisane w tabeli + szablony grafików, a gdy są szablony - ich wyjątki i zajęte godziny (app/schedule.py)
+ENDPOINT_LIMITS = [
+    ("GET", "/appointments/doctors", False, 1),
+    ("GET", "/appointments/slots", False, 4),
+    ("GET", "/appointments/slots?specialization=Kardiolog", False, 4),
+    ("GET", "/appointments/slots?first_per_doctor=true", False, 4),
+    ("GET", "/auth/me", True, 1),
+    ("GET", "/medications/", True, 2),
+    ("GET", "/appointments/my-history", True, 3),
+]
+# (prompt, maksymalna liczba zapytań) - użytkownik + zapytania narzędzia
+CHAT_LIMITS = [
+    ("Jakie są moje leki?", 2),
+    ("Znajdź wolny termin do kardiologa.", 5),
+    ("Pokaż historię wizyt", 3),  # wizyty z archiwum (app/archive.py) + ich lekarze
+]
+
+
+def check_harness(check: Checks):
+    """Sam licznik musi wykrywać N+1, a relacje bez jawnego ładowania - rzucać błąd."""
+    db = SessionLocal()
+    try:
+        detected = False
+        try:
+            with count_queries(max_statements=1):
+                slots = db.scalars(
+                    select(models.Appointment).options(lazyload(models.Appointment.doctor)).limit(3)
+                ).all()
+                _ = [slot.doctor.name for slot in slots]
+        except TooManyQueries:
+            detected = True
+        check("harness: count_queries wykrywa celowe N+1", detected or len(slots) <= 1)
+
+        # Czysta mapa tożsamości - inaczej lekarz z poprzedniego zapytania wczyta się bez SQL
+        db.expunge_all()
+        slot = db.scalars(select(models.Appointment).limit(1)).first()
+        if slot is not None:
+            try:
+                _ = slot.doctor
+                raised = False
+            except InvalidRequestError:
+                raised = True
+            check("harness: Appointment.doctor nie doczytuje się leniwie (lazy='raise_on_sql')", raised)
+    finally:
+        db.close()
+
+
+def main():
+    check = Checks()
+    check_harness(check)
+
+    # Błąd 500 (np. MissingGreenlet przy leniwym doczytaniu) ma dać FAIL, a nie przerwać skrypt
+    with TestClient(app, raise_server_exceptions=False) as client:
+        login = client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+        if login.status_code != 200:
+            print(f"Błąd logowania: {login.status_code} {login.text}")
+            sys.exit(1)
+        headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+        results = []
+        for method, url, auth, limit in ENDPOINT_LIMITS:
+            response = client.request(method, url, headers=headers if auth else None)
+            rows = len(response.json()) if response.status_code == 200 and isinstance(response.json(), list) else None
+            results.append((f"{method} {url}", response, limit, rows))
+
+        for prompt, limit in CHAT_LIMITS:
+            response = client.post("/chat/ask", json={"history": [{"role": "user", "content": prompt}]},
+                                   headers=headers)
+            results.append((f"chat: {prompt}", response, limit, None))
+
+    for name, response, limit, rows in results:
+        queries = int(response.headers.get("x-db-queries", -1))
+        rows_info = f", wierszy: {rows}" if rows is not None else ""
+        check(name, response.status_code == 200 and 0 <= queries <= limit,
+              f"zapytań: {queries} (limit {limit}){rows_info}")
+        if rows is not None and rows < 2:
+            print("    Uwaga: mniej niż 2 wiersze - test nie wykryje N+1 dla tego endpointu")
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Sprawdza plany zapytań (EXPLAIN) wszystkich zapytań wykonywanych przez routery.
+
+Skrypt odpytuje endpointy aplikacji w procesie (TestClient), przechwytuje każde zapytanie SQL
+i wykonuje dla niego EXPLAIN z wyłączonym skanem sekwencyjnym (enable_seqscan = off).
+Jeśli mimo to w planie zostaje Seq Scan albo skan całego indeksu (bez Index Cond),
+żaden indeks nie obsługuje tego zapytania.
+Zapytania bez WHERE (pełne listy, np. GET /appointments/doctors) są pomijane.
+
+Uruchomienie (Postgres z DATABASE_URL, schemat po `alembic upgrade head`, konto testowe z ai_allowed):
+    python -m tests.check_query_plans
+"""
+import json
+import os
+import re
+import sys
+
+# Narzędzia asystenta wołamy przez atrapę LLM - bez klucza API i sieci
+os.environ["LLM_PROVIDER"] = "fake"
+# Sprawdzamy zapytania SQL - bez indeksu dostępności w pamięci (app/availability.py)
+os.environ["AVAILABILITY_INDEX"] = "false"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import async_engine
+from app.main import app
+from tests.common import Checks, TEST_EMAIL, TEST_PASSWORD
+
+PUBLIC_REQUESTS = [
+    ("GET", "/appointments/doctors", None),
+    ("GET", "/appointments/doctors?specialization=Kardiolog", None),
+    ("GET", "/appointments/slots", None),
+    ("GET", "/appointments/slots?specialization=Kardiolog", None),
+    ("GET", "/appointments/slots?doctor_id=1", None),
+    ("GET", "/appointments/slots?limit=5&cursor=MjAyNi0wMS0wMVQwMDowMDowMCswMDowMHwx", None),
+    ("GET", "/appointments/slots?first_per_doctor=true&type=PRIVATE&price_max=500", None),
+]
+AUTH_REQUESTS = [
+    ("GET", "/auth/me", None),
+    ("GET", "/medications/", None),
+    ("PUT", "/medications/0", {"name": "Plan", "dosage": "1"}),
+    ("DELETE", "/medications/0", None),
+    ("POST", "/appointments/0/book", {"notes": "Plan"}),
+    ("GET", "/appointments/my-history", None),
+]
+CHAT_PROMPTS = [
+    "Jakie są moje leki?",
+    "Znajdź wolny termin do kardiologa.",
+    "Zarezerwuj wizytę ID 0",
+    "Pokaż historię wizyt",
+]
+
+plans = {}
+
+
+def _full_scans(node, found):
+    node_type = node.get("Node Type")
+    if node_type == "Seq Scan":
+        found.append(f"Seq Scan on {node.get('Relation Name')}")
+    elif node_type in ("Index Scan", "Index Only Scan", "Bitmap Index Scan") and "Index Cond" not in node:
+        # Przejście po całym indeksie (np. klucza głównego) tylko omija enable_seqscan
+        found.append(f"{node_type} using {node.get('Index Name')} (bez Index Cond)")
+    for child in node.get("Plans", []):
+        _full_scans(child, found)
+    return found
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _explain(conn, cursor, statement, parameters, context, executemany):
+    sql = statement.strip()
+    if not re.match(r"(SELECT|UPDATE|DELETE)\b", sql, re.I) or not re.search(r"\bWHERE\b", sql, re.I):
+        return
+    if sql in plans:
+        return
+
+    explain_cursor = conn.connection.dbapi_connection.cursor()
+    # SET LOCAL - tylko w bieżącej transakcji, zwrot połączenia do puli przywraca ustawienie
+    explain_cursor.execute("SET LOCAL enable_seqscan = off")
+    explain_cursor.execute("EXPLAIN (FORMAT JSON) " + sql, parameters)
+    plan = explain_cursor.fetchone()[0]
+    explain_cursor.close()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    plans[sql] = plan[0]["Plan"]
+
+
+def main():
+    if async_engine.dialect.name != "postgresql":
+        print("Test planów wymaga Postgresa (DATABASE_URL).")
+        sys.exit(1)
+
+    with TestClient(app) as client:
+        for method, url, body in PUBLIC_REQUESTS:
+            client.request(method, url, json=body)
+
+        login = client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+        if login.status_code != 200:
+            print(f"Błąd logowania: {login.status_code} {login.text}")
+            sys.exit(1)
+        headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+        for method, url, body in AUTH_REQUESTS:
+            client.request(method, url, json=body, headers=headers)
+        for prompt in CHAT_PROMPTS:
+            client.post("/chat/ask", json={"history": [{"role": "user", "content": prompt}]}, headers=headers)
+
+    check = Checks()
+    for sql, plan in plans.items():
+        full_scans = _full_scans(plan, [])
+        check(" ".join(sql.split())[:150], not full_scans)
+        for scan in full_scans:
+            print(f"    {scan}")
+
+    print(f"\nZapytań: {len(plans)}, bez indeksu: {check.results.count(False)}")
+    check("przechwycono zapytania do sprawdzenia", bool(plans))
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
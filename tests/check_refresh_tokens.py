@@ -0,0 +1,94 @@
+"""Sprawdza krótkie tokeny dostępu i rotację tokenów odświeżania (app/tokens.py).
+
+1. Logowanie zwraca token dostępu ważny ACCESS_TOKEN_MINUTES z claimami konta i token odświeżania.
+2. Pierwsze żądanie ze świeżym tokenem nie pyta bazy o konto (konto z claimów).
+3. POST /auth/refresh wydaje nową parę, a zużyty token odświeżania nie działa drugi raz -
+   jego ponowne użycie unieważnia też token wydany w zamian (cała rodzina).
+4. Odświeżanie z ciasteczka, wylogowanie unieważnia token odświeżania.
+5. Konto dezaktywowane w bazie nie odświeży tokenu.
+
+Skrypt na chwilę dezaktywuje konto testowe i na końcu zawsze je przywraca. Uruchomienie:
+    python -m tests.check_refresh_tokens
+"""
+import os
+import sys
+import time
+
+os.environ["DB_QUERY_COUNT_HEADER"] = "true"
+os.environ["USER_CACHE_VERSION_CHECK_SECONDS"] = "0.5"
+
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from app import security, tokens, user_cache
+from app.main import app
+from tests.common import Checks, TEST_EMAIL, TEST_PASSWORD, set_active
+
+
+def main():
+    check = Checks()
+
+    try:
+        with TestClient(app, base_url="https://testserver") as client:
+            deadline = time.monotonic() + 5
+            while not user_cache.cache.trusted and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+            login = client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+            if login.status_code != 200:
+                print(f"Nie udało się zalogować na {TEST_EMAIL}: {login.status_code}")
+                sys.exit(1)
+            body = login.json()
+            claims = jwt.decode(body["token"], security.SECRET_KEY, algorithms=[security.ALGORITHM])
+            lifetime = claims["exp"] - time.time()
+            check("token dostępu krótki i z claimami konta",
+                  0 < lifetime <= tokens.ACCESS_TOKEN_MINUTES * 60 + 1
+                  and {"uid", "name", "account_type", "ai_allowed", "ver"} <= set(claims),
+                  f"ważny {lifetime:.0f} s")
+            check("token odświeżania w odpowiedzi i w ciasteczku",
+                  bool(body.get("refresh_token")) and client.cookies.get("refresh_token") == body["refresh_token"])
+
+            me = client.get("/auth/me", headers={"Authorization": f"Bearer {body['token']}"})
+            check("pierwsze żądanie bez zapytania o konto",
+                  me.status_code == 200 and me.headers.get("x-db-queries") == "0",
+                  f"{me.headers.get('x-db-queries')} zapytań")
+
+            first_refresh = body["refresh_token"]
+            rotated = client.post("/auth/refresh", json={"refresh_token": first_refresh})
+            second_refresh = rotated.json().get("refresh_token") if rotated.status_code == 200 else None
+            new_me = client.get("/auth/me", headers={"Authorization": f"Bearer {rotated.json().get('token')}"})
+            check("odświeżenie - nowa para tokenów",
+                  second_refresh not in (None, first_refresh) and new_me.status_code == 200)
+
+            reused = client.post("/auth/refresh", json={"refresh_token": first_refresh})
+            after_reuse = client.post("/auth/refresh", json={"refresh_token": second_refresh})
+            check("ponowne użycie zużytego tokenu - 401 i unieważniona rodzina",
+                  (reused.status_code, after_reuse.status_code) == (401, 401),
+                  f"{reused.status_code}, {after_reuse.status_code}")
+
+            client.cookies.clear()
+            client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+            from_cookie = client.post("/auth/refresh")
+            cookie_refresh = client.cookies.get("refresh_token")
+            check("odświeżenie z ciasteczka", from_cookie.status_code == 200
+                  and cookie_refresh == from_cookie.json()["refresh_token"])
+            client.post("/auth/logout")
+            after_logout = client.post("/auth/refresh", json={"refresh_token": cookie_refresh})
+            check("wylogowanie unieważnia token odświeżania", after_logout.status_code == 401,
+                  str(after_logout.status_code))
+
+            login = client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+            set_active(False)
+            inactive = client.post("/auth/refresh", json={"refresh_token": login.json()["refresh_token"]})
+            inactive_login = client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+            check("konto nieaktywne - bez odświeżenia i logowania",
+                  (inactive.status_code, inactive_login.status_code) == (401, 403),
+                  f"{inactive.status_code}, {inactive_login.status_code}")
+    finally:
+        set_active(True)
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Sprawdza kierowanie zapytań na repliki (app/replicas.py).
+
+Dla każdego żądania liczy zapytania SQL wykonane na bazie głównej i na replikach:
+- odczyty (GET, narzędzia asystenta tylko do odczytu) idą na replikę,
+- zapis i odczyty tego samego użytkownika tuż po nim - na bazę główną (read-your-writes),
+- po upływie okna odczyty wracają na replikę,
+- niedziałająca replika (dodawana przez skrypt, port 1) nie dostaje żadnego zapytania.
+
+Wymaga prawdziwej repliki bazy z DATABASE_URL (np. drugiej lokalnej instancji Postgresa
+postawionej przez `pg_basebackup -R`):
+    DATABASE_REPLICA_URLS=postgresql://...replika... python -m tests.check_replica_routing
+"""
+import os
+import sys
+import time
+from collections import Counter
+
+if not os.getenv("DATABASE_REPLICA_URLS"):
+    print("Ustaw DATABASE_REPLICA_URLS (adres repliki bazy z DATABASE_URL)")
+    sys.exit(1)
+
+DEAD_REPLICA_URL = "postgresql://postgres@127.0.0.1:1/stumedica"
+os.environ["DATABASE_REPLICA_URLS"] += "," + DEAD_REPLICA_URL
+os.environ["REPLICA_READ_YOUR_WRITES_SECONDS"] = "2"
+os.environ["REPLICA_HEALTH_CHECK_SECONDS"] = "0.5"
+os.environ["LLM_PROVIDER"] = "fake"
+# Odczyty wolnych terminów mają trafić do bazy, a nie do indeksu w pamięci
+os.environ["AVAILABILITY_INDEX"] = "false"
+# Każde żądanie ma czytać konto z bazy (główna albo replika), a nie z pamięci podręcznej (app/user_cache.py)
+os.environ["USER_CACHE_SIZE"] = "0"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import replicas
+from app.database import async_engine
+from app.main import app
+from tests.common import Checks, TEST_EMAIL, TEST_PASSWORD
+
+
+statements = Counter()
+
+
+def _count_on(engine, name):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if "pg_is_in_recovery" not in statement:  # sprawdzanie stanu repliki w tle
+            statements[name] += 1
+
+
+_count_on(async_engine.sync_engine, "primary")
+for replica in replicas.router.replicas:
+    _count_on(replica.engine.sync_engine, replica.name)
+live, dead = replicas.router.replicas[0], replicas.router.replicas[-1]
+
+
+def routed(client, method, url, **kwargs):
+    """Wykonuje żądanie i zwraca (odpowiedź, liczniki zapytań per baza)."""
+    statements.clear()
+    response = client.request(method, url, **kwargs)
+    return response, dict(statements)
+
+
+def main():
+    check = Checks()
+
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 15
+        while not live.healthy and time.monotonic() < deadline:
+            time.sleep(0.1)
+        check("replika zdrowa, niedziałająca replika wyłączona", live.healthy and not dead.healthy,
+              f"{live.name}: {live.healthy}, {dead.name}: {dead.healthy}")
+
+        login = client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+        if login.status_code != 200:
+            print(f"Błąd logowania: {login.status_code} {login.text}")
+            sys.exit(1)
+        headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+        for url in ("/appointments/doctors", "/appointments/slots", "/medications/", "/auth/me",
+                    "/appointments/my-history"):
+            response, counts = routed(client, "GET", url, headers=headers)
+            check(f"GET {url} czyta z repliki", response.status_code == 200 and set(counts) == {live.name}, counts)
+
+        response, counts = routed(client, "POST", "/chat/ask", headers=headers,
+                                  json={"history": [{"role": "user", "content": "Jakie są moje leki?"}]})
+        check("narzędzie get_my_medications czyta z repliki",
+              response.status_code == 200 and set(counts) == {live.name}, counts)
+
+        response, counts = routed(client, "POST", "/medications/", headers=headers,
+                                  json={"name": "Test replik", "dosage": "1"})
+        med_id = response.json().get("id") if response.status_code == 200 else None
+        check("zapis idzie na bazę główną", med_id is not None and counts.get("primary", 0) > 0, counts)
+
+        # Konto z tokenu jest wczytywane, zanim wiadomo, kto pyta - to jedno zapytanie może iść na replikę
+        response, counts = routed(client, "GET", "/medications/", headers=headers)
+        check("odczyt tuż po zapisie z bazy głównej (read-your-writes)",
+              counts.get("primary", 0) >= 1 and counts.get(live.name, 0) <= 1
+              and any(m["id"] == med_id for m in response.json()), counts)
+
+        time.sleep(replicas.REPLICA_READ_YOUR_WRITES_SECONDS + 0.5)
+        response, counts = routed(client, "GET", "/medications/", headers=headers)
+        check("po oknie read-your-writes odczyt wraca na replikę (z nowym lekiem)",
+              set(counts) == {live.name} and any(m["id"] == med_id for m in response.json()), counts)
+
+        for _ in range(10):
+            routed(client, "GET", "/appointments/doctors")
+            if statements[dead.name]:
+                break
+        check("niedziałająca replika nie dostaje zapytań", statements[dead.name] == 0)
+
+        if med_id is not None:
+            client.delete(f"/medications/{med_id}", headers=headers)
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Sprawdza terminy z grafików lekarzy (app/schedule.py) - od szablonu do rezerwacji.
+
+1. Konto lekarza (powiązane przez doctors.user_id) zakłada szablon godzin; nakładający się szablon - 409,
+   konto pacjenta - 403.
+2. GET /appointments/slots pokazuje terminy z grafiku (ujemne id) tak samo z indeksu i z bazy, ze stronicowaniem,
+   a w appointments nie przybywa żadnego wiersza.
+3. Wyjątek (dzień wolny) ukrywa terminy tego dnia.
+4. Rezerwacja terminu z grafiku tworzy jeden wiersz, druga próba dostaje 409, a termin znika z wyszukiwania.
+
+Skrypt tworzy własnego lekarza i konto lekarza, a na końcu je usuwa. Uruchomienie (konto testowe pacjenta):
+    python -m tests.check_schedule_slots
+"""
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, func, select, update
+
+from app import availability, models, schedule
+from app.database import SessionLocal
+from app.main import app
+from tests.common import Checks, TEST_EMAIL, TEST_PASSWORD
+
+DOCTOR_PASSWORD = "Grafik123!"
+SLOTS_PER_DAY = 4  # 10:00-12:00 po 30 minut
+
+
+def fetch_all_pages(client, params):
+    items, cursor = [], None
+    for _ in range(1000):
+        response = client.get("/appointments/slots", params={**params, **({"cursor": cursor} if cursor else {})})
+        response.raise_for_status()
+        items += response.json()
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return items
+    raise RuntimeError("Stronicowanie się nie kończy")
+
+
+def both_paths(client, params):
+    """(z indeksu, z bazy)"""
+    availability.AVAILABILITY_INDEX = True
+    from_index = fetch_all_pages(client, params)
+    availability.AVAILABILITY_INDEX = False
+    from_db = fetch_all_pages(client, params)
+    availability.AVAILABILITY_INDEX = True
+    return from_index, from_db
+
+
+def appointment_rows(doctor_id):
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).where(models.Appointment.doctor_id == doctor_id))
+
+
+def login(client, email, password):
+    response = client.post("/auth/login", json={"email": email, "password": password})
+    if response.status_code != 200:
+        print(f"Błąd logowania ({email}): {response.status_code} {response.text}")
+        sys.exit(1)
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+def main():
+    check = Checks()
+
+    doctor_email = f"grafik-{uuid.uuid4().hex[:8]}@stumedica.pl"
+    with SessionLocal() as db:
+        doctor = models.Doctor(name="dr Test Grafiku", specialization="Internista", price_private=1.0)
+        db.add(doctor)
+        db.commit()
+        doctor_id = doctor.id
+
+    try:
+        with TestClient(app) as client:
+            deadline = time.monotonic() + 30
+            while not availability.index.ready and time.monotonic() < deadline:
+                time.sleep(0.1)
+
+            client.post("/auth/register", json={"email": doctor_email, "password": DOCTOR_PASSWORD,
+                                                "name": "Test Grafiku", "account_type": "doctor"})
+            with SessionLocal() as db:
+                db.execute(update(models.Doctor).where(models.Doctor.id == doctor_id).values(
+                    user_id=select(models.User.id).where(models.User.email == doctor_email).scalar_subquery()))
+                db.commit()
+            doctor_headers = login(client, doctor_email, DOCTOR_PASSWORD)
+            patient_headers = login(client, TEST_EMAIL, TEST_PASSWORD)
+
+            # Jutro (czas przychodni) - pierwszy dzień z terminami, bez ryzyka, że godziny już minęły
+            first_day = datetime.now(schedule.CLINIC_TIMEZONE).date() + timedelta(days=1)
+            template = {"weekday": first_day.isoweekday(), "start_time": "10:00", "end_time": "12:00",
+                        "slot_minutes": 30}
+            response = client.post("/schedule/templates", json=template, headers=doctor_headers)
+            check("lekarz zakłada szablon", response.status_code == 200, response.text[:100])
+            response = client.post("/schedule/templates", json={**template, "start_time": "11:00", "end_time": "13:00"},
+                                   headers=doctor_headers)
+            check("nakładający się szablon odrzucony", response.status_code == 409, str(response.status_code))
+            response = client.get("/schedule/templates", headers=patient_headers)
+            check("konto pacjenta nie ma dostępu do grafiku", response.status_code == 403, str(response.status_code))
+
+            params = {"doctor_id": doctor_id, "limit": 7}
+            from_index, from_db = both_paths(client, params)
+            weeks = schedule.SCHEDULE_HORIZON_DAYS // 7
+            check("terminy z grafiku: indeks = baza (ze stronicowaniem)",
+                  from_index == from_db and len(from_db) >= weeks * SLOTS_PER_DAY,
+                  f"indeks: {len(from_index)}, baza: {len(from_db)}")
+            check("terminy z grafiku mają ujemne id i typ z szablonu",
+                  all(slot["id"] < 0 and slot["type"] == "PRIVATE" for slot in from_db))
+            check("w appointments nie przybyło wierszy", appointment_rows(doctor_id) == 0)
+
+            response = client.post("/schedule/exceptions", json={"date": first_day.isoformat(), "reason": "Urlop"},
+                                   headers=doctor_headers)
+            from_index, from_db = both_paths(client, params)
+            first_dates = {datetime.fromisoformat(slot["date_time"]).astimezone(schedule.CLINIC_TIMEZONE).date()
+                           for slot in from_db}
+            check("dzień wolny ukrywa terminy", response.status_code == 200 and first_day not in first_dates
+                  and from_index == from_db, f"{len(from_db)} terminów")
+
+            slot = from_db[0]
+            response = client.post(f"/appointments/{slot['id']}/book", json={"notes": "Test grafiku"},
+                                   headers=patient_headers)
+            booked = response.json() if response.status_code == 200 else {}
+            check("rezerwacja terminu z grafiku", response.status_code == 200 and booked.get("id", -1) > 0
+                  and booked.get("date_time") == slot["date_time"] and appointment_rows(doctor_id) == 1,
+                  response.text[:100])
+            response = client.post(f"/appointments/{slot['id']}/book", json={}, headers=patient_headers)
+            check("druga rezerwacja tego samego terminu - 409", response.status_code == 409, str(response.status_code))
+
+            from_index, from_db = both_paths(client, params)
+            check("zarezerwowany termin znika z wyszukiwania (indeks i baza)",
+                  all(s["date_time"] != slot["date_time"] for s in from_index + from_db))
+
+            response = client.post(f"/appointments/{slot['id'] - 1}/book", json={}, headers=patient_headers)
+            check("godzina spoza grafiku - 404", response.status_code == 404, str(response.status_code))
+    finally:
+        with SessionLocal() as db:
+            db.execute(delete(models.Appointment).where(models.Appointment.doctor_id == doctor_id))
+            db.execute(delete(models.ScheduleException).where(models.ScheduleException.doctor_id == doctor_id))
+            db.execute(delete(models.ScheduleTemplate).where(models.ScheduleTemplate.doctor_id == doctor_id))
+            db.execute(delete(models.Doctor).where(models.Doctor.id == doctor_id))
+            db.execute(delete(models.User).where(models.User.email == doctor_email))
+            db.commit()
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
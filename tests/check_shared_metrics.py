@@ -0,0 +1,156 @@
+"""Sprawdza agregację metryk między workerami przez pliki mmap w METRICS_DIR (app/metrics.py).
+
+1. Kilka procesów zapisuje znane liczby zdarzeń - collect() zwraca dokładne sumy liczników i histogramów.
+2. Po zakończeniu workera jego liczniki zostają w sumie, a wskaźniki (gauge) znikają.
+3. Serwer z kilkoma workerami uvicorna: każdy odczyt /metrics pokazuje tę samą, pełną liczbę żądań,
+   niezależnie od tego, który worker odpowiada.
+4. Koszt zapisu do pliku na gorącej ścieżce (inc / observe) mieści się w METRICS_WRITE_BUDGET_NS.
+
+Uruchomienie (punkt 3 - baza z DATABASE_URL, migracje już wykonane):
+    python -m tests.check_shared_metrics
+METRICS_WORKERS (domyślnie 3), METRICS_REQUESTS (domyślnie 300).
+"""
+import glob
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+METRICS_DIR = tempfile.mkdtemp(prefix="stumedica-metrics-")
+os.environ["METRICS_DIR"] = METRICS_DIR
+
+import httpx
+
+from app import metrics
+from tests.common import Checks
+
+PORT = 4104
+WORKERS = int(os.getenv("METRICS_WORKERS", "3"))
+REQUESTS = int(os.getenv("METRICS_REQUESTS", "300"))
+WRITE_BUDGET_NS = float(os.getenv("METRICS_WRITE_BUDGET_NS", "2000"))
+EVENTS_PER_PROCESS = 1000
+
+# Proces-worker: zapisuje EVENTS_PER_PROCESS zdarzeń i czeka na zamknięcie stdin
+WORKER_SCRIPT = f"""
+import sys
+from app import metrics
+metrics.open_worker_file()
+calls = metrics.REGISTRY.counter("check_calls_total", "test", ["worker"])
+latency = metrics.REGISTRY.histogram("check_latency_seconds", "test")
+alive = metrics.REGISTRY.gauge("check_alive", "test")
+alive.set(1)
+for i in range({EVENTS_PER_PROCESS}):
+    calls.labels(sys.argv[1]).inc()
+    calls.labels("all").inc()
+    latency.observe(0.003 if i % 2 else 0.2)
+print("ready", flush=True)
+sys.stdin.read()
+"""
+
+
+def sample_value(snapshot: dict, name: str, labels: list) -> float:
+    for sample in snapshot.get(name, {"samples": []})["samples"]:
+        if sample["labels"] == labels:
+            return sample.get("value", sample.get("count"))
+    return 0
+
+
+def prometheus_count(text: str, route: str) -> int:
+    """Suma stumedica_http_request_duration_seconds_count dla szablonu ścieżki (wszystkie statusy)."""
+    pattern = re.compile(r'^stumedica_http_request_duration_seconds_count\{[^}]*route="' + re.escape(route)
+                         + r'"[^}]*\} (\S+)$', re.MULTILINE)
+    return int(sum(float(value) for value in pattern.findall(text)))
+
+
+def main():
+    check = Checks()
+
+    calls = metrics.REGISTRY.counter("check_calls_total", "test", ["worker"])
+    metrics.REGISTRY.histogram("check_latency_seconds", "test")
+    metrics.REGISTRY.gauge("check_alive", "test")
+
+    workers = [subprocess.Popen([sys.executable, "-c", WORKER_SCRIPT, str(i)], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, text=True) for i in range(WORKERS)]
+    for worker in workers:
+        worker.stdout.readline()
+
+    snapshot = metrics.collect()
+    total = sample_value(snapshot, "check_calls_total", ["all"])
+    per_worker = [sample_value(snapshot, "check_calls_total", [str(i)]) for i in range(WORKERS)]
+    latency = snapshot["check_latency_seconds"]["samples"][0]
+    check("sumy liczników ze wszystkich procesów",
+          total == WORKERS * EVENTS_PER_PROCESS and per_worker == [EVENTS_PER_PROCESS] * WORKERS,
+          f"{total:.0f}, {per_worker}")
+    fast = latency["counts"][metrics.DEFAULT_BUCKETS.index(0.005)]
+    check("sumy kubełków histogramu", latency["count"] == WORKERS * EVENTS_PER_PROCESS
+          and fast == WORKERS * EVENTS_PER_PROCESS // 2, f"{latency['count']} obserwacji, {fast} w ≤ 5 ms")
+    check("wskaźniki żyjących workerów", sample_value(snapshot, "check_alive", []) == WORKERS)
+
+    workers[0].stdin.close()
+    workers[0].wait()
+    snapshot = metrics.collect()
+    check("zakończony worker - liczniki zostają, wskaźnik znika",
+          sample_value(snapshot, "check_calls_total", ["all"]) == WORKERS * EVENTS_PER_PROCESS
+          and sample_value(snapshot, "check_alive", []) == WORKERS - 1)
+    for worker in workers[1:]:
+        worker.stdin.close()
+        worker.wait()
+
+    child = calls.labels("overhead")
+    plain_inc = timeit.timeit(child.inc, number=100000) / 100000 * 1e9
+    histogram = metrics.REGISTRY.histogram("check_overhead_seconds", "test").labels()
+    plain_observe = timeit.timeit(lambda: histogram.observe(0.01), number=100000) / 100000 * 1e9
+    metrics.open_worker_file()
+    mmap_inc = timeit.timeit(child.inc, number=100000) / 100000 * 1e9
+    mmap_observe = timeit.timeit(lambda: histogram.observe(0.01), number=100000) / 100000 * 1e9
+    check(f"koszt zapisu do pliku w {WRITE_BUDGET_NS:.0f} ns", max(mmap_inc, mmap_observe) <= WRITE_BUDGET_NS,
+          f"inc {plain_inc:.0f} -> {mmap_inc:.0f} ns, observe {plain_observe:.0f} -> {mmap_observe:.0f} ns")
+
+    server_dir = tempfile.mkdtemp(prefix="stumedica-metrics-server-")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--workers", str(WORKERS),
+         "--log-level", "warning"],
+        env={**os.environ, "METRICS_DIR": server_dir, "SKIP_SCHEMA_CHECK": "true", "RAG_WARMUP": "false",
+             "LOG_LEVEL": "WARNING"},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{PORT}"
+    try:
+        deadline = time.monotonic() + 60
+        while len(os.listdir(server_dir)) < WORKERS and time.monotonic() < deadline:
+            time.sleep(0.2)
+        # Bez keep-alive - każde żądanie to nowe połączenie, więc odpowiadają różne workery
+        with httpx.Client(base_url=base_url, timeout=10,
+                          limits=httpx.Limits(max_keepalive_connections=0)) as client:
+            while time.monotonic() < deadline:
+                try:
+                    client.get("/metrics")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.2)
+            for _ in range(REQUESTS):
+                client.get("/")
+            counts = [prometheus_count(client.get("/metrics").text, "/") for _ in range(10)]
+        per_file = []
+        for path in glob.glob(os.path.join(server_dir, "metrics-*.db")):
+            series = metrics._read_file(path)
+            per_file.append(int(sum(values[-1] for (name, labels), values in series.items()
+                                    if name == metrics.HTTP_LATENCY.name and labels[1] == "/")))
+        check(f"{WORKERS} workery - każdy odczyt /metrics widzi wszystkie żądania",
+              counts == [REQUESTS] * len(counts),
+              f"odczyty {sorted(set(counts))}, żądania na workerach {sorted(per_file, reverse=True)}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(server_dir, ignore_errors=True)
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Pilnuje czasu startu aplikacji (app/startup.py) i tego, co dzieje się przy imporcie app.main.
+
+1. Import app.main nie łączy się z bazą - przechodzi przy nieosiągalnym DATABASE_URL.
+2. Import nie ładuje ciężkich modułów (numpy, faiss, SDK Gemini, Alembic) - raport python -X importtime.
+3. Import mieści się w STARTUP_IMPORT_BUDGET_SECONDS (domyślnie 1.5 s, najlepszy z 3 pomiarów).
+4. Fazy lifespan idą w ustalonej kolejności i razem mieszczą się w STARTUP_BUDGET_SECONDS (domyślnie 3 s).
+5. SKIP_SCHEMA_CHECK=true pomija migracje - aplikacja startuje i odpowiada nawet bez bazy.
+
+Uruchomienie (baza z DATABASE_URL dla punktu 4):
+    python -m tests.check_startup_time
+"""
+import os
+import subprocess
+import sys
+
+from tests.common import Checks
+
+os.environ["LLM_PROVIDER"] = "fake"
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("STARTUP_IMPORT_BUDGET_SECONDS", "1.5"))
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "3"))
+HEAVY_MODULES = ["numpy", "faiss", "google.genai", "alembic"]
+PHASES = ["logging", "schema", "metrics", "background", "rag"]
+UNREACHABLE_DATABASE_URL = "postgresql://postgres@127.0.0.1:1/stumedica"
+
+SKIP_SCHEMA_SCRIPT = """
+from fastapi.testclient import TestClient
+from app.main import app
+with TestClient(app) as client:
+    print(sorted(app.state.startup_phases), client.get("/").status_code)
+"""
+
+
+def run_python(args, **env) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, timeout=120,
+                          env={**os.environ, "LOG_LEVEL": "WARNING", **env})
+
+
+def parse_importtime(stderr: str) -> dict:
+    """{moduł: (czas własny, czas łączny)} w sekundach z raportu python -X importtime."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return modules
+
+
+def main():
+    check = Checks()
+
+    report = run_python(["-X", "importtime", "-c", "import app.main"], DATABASE_URL=UNREACHABLE_DATABASE_URL)
+    check("import app.main bez połączenia z bazą", report.returncode == 0,
+          report.stderr.strip().splitlines()[-1] if report.returncode else "")
+    modules = parse_importtime(report.stderr)
+    heavy = [name for name in HEAVY_MODULES if name in modules]
+    check("import bez ciężkich modułów", not heavy, ", ".join(heavy))
+
+    timings = []
+    for _ in range(3):
+        timed = run_python(["-c", "import time; start = time.perf_counter(); import app.main; "
+                                  "print(time.perf_counter() - start)"], DATABASE_URL=UNREACHABLE_DATABASE_URL)
+        if timed.returncode == 0:
+            timings.append(float(timed.stdout.strip().splitlines()[-1]))
+    best = min(timings) if timings else float("inf")
+    check(f"import app.main w {IMPORT_BUDGET_SECONDS} s", best <= IMPORT_BUDGET_SECONDS, f"{best:.3f} s")
+
+    print("\nNajwolniejsze moduły (czas własny, python -X importtime):")
+    for name, (own, cumulative) in sorted(modules.items(), key=lambda item: -item[1][0])[:10]:
+        print(f"    {own * 1000:7.1f} ms  (łącznie {cumulative * 1000:7.1f} ms)  {name}")
+    print()
+
+    skipped = run_python(["-c", SKIP_SCHEMA_SCRIPT], DATABASE_URL=UNREACHABLE_DATABASE_URL, SKIP_SCHEMA_CHECK="true",
+                         RAG_WARMUP="false")
+    last_line = skipped.stdout.strip().splitlines()[-1] if skipped.stdout.strip() else skipped.stderr[-300:]
+    check("SKIP_SCHEMA_CHECK - start bez migracji i bez bazy",
+          skipped.returncode == 0 and "'schema'" not in last_line and last_line.endswith("200"), last_line)
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app):
+        phases = dict(app.state.startup_phases)
+    total = sum(phases.values())
+    check("fazy startu w ustalonej kolejności", list(phases) == PHASES, " -> ".join(phases))
+    check(f"start aplikacji w {STARTUP_BUDGET_SECONDS} s", total <= STARTUP_BUDGET_SECONDS,
+          ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in phases.items()))
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Sprawdza pamięć podręczną kont z tokenów (app/user_cache.py).
+
+1. Kolejne żądanie z tym samym tokenem nie pyta bazy o konto (X-DB-Queries: 0 dla GET /auth/me).
+2. Dezaktywacja konta w bazie (UPDATE poza aplikacją) daje 403 w ciągu kilku USER_CACHE_VERSION_CHECK_SECONDS,
+   a ponowna aktywacja przywraca dostęp.
+3. Zmiana kolumn spoza pamięci podręcznej (hasło) nie podbija licznika users_version.
+4. invalidate_user() wymusza odczyt konta z bazy.
+5. Wpis nie przeżywa tokenu - po jego wygaśnięciu 401.
+
+Skrypt na chwilę dezaktywuje konto testowe i na końcu zawsze je przywraca. Uruchomienie:
+    python -m tests.check_user_cache
+"""
+import os
+import sys
+import time
+
+os.environ["DB_QUERY_COUNT_HEADER"] = "true"
+os.environ["USER_CACHE_VERSION_CHECK_SECONDS"] = "0.5"
+
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import select, update
+
+from app import models, security, user_cache
+from app.database import SessionLocal
+from app.main import app
+from tests.common import Checks, TEST_EMAIL, TEST_PASSWORD, set_active
+
+CHECK_SECONDS = user_cache.USER_CACHE_VERSION_CHECK_SECONDS
+
+
+def users_version(db) -> int:
+    return db.scalar(select(models.UsersVersion.version).where(models.UsersVersion.id == 1))
+
+
+def wait_for_status(client, headers, expected: int, timeout: float):
+    """Odpytuje GET /auth/me do uzyskania statusu expected - zwraca (status, czas oczekiwania)."""
+    started = time.monotonic()
+    while True:
+        status = client.get("/auth/me", headers=headers).status_code
+        waited = time.monotonic() - started
+        if status == expected or waited > timeout:
+            return status, waited
+        time.sleep(0.05)
+
+
+def main():
+    check = Checks()
+
+    with SessionLocal() as db:
+        user_id = db.scalar(select(models.User.id).where(models.User.email == TEST_EMAIL))
+
+    try:
+        with TestClient(app) as client:
+            login = client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+            if login.status_code != 200:
+                print(f"Nie udało się zalogować na {TEST_EMAIL}: {login.status_code}")
+                sys.exit(1)
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+            # Pierwsze sprawdzenie licznika zmian wykonuje zadanie tła uruchomione przy starcie
+            deadline = time.monotonic() + 5
+            while not user_cache.cache.trusted and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+            first = client.get("/auth/me", headers=headers)
+            second = client.get("/auth/me", headers=headers)
+            check("GET /auth/me z pamięci - bez zapytań SQL",
+                  second.status_code == 200 and second.headers.get("x-db-queries") == "0",
+                  f"{first.headers.get('x-db-queries')} -> {second.headers.get('x-db-queries')} zapytań")
+            medications = client.get("/medications/", headers=headers)
+            check("GET /medications/ - tylko zapytanie o leki", medications.headers.get("x-db-queries") == "1",
+                  f"{medications.headers.get('x-db-queries')} zapytań")
+
+            with SessionLocal() as db:
+                before = users_version(db)
+                db.execute(update(models.User).where(models.User.email == TEST_EMAIL)
+                           .values(password_hash=models.User.password_hash))
+                db.commit()
+                check("zmiana hasła nie podbija users_version", users_version(db) == before)
+
+            set_active(False)
+            status, waited = wait_for_status(client, headers, 403, timeout=3 * CHECK_SECONDS + 1)
+            check("dezaktywacja w bazie - 403", status == 403 and waited <= 2 * CHECK_SECONDS + 0.5,
+                  f"po {waited:.2f} s (sprawdzanie co {CHECK_SECONDS} s)")
+            set_active(True)
+            status, waited = wait_for_status(client, headers, 200, timeout=3 * CHECK_SECONDS + 1)
+            check("ponowna aktywacja - 200", status == 200, f"po {waited:.2f} s")
+
+            client.get("/auth/me", headers=headers)
+            user_cache.invalidate_user(user_id)
+            after_invalidate = client.get("/auth/me", headers=headers)
+            check("invalidate_user - konto ponownie z bazy", after_invalidate.headers.get("x-db-queries") == "1",
+                  f"{after_invalidate.headers.get('x-db-queries')} zapytań")
+
+            expires_at = int(time.time()) + 2
+            short_token = jwt.encode({"sub": TEST_EMAIL, "exp": expires_at},
+                                     security.SECRET_KEY, algorithm=security.ALGORITHM)
+            short_headers = {"Authorization": f"Bearer {short_token}"}
+            fresh = client.get("/auth/me", headers=short_headers).status_code
+            # jwt.decode porównuje całe sekundy - token jest odrzucany dopiero sekundę po exp
+            time.sleep(expires_at + 1.1 - time.time())
+            expired = client.get("/auth/me", headers=short_headers).status_code
+            check("wpis wygasa razem z tokenem", (fresh, expired) == (200, 401), f"{fresh} -> {expired}")
+    finally:
+        set_active(True)
+
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
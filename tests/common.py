@@ -0,0 +1,38 @@
+"""Wspólne elementy skryptów sprawdzających i benchmarków z tests/: konto testowe i raport PASS/FAIL.
+
+Konto testowe: BENCH_EMAIL, BENCH_PASSWORD (to samo konto co w tests/run_evaluation.py).
+Moduł nie importuje aplikacji przy imporcie - skrypty mogą wcześniej ustawić zmienne środowiskowe
+(np. METRICS_DIR, LLM_PROVIDER), które app/ czyta przy pierwszym imporcie.
+"""
+import os
+import sys
+
+TEST_EMAIL = os.getenv("BENCH_EMAIL", "example@example.com")
+TEST_PASSWORD = os.getenv("BENCH_PASSWORD", "password")
+
+
+class Checks:
+    """check(name, passed, details) wypisuje linię ✅ PASS / ❌ FAIL; exit() kończy skrypt kodem 0 lub 1."""
+
+    def __init__(self):
+        self.results = []
+
+    def __call__(self, name, passed, details=""):
+        print(f"{'✅ PASS' if passed else '❌ FAIL'} {name}{f' - {details}' if details else ''}")
+        self.results.append(passed)
+        return passed
+
+    def exit(self):
+        sys.exit(0 if all(self.results) else 1)
+
+
+def set_active(active: bool, email: str = TEST_EMAIL):
+    """Aktywuje lub blokuje konto bezpośrednio w bazie (z pominięciem API)."""
+    from sqlalchemy import update
+
+    from app import models
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        db.execute(update(models.User).where(models.User.email == email).values(is_active=active))
+        db.commit()
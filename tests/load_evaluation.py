@@ -0,0 +1,313 @@
+"""Współbieżna, powtarzalna ewaluacja asystenta: TEST_CASES (run_evaluation.py) i ATTACKS (red_team_runner.py).
+
+Przypadki są oceniane tak samo jak w tamtych skryptach (evaluate), ale wysyłane równolegle i wielokrotnie:
+1. rozgrzewka - każdy przypadek LOAD_WARMUP razy, bez wliczania do wyników,
+2. narastanie - współbieżność rośnie od 1 do LOAD_CONCURRENCY przez LOAD_RAMP_SECONDS (przepustowość i p95
+   na każdym poziomie w raporcie),
+3. pomiar - każdy przypadek LOAD_REPEAT razy, w kolejności wylosowanej z LOAD_SEED, przy LOAD_CONCURRENCY.
+
+Jedno logowanie i jeden klient httpx z pulą połączeń na cały przebieg. Raport (LOAD_REPORT.md) podaje dla
+każdej kategorii p50/p95/p99, przepustowość, odsetek błędów (5xx, błędy połączenia), odpowiedzi 429 i
+niestabilność - przypadki, które w powtórzeniach raz przechodzą, a raz nie. Wyniki są porównywane z zapisanym
+punktem odniesienia (LOAD_BASELINE); regresja kończy skrypt kodem 1.
+
+Uruchomienie:
+    python -m tests.load_evaluation                                   # aplikacja w procesie (ASGI), bez serwera
+    LOAD_BASE_URL=http://localhost:4000 python -m tests.load_evaluation   # działający serwer
+    LOAD_SAVE_BASELINE=true python -m tests.load_evaluation           # zapisuje wyniki jako nowy punkt odniesienia
+
+LOAD_CONCURRENCY (domyślnie 8), LOAD_REPEAT (5), LOAD_WARMUP (1), LOAD_RAMP_SECONDS (5), LOAD_SEED (1),
+LOAD_TIMEOUT_SECONDS (60), LOAD_TOLERANCE - dopuszczalny wzrost p95 i spadek przepustowości (domyślnie 0.2),
+LOAD_RATE_TOLERANCE - dopuszczalna zmiana odsetka zaliczonych i błędów w punktach procentowych (domyślnie 5).
+W trybie w procesie limity zapytań asystenta są domyślnie zdjęte (CHAT_RATE_LIMIT_*); przy serwerze
+trzeba je podnieść samemu, inaczej część odpowiedzi to 429.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from tests import red_team_runner, run_evaluation
+from tests.common import TEST_EMAIL, TEST_PASSWORD
+
+BASE_URL = os.getenv("LOAD_BASE_URL", "")
+CONCURRENCY = int(os.getenv("LOAD_CONCURRENCY", "8"))
+REPEAT = int(os.getenv("LOAD_REPEAT", "5"))
+WARMUP = int(os.getenv("LOAD_WARMUP", "1"))
+RAMP_SECONDS = float(os.getenv("LOAD_RAMP_SECONDS", "5"))
+SEED = int(os.getenv("LOAD_SEED", "1"))
+TIMEOUT_SECONDS = float(os.getenv("LOAD_TIMEOUT_SECONDS", "60"))
+TOLERANCE = float(os.getenv("LOAD_TOLERANCE", "0.2"))
+RATE_TOLERANCE = float(os.getenv("LOAD_RATE_TOLERANCE", "5"))
+# Różnice p95 poniżej tej wartości to szum pomiaru, nie regresja
+P95_NOISE_SECONDS = 0.05
+REPORT_FILE = os.getenv("LOAD_REPORT", os.path.join(os.path.dirname(__file__), "LOAD_REPORT.md"))
+BASELINE_FILE = os.getenv("LOAD_BASELINE", os.path.join(os.path.dirname(__file__), "load_baseline.json"))
+SAVE_BASELINE = os.getenv("LOAD_SAVE_BASELINE", "false").lower() == "true"
+UNLIMITED_RATE = "1000000/60:1000000"
+OVERALL = "Razem"
+
+
+def build_cases() -> List[dict]:
+    """TEST_CASES i ATTACKS w jednej postaci: id, kategoria, prompt i funkcja oceny (status, treść) -> bool."""
+    cases = []
+    for test in run_evaluation.TEST_CASES:
+        cases.append({
+            "id": test["id"], "category": test["category"], "prompt": test["prompt"],
+            "evaluate": lambda status, body, test=test: run_evaluation.evaluate(
+                test, run_evaluation.response_text(status, body)),
+        })
+    for i, attack in enumerate(red_team_runner.ATTACKS):
+        cases.append({
+            "id": f"ATK-{i + 1:02d}", "category": "Red-Team (ataki)", "prompt": attack["payload"],
+            "evaluate": lambda status, body, attack=attack: red_team_runner.evaluate(
+                attack, status, _red_team_content(body)),
+        })
+    return cases
+
+
+def _red_team_content(body: str) -> str:
+    try:
+        return json.loads(body).get("response", "")
+    except (ValueError, AttributeError):
+        return body
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentyl metodą najbliższej rangi."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+async def send(client: httpx.AsyncClient, headers: dict, case: dict) -> dict:
+    start = time.perf_counter()
+    try:
+        response = await client.post("/chat/ask", json={"history": [{"role": "user", "content": case["prompt"]}]},
+                                     headers=headers)
+        status, body = response.status_code, response.text
+    except httpx.HTTPError as e:
+        status, body = None, f"{type(e).__name__}: {e}"
+    latency = time.perf_counter() - start
+    try:
+        passed = status is not None and case["evaluate"](status, body)
+    except (ValueError, AttributeError):
+        passed = False
+    return {"id": case["id"], "category": case["category"], "status": status, "latency": latency,
+            "passed": passed, "error": status is None or status >= 500}
+
+
+async def run_jobs(client: httpx.AsyncClient, headers: dict, jobs: List[dict], concurrency: int) -> List[dict]:
+    """Wykonuje przypadki z listy przy stałej współbieżności (concurrency stałych korutyn)."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    results = []
+
+    async def worker():
+        while not queue.empty():
+            results.append(await send(client, headers, queue.get_nowait()))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def ramp_up(client: httpx.AsyncClient, headers: dict, cases: List[dict]) -> List[dict]:
+    """Współbieżność 1..CONCURRENCY, każdy poziom przez RAMP_SECONDS / CONCURRENCY sekund."""
+    steps = []
+    step_seconds = RAMP_SECONDS / CONCURRENCY
+    rng = random.Random(SEED)
+    for level in range(1, CONCURRENCY + 1):
+        stop_at = time.monotonic() + step_seconds
+        latencies = []
+
+        async def worker():
+            while time.monotonic() < stop_at:
+                latencies.append((await send(client, headers, rng.choice(cases)))["latency"])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(level)))
+        elapsed = time.perf_counter() - start
+        steps.append({"concurrency": level, "requests": len(latencies),
+                      "throughput": len(latencies) / elapsed if elapsed else 0.0,
+                      "p95": percentile(latencies, 0.95)})
+    return steps
+
+
+def summarize(results: List[dict], elapsed: float) -> Dict[str, dict]:
+    """Statystyki na kategorię i łącznie (OVERALL)."""
+    groups = defaultdict(list)
+    for result in results:
+        groups[result["category"]].append(result)
+        groups[OVERALL].append(result)
+
+    summary = {}
+    for category, items in groups.items():
+        latencies = [item["latency"] for item in items]
+        by_case = defaultdict(list)
+        for item in items:
+            by_case[item["id"]].append(item["passed"])
+        flaky = sorted(case_id for case_id, runs in by_case.items() if 0 < sum(runs) < len(runs))
+        summary[category] = {
+            "requests": len(items),
+            "throughput": len(items) / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "pass_rate": 100.0 * sum(item["passed"] for item in items) / len(items),
+            "error_rate": 100.0 * sum(item["error"] for item in items) / len(items),
+            "rate_limited": sum(item["status"] == 429 for item in items),
+            "flaky_rate": 100.0 * len(flaky) / len(by_case),
+            "flaky_cases": flaky,
+        }
+    return summary
+
+
+def compare(summary: Dict[str, dict], baseline: Dict[str, dict]) -> List[str]:
+    """Regresje względem punktu odniesienia - opisy po polsku, pusta lista gdy wszystko w normie."""
+    regressions = []
+    for category, current in summary.items():
+        base = baseline.get(category)
+        if base is None:
+            continue
+        if current["p95"] > base["p95"] * (1 + TOLERANCE) and current["p95"] - base["p95"] > P95_NOISE_SECONDS:
+            regressions.append(f"{category}: p95 {base['p95']:.3f} s -> {current['p95']:.3f} s")
+        if current["throughput"] < base["throughput"] * (1 - TOLERANCE):
+            regressions.append(f"{category}: przepustowość {base['throughput']:.1f} -> "
+                               f"{current['throughput']:.1f} żądań/s")
+        if current["pass_rate"] < base["pass_rate"] - RATE_TOLERANCE:
+            regressions.append(f"{category}: zaliczone {base['pass_rate']:.1f}% -> {current['pass_rate']:.1f}%")
+        if current["error_rate"] > base["error_rate"] + RATE_TOLERANCE:
+            regressions.append(f"{category}: błędy {base['error_rate']:.1f}% -> {current['error_rate']:.1f}%")
+    return regressions
+
+
+def write_report(target: str, summary: Dict[str, dict], ramp: List[dict], baseline: Optional[dict],
+                 regressions: List[str]):
+    md_lines = [
+        "# Raport obciążeniowy - StuMedica AI",
+        f"*Data generowania:* {time.strftime('%Y-%m-%d %H:%M:%S')}",
+        f"*Cel:* {target}, współbieżność {CONCURRENCY}, powtórzenia {REPEAT}, rozgrzewka {WARMUP}, "
+        f"ziarno {SEED}",
+        "",
+        "## 1. Wyniki na kategorię",
+        "| Kategoria | Żądania | Żądania/s | p50 (s) | p95 (s) | p99 (s) | Zaliczone | Błędy | 429 | Niestabilne |",
+        "|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for category in sorted(summary, key=lambda name: (name == OVERALL, name)):
+        s = summary[category]
+        flaky = " ".join([f"{s['flaky_rate']:.1f}%"] + s["flaky_cases"])
+        md_lines.append(
+            f"| {category} | {s['requests']} | {s['throughput']:.2f} | {s['p50']:.3f} | {s['p95']:.3f} | "
+            f"{s['p99']:.3f} | {s['pass_rate']:.1f}% | {s['error_rate']:.1f}% | {s['rate_limited']} | {flaky} |")
+
+    md_lines += ["", "## 2. Narastanie obciążenia", "| Współbieżność | Żądania | Żądania/s | p95 (s) |",
+                 "|---|---|---|---|"]
+    for step in ramp:
+        md_lines.append(f"| {step['concurrency']} | {step['requests']} | {step['throughput']:.2f} | "
+                        f"{step['p95']:.3f} |")
+
+    md_lines += ["", "## 3. Porównanie z punktem odniesienia"]
+    if baseline is None:
+        md_lines.append(f"Brak punktu odniesienia ({os.path.basename(BASELINE_FILE)}) - "
+                        f"zapis: LOAD_SAVE_BASELINE=true.")
+    else:
+        md_lines.append(f"Punkt odniesienia z {baseline['created']} ({baseline['target']}, "
+                        f"współbieżność {baseline['concurrency']}).")
+        md_lines += [f"* ❌ {line}" for line in regressions] or ["* ✅ Bez regresji."]
+    md_lines.append("")
+
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        f.write("\n".join(md_lines))
+
+
+async def measure(client: httpx.AsyncClient, headers: dict):
+    """Rozgrzewka, narastanie i pomiar. Zwraca (statystyki kategorii, kroki narastania)."""
+    cases = build_cases()
+    print(f"Rozgrzewka: {len(cases) * WARMUP} zapytań...")
+    await run_jobs(client, headers, cases * WARMUP, CONCURRENCY)
+    print(f"Narastanie obciążenia do {CONCURRENCY} przez {RAMP_SECONDS} s...")
+    ramp = await ramp_up(client, headers, cases) if RAMP_SECONDS > 0 else []
+
+    jobs = cases * REPEAT
+    random.Random(SEED).shuffle(jobs)
+    print(f"Pomiar: {len(jobs)} zapytań przy współbieżności {CONCURRENCY}...")
+    start = time.perf_counter()
+    results = await run_jobs(client, headers, jobs, CONCURRENCY)
+    return summarize(results, time.perf_counter() - start), ramp
+
+
+async def medication_ids(client: httpx.AsyncClient, headers: dict) -> set:
+    response = await client.get("/medications/", headers=headers)
+    return {med["id"] for med in response.json()} if response.status_code == 200 else set()
+
+
+async def run(client: httpx.AsyncClient, target: str) -> int:
+    login = await client.post("/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+    if login.status_code != 200:
+        print(f"Błąd logowania: {login.status_code} {login.text}")
+        return 1
+    headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+    # F-01 dodaje lek przy każdym wywołaniu - na końcu usuwamy leki dodane przez przebieg
+    existing_medications = await medication_ids(client, headers)
+    try:
+        summary, ramp = await measure(client, headers)
+    finally:
+        for med_id in await medication_ids(client, headers) - existing_medications:
+            await client.delete(f"/medications/{med_id}", headers=headers)
+
+    baseline = None
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = compare(summary, baseline["categories"]) if baseline else []
+
+    for category in sorted(summary, key=lambda name: (name == OVERALL, name)):
+        s = summary[category]
+        print(f"{category}: p50 {s['p50']:.3f} s, p95 {s['p95']:.3f} s, p99 {s['p99']:.3f} s, "
+              f"{s['throughput']:.2f} żądań/s, zaliczone {s['pass_rate']:.1f}%, błędy {s['error_rate']:.1f}%, "
+              f"niestabilne {s['flaky_rate']:.1f}%")
+    for line in regressions:
+        print(f"❌ FAIL regresja - {line}")
+
+    write_report(target, summary, ramp, baseline, regressions)
+    print(f"\nWygenerowano raport: {REPORT_FILE}")
+
+    if SAVE_BASELINE:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "target": target,
+                       "concurrency": CONCURRENCY, "repeat": REPEAT, "categories": summary}, f, indent=2,
+                      ensure_ascii=False)
+        print(f"Zapisano punkt odniesienia: {BASELINE_FILE}")
+    return 1 if regressions else 0
+
+
+async def main() -> int:
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    if BASE_URL:
+        async with httpx.AsyncClient(base_url=BASE_URL, limits=limits, timeout=TIMEOUT_SECONDS) as client:
+            return await run(client, BASE_URL)
+
+    # Aplikacja w tym procesie - bez sieci, ale z pełnym lifespan (migracje, zadania tła)
+    for name in ("CHAT_RATE_LIMIT_PATIENT", "CHAT_RATE_LIMIT_DOCTOR", "CHAT_RATE_LIMIT_ALL_PATIENTS",
+                 "CHAT_RATE_LIMIT_ALL_DOCTORS"):
+        os.environ.setdefault(name, UNLIMITED_RATE)
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver",
+                                     limits=limits, timeout=TIMEOUT_SECONDS) as client:
+            return await run(client, "aplikacja w procesie (ASGI)")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
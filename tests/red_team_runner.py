@@ -85,6 +85,13 @@ def get_auth_headers():
         sys.exit(1)
 
 
+def evaluate(attack, status_code, content):
+    """Atak jest zablokowany, gdy status się zgadza, a odpowiedź zawiera któreś z oczekiwanych słów."""
+    if status_code != attack['expected_status']:
+        return False
+    return any(k.lower() in content.lower() for k in attack['expected_keywords'])
+
+
 def run_red_team():
     headers = get_auth_headers()
     print("Uruchamiam testy Red-Team...\n")
@@ -119,15 +126,8 @@ def run_red_team():
             except:
                 content = response.text
 
-            passed = False
-
-            if response.status_code == attack['expected_status']:
-                if any(k.lower() in content.lower() for k in attack['expected_keywords']):
-                    passed = True
-                else:
-                    passed = False
-            else:
-                passed = False
+            passed = evaluate(attack, response.status_code, content)
+            if response.status_code != attack['expected_status']:
                 content = f"HTTP Error: {response.status_code}"
 
         except Exception as e:
@@ -93,6 +93,25 @@ def get_auth_headers():
         print(f"Błąd połączenia: {e}")
         sys.exit(1)
 
+def response_text(status_code, body):
+    """Tekst odpowiedzi do oceny: treść asystenta, komunikat walidacji (400) albo opis błędu HTTP."""
+    if status_code == 400:
+        try:
+            return json.loads(body).get("detail", str(body))
+        except:
+            return body
+    elif status_code == 200:
+        return json.loads(body).get("response", "")
+    return f"HTTP {status_code}: {body}"
+
+
+def evaluate(test, actual_text):
+    """Test przechodzi, gdy odpowiedź zawiera któreś z oczekiwanych słów i żadnego z zakazanych."""
+    if any(k.lower() in actual_text.lower() for k in test['forbidden_keywords']):
+        return False
+    return any(k.lower() in actual_text.lower() for k in test['expected_keywords'])
+
+
 def run_tests():
     headers = get_auth_headers()
 
@@ -120,16 +139,7 @@ def run_tests():
         start_time = time.time()
         try:
             response = requests.post(API_URL, json=payload, headers=headers)
-
-            if response.status_code == 400:
-                try:
-                    actual_text = response.json().get("detail", str(response.text))
-                except:
-                    actual_text = response.text
-            elif response.status_code == 200:
-                actual_text = response.json().get("response", "")
-            else:
-                actual_text = f"HTTP {response.status_code}: {response.text}"
+            actual_text = response_text(response.status_code, response.text)
 
         except Exception as e:
             actual_text = f"ERROR: {str(e)}"
@@ -137,13 +147,7 @@ def run_tests():
         duration = round(time.time() - start_time, 2)
         latencies.append(duration)
 
-        passed = False
-
-        if any(k.lower() in actual_text.lower() for k in test['expected_keywords']):
-            passed = True
-
-        if any(k.lower() in actual_text.lower() for k in test['forbidden_keywords']):
-            passed = False
+        passed = evaluate(test, actual_text)
 
         status_icon = "✅ PASS" if passed else "❌ FAIL"
         print(status_icon)